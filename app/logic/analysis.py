@@ -0,0 +1,255 @@
+import csv
+import json
+import numpy as np
+
+# Constants
+DIRECTIONS = ["x", "y", "z"]  # Variogram directions, array axes -1, -2, -3
+LAG_MAX = 256  # Largest variogram lag in cells
+BLOCK_CELLS = 1 << 20  # Cells read per block when streaming over a realisation
+RANGE_FRACTION = 0.95  # Share of the sill that defines the practical range
+
+
+class AnalysisCancelled(Exception):
+    pass
+
+
+def _report(progress, fraction):
+    # The callback raises AnalysisCancelled to abort an analysis
+    if progress is not None:
+        progress(fraction)
+
+
+def _lag_blocks(shape, axis):
+    """Yield index tuples covering an array in blocks of whole lines along axis
+
+    Blocks split the outermost other axis, so a (possibly memory-mapped)
+    realisation is never read in full.
+    """
+    split = 1 if axis == 0 else 0
+    line = int(np.prod(shape)) // shape[split]
+    step = max(1, BLOCK_CELLS // max(1, line))
+    for start in range(0, shape[split], step):
+        block = [slice(None)] * len(shape)
+        block[split] = slice(start, min(start + step, shape[split]))
+        yield tuple(block)
+
+
+def indicator_variograms(p_field, num_phases, max_lag=LAG_MAX, progress=None):
+    """Per-phase indicator variograms along x, y (and z for volumes)
+
+    For an indicator I the squared increment is I(u) + I(u+h) - 2 I(u) I(u+h),
+    so each directional variogram needs only the lagged products, which an
+    FFT autocorrelation along the axis gives for every lag at once, and the
+    head and tail sums, which come from a cumulative sum. Blocks of whole
+    lines are accumulated, so the cost is O(N log n) and memory stays bounded.
+
+    Returns (lags, variograms) with variograms of shape (phases, directions, lags).
+    """
+    shape = p_field.shape
+    directions = min(p_field.ndim, len(DIRECTIONS))
+    # Lags beyond half an axis rest on too few pairs to be meaningful
+    lag_count = min(max_lag, max(shape[-1 - d] for d in range(directions)) // 2) + 1
+    variograms = np.full((num_phases, directions, lag_count), np.nan)
+    lags = np.arange(lag_count)
+
+    for d in range(directions):
+        axis = p_field.ndim - 1 - d
+        n = shape[axis]
+        count = min(lag_count, n // 2 + 1)
+        size = 1 << int(np.ceil(np.log2(n + count)))  # Padding avoids wrap-around
+        products = np.zeros((num_phases, count))
+        profiles = np.zeros((num_phases, n))
+        lines = 0
+        for block in _lag_blocks(shape, axis):
+            values = np.asarray(p_field[block])
+            lines += values.size // n
+            other = tuple(a for a in range(values.ndim) if a != axis)
+            for phase in range(num_phases):
+                indicator = (values == phase).astype(float)
+                profiles[phase] += indicator.sum(axis=other)
+                spectrum = np.fft.rfft(indicator, n=size, axis=axis)
+                autocorrelation = np.fft.irfft(spectrum * spectrum.conj(), n=size, axis=axis)
+                lagged = np.take(autocorrelation, np.arange(count), axis=axis)
+                # Products of indicators are counts; rounding drops FFT noise
+                products[phase] += np.rint(lagged.sum(axis=other))
+            _report(progress, (d + lines * n / p_field.size) / directions)
+
+        # Sums of I over the pair heads u < n - h and tails u >= h
+        cumulative = np.cumsum(profiles, axis=1)
+        total = cumulative[:, -1:]
+        heads = cumulative[:, n - 1 - lags[:count]]
+        before = np.concatenate([np.zeros((num_phases, 1)), cumulative[:, : count - 1]], axis=1)
+        tails = total - before
+        pairs = (n - lags[:count]) * lines
+        variograms[:, d, :count] = (heads + tails - 2 * products) / (2 * pairs)
+    return lags, variograms
+
+
+def practical_ranges(variograms, proportions):
+    """First lag at which each variogram reaches RANGE_FRACTION of its sill p(1 - p)
+
+    NaN where the sill is zero or is not reached within the computed lags.
+    """
+    sills = (proportions * (1 - proportions))[:, None, None]
+    reached = (variograms >= RANGE_FRACTION * sills) & (sills > 0)
+    ranges = reached.argmax(axis=2).astype(float)
+    ranges[~reached.any(axis=2)] = np.nan
+    return ranges
+
+
+def connectivity(p_field, num_phases, progress=None):
+    """Connected components (face neighbours) of every phase
+
+    Returns, per phase, the component count, the largest component as a
+    share of the phase, the log2 size histogram (components of 2**k to
+    2**(k+1) - 1 cells) and whether some component spans the domain along
+    each direction.
+    """
+    from scipy import ndimage
+
+    directions = min(p_field.ndim, len(DIRECTIONS))
+    result = {
+        "count": np.zeros(num_phases, dtype=int),
+        "largest_fraction": np.zeros(num_phases),
+        "size_histogram": [],
+        "percolates": np.zeros((num_phases, directions), dtype=bool),
+    }
+    p_field = np.asarray(p_field)
+    for phase in range(num_phases):
+        labels, count = ndimage.label(p_field == phase)
+        sizes = np.bincount(labels.ravel())[1:]
+        result["count"][phase] = count
+        if count:
+            result["largest_fraction"][phase] = sizes.max() / sizes.sum()
+            result["size_histogram"].append(np.bincount(np.log2(sizes).astype(int)))
+        else:
+            result["size_histogram"].append(np.zeros(0, dtype=int))
+        for d in range(directions):
+            axis = p_field.ndim - 1 - d
+            first = np.unique(np.take(labels, 0, axis=axis))
+            last = np.unique(np.take(labels, -1, axis=axis))
+            spanning = np.intersect1d(first, last)
+            result["percolates"][phase, d] = bool((spanning > 0).any())
+        _report(progress, (phase + 1) / num_phases)
+    return result
+
+
+def analyse_realisation(p_field, num_phases, max_lag=LAG_MAX, progress=None):
+    """Proportions, indicator variograms, practical ranges and connectivity"""
+    counts = np.zeros(num_phases)
+    for block in _lag_blocks(p_field.shape, p_field.ndim - 1):
+        counts += np.bincount(np.ravel(p_field[block]), minlength=num_phases)[:num_phases]
+    proportions = counts / counts.sum()
+
+    def part(start, share):
+        return None if progress is None else lambda f: progress(start + share * f)
+
+    lags, variograms = indicator_variograms(p_field, num_phases, max_lag, part(0.0, 0.7))
+    return {
+        "proportions": proportions,
+        "lags": lags,
+        "variograms": variograms,
+        "ranges": practical_ranges(variograms, proportions),
+        "components": connectivity(p_field, num_phases, part(0.7, 0.3)),
+    }
+
+
+class EnsembleStatistics:
+    """Running statistics of realisation analyses, added one at a time
+
+    Only sums are kept, so an ensemble of any size is summarised in the
+    memory of a single analysis.
+    """
+
+    def __init__(self):
+        self.members = 0
+        self.sums = {}
+        self.squares = {}
+        self.range_counts = None
+        self.percolating = None
+        self.size_histogram = None
+        self.lags = None
+
+    def add(self, analysis):
+        components = analysis["components"]
+        values = {
+            "proportions": analysis["proportions"],
+            "variograms": analysis["variograms"],
+            "ranges": analysis["ranges"],
+            "component_count": components["count"].astype(float),
+            "largest_fraction": components["largest_fraction"],
+        }
+        if self.members == 0:
+            self.lags = analysis["lags"]
+            self.sums = {name: np.zeros_like(value) for name, value in values.items()}
+            self.squares = {name: np.zeros_like(value) for name, value in values.items()}
+            self.range_counts = np.zeros_like(analysis["ranges"])
+            self.percolating = np.zeros(components["percolates"].shape)
+            self.size_histogram = [np.zeros(0) for _ in components["size_histogram"]]
+
+        self.members += 1
+        for name, value in values.items():
+            if name == "ranges":
+                # Ranges not reached in a member are left out of its mean
+                value = np.nan_to_num(value)
+            self.sums[name] += value
+            self.squares[name] += value**2
+        self.range_counts += np.isfinite(analysis["ranges"])
+        self.percolating += components["percolates"]
+        for phase, histogram in enumerate(components["size_histogram"]):
+            pooled = self.size_histogram[phase]
+            if len(histogram) > len(pooled):
+                pooled = np.pad(pooled, (0, len(histogram) - len(pooled)))
+            pooled[: len(histogram)] += histogram
+            self.size_histogram[phase] = pooled
+
+    def summary(self):
+        """Means and standard deviations over the members added so far"""
+        summary = {"members": self.members, "lags": self.lags}
+        for name in self.sums:
+            count = self.range_counts if name == "ranges" else self.members
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = self.sums[name] / count
+                variance = np.maximum(self.squares[name] / count - mean**2, 0.0)
+            summary[name] = mean
+            summary[name + "_std"] = np.sqrt(variance)
+        summary["percolation_probability"] = self.percolating / self.members
+        summary["size_histogram"] = self.size_histogram
+        return summary
+
+
+def write_analysis(summary, base_path):
+    """Write a summary as JSON and its variograms as CSV, returning the paths"""
+
+    def plain(value):
+        if isinstance(value, np.ndarray):
+            return [plain(v) for v in value.tolist()] if value.ndim else plain(value.item())
+        if isinstance(value, list):
+            return [plain(v) for v in value]
+        if isinstance(value, float) and not np.isfinite(value):
+            return None  # JSON has no NaN
+        return value
+
+    document = {"directions": DIRECTIONS[: summary["variograms"].shape[1]]}
+    document.update((name, plain(value)) for name, value in summary.items())
+    json_path = base_path + ".json"
+    with open(json_path, "w") as f:
+        json.dump(document, f, indent=2)
+
+    csv_path = base_path + "_variograms.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["phase", "direction", "lag", "gamma", "gamma_std"])
+        variograms, deviations = summary["variograms"], summary["variograms_std"]
+        for phase, direction, lag in np.ndindex(*variograms.shape):
+            if np.isfinite(variograms[phase, direction, lag]):
+                writer.writerow(
+                    [
+                        phase,
+                        DIRECTIONS[direction],
+                        summary["lags"][lag],
+                        f"{variograms[phase, direction, lag]:.6g}",
+                        f"{deviations[phase, direction, lag]:.6g}",
+                    ]
+                )
+    return [json_path, csv_path]
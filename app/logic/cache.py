@@ -0,0 +1,57 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+# Constants
+REALISATION_CACHE_SIZE = 8  # Realisations kept for instant undo/redo
+
+
+def lithotype_hash(grid):
+    """Content hash of a lithotype grid, independent of its integer dtype"""
+    # Phases fit in a byte, which also makes the hash cheaper
+    grid = np.ascontiguousarray(np.asarray(grid).astype(np.uint8, copy=False))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(grid.shape).encode())
+    digest.update(grid.data)
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Small least-recently-used cache; values must not be mutated by callers"""
+
+    def __init__(self, max_entries=REALISATION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def evict_oldest(self):
+        """Drop the least recently used entry; False when the cache is empty"""
+        if not self.entries:
+            return False
+        self.entries.popitem(last=False)
+        return True
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,276 @@
+import hashlib
+import numpy as np
+
+# Constants
+GIBBS_SWEEPS = 50  # Sweeps over all data points before values are kept
+PRECISION_TOLERANCE = 1e-3  # Partial correlation below which points update together
+NUGGET = 1e-6  # Diagonal jitter keeping the Gaussian covariance factorisable
+KRIGING_BLOCK_CELLS = 1 << 14  # Grid cells per block when applying kriging weights
+
+
+class ConditioningError(ValueError):
+    """Hard data that the current lithotype image cannot honour"""
+
+
+class HardData:
+    """Observed phases at grid cells; immutable, so it can key caches
+
+    indices is (n, dim) integer cell indices in grid order, (row, column) in
+    2D or (z, row, column) in 3D.
+    """
+
+    def __init__(self, indices=(), phases=()):
+        points = {}
+        for index, phase in zip(indices, phases):
+            points[tuple(int(i) for i in index)] = int(phase)
+        self.points = dict(sorted(points.items()))
+        self.key = hashlib.blake2b(repr(self.points).encode(), digest_size=16).hexdigest()
+
+    def __len__(self):
+        return len(self.points)
+
+    def with_point(self, index, phase):
+        """Copy with an observation added, replacing any at the same cell"""
+        points = dict(self.points)
+        points[tuple(index)] = phase
+        return HardData(points.keys(), points.values())
+
+    def without_point(self, index):
+        points = dict(self.points)
+        points.pop(tuple(index), None)
+        return HardData(points.keys(), points.values())
+
+    def within(self, shape):
+        """Copy keeping only observations inside a grid of the given shape"""
+        points = {
+            index: phase
+            for index, phase in self.points.items()
+            if len(index) == len(shape) and all(0 <= i < n for i, n in zip(index, shape))
+        }
+        return HardData(points.keys(), points.values())
+
+    def indices(self):
+        return np.array(list(self.points.keys()), dtype=int).reshape(len(self), -1)
+
+    def phases(self):
+        return np.array(list(self.points.values()), dtype=int)
+
+    def to_list(self):
+        return [list(index) + [phase] for index, phase in self.points.items()]
+
+    @classmethod
+    def from_list(cls, entries):
+        return cls([entry[:-1] for entry in entries], [entry[-1] for entry in entries])
+
+
+class KrigingSystem:
+    """Factorised covariance of the data locations, shared by all realisations
+
+    Holds the Cholesky factor for simple kriging, the precision matrix for
+    the Gibbs sampler and a colouring of the points into groups that can be
+    updated together.
+    """
+
+    def __init__(self, model, coords, indices):
+        from scipy.linalg import cho_factor, cho_solve
+
+        self.model = model
+        self.coords = coords
+        self.indices = indices
+        self.positions = np.array(
+            [axis[indices[:, d]] for d, axis in enumerate(coords)], dtype=float
+        )
+
+        n = len(indices)
+        diff = self.positions[:, :, None] - self.positions[:, None, :]
+        cov = model.cov_spatial(diff.reshape(len(coords), -1)).reshape(n, n)
+        cov[np.diag_indices(n)] += NUGGET
+        self.factor = cho_factor(cov, lower=True)
+        self.precision = cho_solve(self.factor, np.eye(n))
+        self.groups = self._colour()
+
+    def _colour(self):
+        """Greedy colouring: points in one group are conditionally independent"""
+        precision = self.precision
+        scale = np.sqrt(np.outer(np.diag(precision), np.diag(precision)))
+        interacts = np.abs(precision) > PRECISION_TOLERANCE * scale
+        colours = np.full(len(precision), -1)
+        for i in range(len(precision)):
+            taken = set(colours[interacts[i] & (colours >= 0)])
+            colour = 0
+            while colour in taken:
+                colour += 1
+            colours[i] = colour
+        return [np.flatnonzero(colours == c) for c in range(colours.max() + 1)]
+
+    def weights(self, residuals):
+        """Simple kriging weights C^-1 r for data residuals r"""
+        from scipy.linalg import cho_solve
+
+        return cho_solve(self.factor, residuals)
+
+    def _blocks(self):
+        """Yield (leading indices, first row, end row, flat cell slice) per block"""
+        shape = tuple(len(axis) for axis in self.coords)
+        rows, cols = shape[-2:]
+        step = max(1, KRIGING_BLOCK_CELLS // cols)
+        for outer in np.ndindex(*shape[:-2]):
+            base = int(np.ravel_multi_index(outer, shape[:-2])) * rows * cols if outer else 0
+            for top in range(0, rows, step):
+                bottom = min(top + step, rows)
+                yield outer, top, bottom, slice(base + top * cols, base + bottom * cols)
+
+    def separable(self):
+        """Whether the covariance factorises into one term per grid axis"""
+        import gstools as gs
+
+        return isinstance(self.model, gs.Gaussian)
+
+    def corrections(self, weights):
+        """Kriged residual surfaces over the grid, block by block
+
+        weights is (n, k) for k fields sharing this covariance. The Gaussian
+        covariance factorises into one term per grid axis, so each block is
+        a product of small per-axis tables rather than an (n, cells) matrix;
+        other models evaluate the data-to-cell covariance of each block.
+        Yields (flat cell slice, (k, cells) corrections), with the same
+        blocks whatever the model.
+        """
+        if not self.separable():
+            yield from self._direct_corrections(weights)
+            return
+
+        dim = len(self.coords)
+        factors = []
+        for d, axis in enumerate(self.coords):
+            offsets = np.zeros((dim, len(self.indices), len(axis)))
+            offsets[d] = self.positions[d][:, None] - np.asarray(axis, float)[None, :]
+            cov = self.model.cov_spatial(offsets.reshape(dim, -1))
+            factors.append(cov.reshape(len(self.indices), len(axis)))
+        # The product of per-axis covariances carries var**dim
+        weights = weights / self.model.var ** (dim - 1)
+
+        scaled = weights
+        for outer, top, bottom, cells in self._blocks():
+            if top == 0:
+                # Leading (z) axes scale the weights of every data point
+                scaled = weights
+                for d, i in enumerate(outer):
+                    scaled = scaled * factors[d][:, i, None]
+            row_factor = factors[-2][:, top:bottom]
+            block = np.stack([(row_factor * w[:, None]).T @ factors[-1] for w in scaled.T])
+            yield cells, block.reshape(len(block), -1)
+
+    def _direct_corrections(self, weights):
+        """Corrections from the full data-to-cell covariance of each block"""
+        dim = len(self.coords)
+        cols = np.asarray(self.coords[-1], float)
+        for outer, top, bottom, cells in self._blocks():
+            grid = np.meshgrid(
+                *[np.asarray(self.coords[d], float)[[i]] for d, i in enumerate(outer)],
+                np.asarray(self.coords[-2], float)[top:bottom],
+                cols,
+                indexing="ij",
+            )
+            points = np.array([axis.ravel() for axis in grid])
+            diff = self.positions[:, :, None] - points[:, None, :]
+            cov = self.model.cov_spatial(diff.reshape(dim, -1))
+            cov = cov.reshape(len(self.indices), points.shape[1])
+            yield cells, weights.T @ cov
+
+
+def interval_edges(axis):
+    """Field-value intervals of the lithotype cells along one axis
+
+    Mapping uses min(digitize(value, axis), len(axis) - 1), so cell 0 is
+    everything below axis[0] and the last cell everything above axis[-2].
+    """
+    return np.concatenate([[-np.inf], axis[:-1], [np.inf]])
+
+
+def lithotype_index(values, axis):
+    return np.minimum(np.digitize(values, axis), len(axis) - 1)
+
+
+def _sample_intervals(rng, mean, std, edges, admissible):
+    """Draw one truncated normal value per row from admissible intervals
+
+    mean, std are (k,); admissible is (k, cells) booleans over the intervals
+    given by edges. Rows whose admissible mass underflows take the admissible
+    interval nearest the mean.
+    """
+    from scipy.special import ndtr, ndtri
+
+    cdf = ndtr((edges[None, :] - mean[:, None]) / std[:, None])
+    mass = np.where(admissible, np.diff(cdf, axis=1), 0.0)
+    total = mass.sum(axis=1)
+
+    # Pick an interval by its probability mass
+    target = rng.random(len(mean)) * total
+    cell = (np.cumsum(mass, axis=1) < target[:, None]).sum(axis=1)
+    cell = np.minimum(cell, mass.shape[1] - 1)
+
+    degenerate = (total <= 0) | ~admissible[np.arange(len(mean)), cell]
+    if degenerate.any():
+        lower, upper = edges[None, :-1], edges[None, 1:]
+        centre = mean[degenerate, None]
+        distance = np.maximum(np.maximum(lower - centre, centre - upper), 0.0)
+        distance = np.where(admissible[degenerate], distance, np.inf)
+        cell[degenerate] = distance.argmin(axis=1)
+
+    # Inverse-CDF draw inside the interval, clamped against rounding
+    rows = np.arange(len(mean))
+    low, high = cdf[rows, cell], cdf[rows, cell + 1]
+    u = np.clip(low + rng.random(len(mean)) * (high - low), 1e-300, 1 - 1e-16)
+    values = mean + std * ndtri(u)
+    return np.clip(values, edges[cell], np.nextafter(edges[cell + 1], -np.inf))
+
+
+def gibbs_sample(systems, phases, lithotypes, axes, rng, sweeps=GIBBS_SWEEPS):
+    """Gaussian values (2, n) at the data points honouring their phases
+
+    systems holds the KrigingSystem of each field, so each field's values
+    have its own precision matrix Q. A sweep updates every colour group of
+    points in one vectorised step per field: the conditional of a point is
+    normal with mean y - (Qy)/Q_ii and variance 1/Q_ii, truncated to the
+    lithotype cells of its phase in the row or column selected by the other
+    field's value.
+    """
+    present = {phase: lithotypes == phase for phase in np.unique(phases)}
+    for phase, mask in present.items():
+        if not mask.any():
+            raise ConditioningError(f"Phase {phase} does not appear in the lithotype")
+
+    edges = [interval_edges(axis) for axis in axes]
+    precisions = [system.precision for system in systems]
+    diagonals = [np.diag(precision) for precision in precisions]
+    stds = [1.0 / np.sqrt(diagonal) for diagonal in diagonals]
+    n = len(phases)
+
+    # Start from independent draws in each point's admissible region
+    values = np.zeros((2, n))
+    has_row = np.array([present[phase].any(axis=1) for phase in phases])
+    values[0] = _sample_intervals(rng, np.zeros(n), np.ones(n), edges[0], has_row)
+    rows = lithotype_index(values[0], axes[0])
+    values[1] = _sample_intervals(
+        rng, np.zeros(n), np.ones(n), edges[1], lithotypes[rows, :] == phases[:, None]
+    )
+
+    # Q y per field, kept up to date
+    products = np.array([values[field] @ precisions[field] for field in (0, 1)])
+    for _ in range(sweeps):
+        for field in (0, 1):
+            precision, diagonal, std = precisions[field], diagonals[field], stds[field]
+            for group in systems[field].groups:
+                group_phases = phases[group, None]
+                y = values[field, group]
+                mean = y - products[field, group] / diagonal[group]
+                other = lithotype_index(values[1 - field, group], axes[1 - field])
+                if field == 0:
+                    admissible = lithotypes[:, other].T == group_phases
+                else:
+                    admissible = lithotypes[other, :] == group_phases
+                new = _sample_intervals(rng, mean, std[group], edges[field], admissible)
+                products[field] += (new - y) @ precision[group]
+                values[field, group] = new
+    return values
@@ -0,0 +1,164 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+# Constants
+EXPORT_FORMATS = {
+    "png": ".png",  # Indexed-palette image, 3D volumes as stacked slices
+    "npy": ".npy",  # Raw uint8 array in (z, y, x) order
+    "vtk": ".vtk",  # Legacy VTK structured points (image data), binary
+    "gslib": ".gslib",  # GSLIB ASCII, x fastest then y then z
+}
+BLOCK_CELLS = 1 << 20  # Cells converted and written per block while streaming
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_GSLIB_VALUES = [f"{value}\n" for value in range(256)]
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def _row_blocks(array):
+    """Yield (fraction done, uint8 rows) over a 2D or 3D array in C order
+
+    Each block is a run of whole rows, so writers can stream without ever
+    holding a full copy of a large (possibly memory-mapped) array.
+    """
+    rows = array.reshape(-1, array.shape[-1]) if array.ndim == 3 else array
+    total = rows.shape[0]
+    step = max(1, BLOCK_CELLS // max(1, rows.shape[1]))
+    for start in range(0, total, step):
+        stop = min(start + step, total)
+        yield stop / total, np.asarray(rows[start:stop], dtype=np.uint8)
+
+
+def _report(progress, fraction):
+    # The callback raises ExportCancelled to abort a write
+    if progress is not None:
+        progress(fraction)
+
+
+def _png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+
+
+def write_png(path, array, colors, progress=None):
+    """Indexed-palette PNG; colors is a list of (r, g, b) per phase"""
+    height = int(np.prod(array.shape[:-1]))
+    width = array.shape[-1]
+    palette = b"".join(bytes(color) for color in colors)
+    compressor = zlib.compressobj(6)
+    with open(path, "wb") as f:
+        f.write(PNG_SIGNATURE)
+        # Width, height, bit depth 8, colour type 3 (palette), default methods
+        f.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)))
+        f.write(_png_chunk(b"PLTE", palette))
+        for fraction, rows in _row_blocks(array):
+            # Every scanline starts with filter type 0 (none)
+            scanlines = np.zeros((rows.shape[0], width + 1), dtype=np.uint8)
+            scanlines[:, 1:] = rows
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                f.write(_png_chunk(b"IDAT", data))
+            _report(progress, fraction)
+        f.write(_png_chunk(b"IDAT", compressor.flush()))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def write_npy(path, array, progress=None):
+    with open(path, "wb") as f:
+        header = {"descr": "|u1", "fortran_order": False, "shape": tuple(array.shape)}
+        np.lib.format.write_array_header_1_0(f, header)
+        for fraction, rows in _row_blocks(array):
+            f.write(rows.tobytes())
+            _report(progress, fraction)
+
+
+def write_npy_stack(path, frames, count, shape, progress=None):
+    """Stack count arrays of one shape into a single (count, *shape) uint8 .npy
+
+    frames is an iterable producing the arrays one at a time, so only one is
+    held in memory. A cancelled export removes the file.
+    """
+    try:
+        with open(path, "wb") as f:
+            header = {"descr": "|u1", "fortran_order": False, "shape": (count, *shape)}
+            np.lib.format.write_array_header_1_0(f, header)
+            for i, frame in enumerate(frames):
+                for fraction, rows in _row_blocks(frame):
+                    f.write(rows.tobytes())
+                    _report(progress, (i + fraction) / count)
+    except ExportCancelled:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+
+def write_vtk(path, array, progress=None):
+    """Legacy VTK structured points with unit spacing and cell values at points"""
+    depth = array.shape[0] if array.ndim == 3 else 1
+    height, width = array.shape[-2:]
+    with open(path, "wb") as f:
+        f.write(
+            (
+                "# vtk DataFile Version 3.0\n"
+                "Plurigaussian simulation\n"
+                "BINARY\n"
+                "DATASET STRUCTURED_POINTS\n"
+                f"DIMENSIONS {width} {height} {depth}\n"
+                "ORIGIN 0 0 0\n"
+                "SPACING 1 1 1\n"
+                f"POINT_DATA {width * height * depth}\n"
+                "SCALARS phase unsigned_char 1\n"
+                "LOOKUP_TABLE default\n"
+            ).encode("ascii")
+        )
+        # VTK orders points x fastest, then y, then z: plain C order here
+        for fraction, rows in _row_blocks(array):
+            f.write(rows.tobytes())
+            _report(progress, fraction)
+        f.write(b"\n")
+
+
+def write_gslib(path, array, name="phase", progress=None):
+    depth = array.shape[0] if array.ndim == 3 else 1
+    height, width = array.shape[-2:]
+    with open(path, "w") as f:
+        f.write(f"{name} {width} {height} {depth}\n1\n{name}\n")
+        for fraction, rows in _row_blocks(array):
+            f.write("".join([_GSLIB_VALUES[v] for v in rows.ravel().tolist()]))
+            _report(progress, fraction)
+
+
+def export_array(array, base_path, formats, colors, progress=None):
+    """Write array in each format as base_path plus extension, returning the paths
+
+    A cancelled export removes the file it was writing.
+    """
+    paths = []
+    for i, fmt in enumerate(formats):
+        path = base_path + EXPORT_FORMATS[fmt]
+
+        def report(fraction, i=i):
+            _report(progress, (i + fraction) / len(formats))
+
+        try:
+            if fmt == "png":
+                write_png(path, array, colors, report)
+            elif fmt == "npy":
+                write_npy(path, array, report)
+            elif fmt == "vtk":
+                write_vtk(path, array, report)
+            elif fmt == "gslib":
+                write_gslib(path, array, progress=report)
+            else:
+                raise ValueError(f"Unknown export format: {fmt}")
+        except ExportCancelled:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        paths.append(path)
+    return paths
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# Constants
+HISTORY_SIZE = 256  # Durations kept per stage for percentiles
+TRACE_SIZE = 100000  # Trace events kept for the Chrome trace dump
+FPS_WINDOW = 2.0  # Seconds of frame timestamps used for frames/second
+
+
+class _NullTimer:
+    """Shared do-nothing context manager handed out while disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("owner", "name", "start")
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.owner.record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    """Hot-path stage timers with ring-buffer histories and a trace log
+
+    Usage: ``with instruments.timer("engine.simulate"): ...``. While disabled
+    timer() returns a shared no-op object, so instrumented code pays only an
+    attribute check.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histories = {}
+        self.trace = deque(maxlen=TRACE_SIZE)
+        self.frames = deque()
+        self.painted = False  # A view repainted since the last counted frame
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()  # Stages may be timed on worker threads
+
+    def timer(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def record(self, name, start, duration):
+        with self.lock:
+            history = self.histories.get(name)
+            if history is None:
+                history = self.histories[name] = deque(maxlen=HISTORY_SIZE)
+            history.append(duration)
+            self.trace.append((name, start, duration, threading.get_ident()))
+
+    def mark_painted(self):
+        """Note a view repaint; frame() turns the repaints of one update into a frame"""
+        if self.enabled:
+            self.painted = True
+
+    def frame(self):
+        """Count one displayed frame if any view repainted since the last call
+
+        Called once per coalesced window update, so views repainted together
+        make one frame rather than one each.
+        """
+        if not self.painted:
+            return
+        self.painted = False
+        now = time.perf_counter()
+        self.frames.append(now)
+        while self.frames and now - self.frames[0] > FPS_WINDOW:
+            self.frames.popleft()
+
+    def fps(self):
+        if len(self.frames) < 2:
+            return 0.0
+        span = self.frames[-1] - self.frames[0]
+        return (len(self.frames) - 1) / span if span > 0 else 0.0
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """Per-stage count and duration percentiles in milliseconds"""
+        with self.lock:
+            histories = {name: list(h) for name, h in self.histories.items()}
+        result = {}
+        for name, durations in sorted(histories.items()):
+            values = np.percentile(np.array(durations) * 1000.0, percentiles)
+            result[name] = {"count": len(durations)}
+            result[name].update({f"p{p}": float(v) for p, v in zip(percentiles, values)})
+        return result
+
+    def reset(self):
+        with self.lock:
+            self.histories.clear()
+            self.trace.clear()
+            self.frames.clear()
+            self.painted = False
+
+    def dump_trace(self, path):
+        """Write recorded stages as Chrome trace JSON (chrome://tracing, Perfetto)"""
+        with self.lock:
+            events = list(self.trace)
+        pid = os.getpid()
+        with open(path, "w") as f:
+            f.write('{"traceEvents": [\n')
+            for i, (name, start, duration, tid) in enumerate(events):
+                event = {
+                    "name": name,
+                    "cat": name.split(".")[0],
+                    "ph": "X",
+                    "ts": (start - self.origin) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                }
+                f.write(("," if i else "") + json.dumps(event) + "\n")
+            f.write('], "displayTimeUnit": "ms"}\n')
+
+
+# Shared instance; PGS_INSTRUMENT=1 enables it from startup
+instruments = Instrumentation(enabled=os.environ.get("PGS_INSTRUMENT") == "1")
@@ -0,0 +1,222 @@
+import json
+import os
+import struct
+import zlib
+import numpy as np
+
+from app.logic.vector import VectorOp
+
+# Constants
+JOURNAL_MAGIC = b"PGSJOURNAL1\n"
+SNAPSHOT_INTERVAL = 256  # Records appended before the journal is compacted
+RECORD_HEADER = struct.Struct("<BII")  # kind, payload length, payload crc32
+RECORD_SNAPSHOT = 0
+RECORD_DELTA = 1
+RECORD_FILL = 2
+RECORD_CLEAR = 3
+RECORD_PARAMETERS = 4
+RECORD_SEEDS = 5
+RECORD_HARD_DATA = 6
+RECORD_FIELD_SPECS = 7
+
+DELTA_HEADER = struct.Struct("<IIII")  # left, top, width, height
+FILL_RECORD = struct.Struct("<III")  # x, y, phase
+CLEAR_RECORD = struct.Struct("<I")
+SEEDS_RECORD = struct.Struct("<II")
+SNAPSHOT_HEADER = struct.Struct("<I")  # length of the JSON part
+
+
+class Journal:
+    """Append-only binary log of lithotype edits and simulation settings
+
+    Each record is a (kind, length, crc32) header and a payload. Edits are
+    stored as the changed bounding box, a fill seed point or a clear, so an
+    action costs O(change) on disk. Every SNAPSHOT_INTERVAL records the log
+    is rewritten as a single snapshot. The file is flushed after each record;
+    a torn final record fails its checksum and is ignored on recovery.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.grid = None  # Lithotype as last written, for computing deltas
+        self.parameters = None
+        self.seeds = None
+        self.hard_data = []  # Observations as HardData.to_list() entries
+        self.field_specs = None  # FieldSpec.to_dict() of every field
+        self.records = 0
+
+    def start(self, grid, parameters, seeds, hard_data=(), field_specs=None):
+        """Begin a fresh journal from the given state, replacing any old one"""
+        self.grid = np.asarray(grid, dtype=np.uint8).copy()
+        self.parameters = dict(parameters)
+        self.seeds = tuple(seeds)
+        self.hard_data = [list(entry) for entry in hard_data]
+        self.field_specs = field_specs
+        self.compact()
+
+    def compact(self):
+        """Rewrite the journal as one snapshot of the current state"""
+        if self.file is not None:
+            self.file.close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        state = {
+            "parameters": self.parameters,
+            "seeds": list(self.seeds),
+            "hard_data": self.hard_data,
+            "field_specs": self.field_specs,
+            "shape": list(self.grid.shape),
+        }
+        header = json.dumps(state).encode("utf-8")
+        payload = (
+            SNAPSHOT_HEADER.pack(len(header))
+            + header
+            + zlib.compress(self.grid.tobytes())
+        )
+        # Written aside and renamed, so a crash never leaves a partial snapshot
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(JOURNAL_MAGIC)
+            f.write(_pack(RECORD_SNAPSHOT, payload))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, "ab")
+        self.records = 0
+
+    def close(self, discard=False):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if discard and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _append(self, kind, payload):
+        self.file.write(_pack(kind, payload))
+        self.file.flush()
+        self.records += 1
+        if self.records >= SNAPSHOT_INTERVAL:
+            self.compact()
+
+    def record_parameters(self, parameters):
+        if parameters != self.parameters:
+            self.parameters = dict(parameters)
+            self._append(RECORD_PARAMETERS, json.dumps(parameters).encode("utf-8"))
+
+    def record_seeds(self, seeds):
+        seeds = tuple(seeds)
+        if seeds != self.seeds:
+            self.seeds = seeds
+            self._append(RECORD_SEEDS, SEEDS_RECORD.pack(*seeds))
+
+    def record_hard_data(self, entries):
+        entries = [list(entry) for entry in entries]
+        if entries != self.hard_data:
+            self.hard_data = entries
+            self._append(RECORD_HARD_DATA, json.dumps(entries).encode("utf-8"))
+
+    def record_field_specs(self, specs):
+        if specs != self.field_specs:
+            self.field_specs = specs
+            self._append(RECORD_FIELD_SPECS, json.dumps(specs).encode("utf-8"))
+
+    def record_fill(self, x, y, phase, grid):
+        """Log a flood fill by its seed point; grid is the result after filling"""
+        self.grid[:] = grid
+        self._append(RECORD_FILL, FILL_RECORD.pack(x, y, phase))
+
+    def record_grid(self, grid):
+        """Log whatever changed in grid since the last record"""
+        if grid.shape != self.grid.shape:
+            # Domain resizes change the lithotype shape: start from a snapshot
+            self.grid = np.asarray(grid, dtype=np.uint8).copy()
+            self.compact()
+            return
+
+        changed = grid != self.grid
+        rows = np.flatnonzero(changed.any(axis=1))
+        if rows.size == 0:
+            return
+        if (grid == grid.flat[0]).all():
+            self.grid.fill(grid.flat[0])
+            self._append(RECORD_CLEAR, CLEAR_RECORD.pack(int(grid.flat[0])))
+            return
+
+        cols = np.flatnonzero(changed.any(axis=0))
+        top, bottom = rows[0], rows[-1] + 1
+        left, right = cols[0], cols[-1] + 1
+        patch = grid[top:bottom, left:right].astype(np.uint8)
+        self.grid[top:bottom, left:right] = patch
+        self._append(
+            RECORD_DELTA,
+            DELTA_HEADER.pack(left, top, right - left, bottom - top)
+            + zlib.compress(patch.tobytes()),
+        )
+
+
+def _pack(kind, payload):
+    return RECORD_HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+
+def read_journal(path):
+    """Replay a journal into {"parameters", "seeds", "hard_data", "field_specs", "grid"}
+
+    Returns None if the journal is unusable. field_specs holds
+    FieldSpec.to_dict() entries, or None for journals without them.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(JOURNAL_MAGIC):
+        return None
+
+    state = None
+    offset = len(JOURNAL_MAGIC)
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start : start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break  # Torn write at the tail: everything before it is intact
+        offset = start + length
+
+        if kind == RECORD_SNAPSHOT:
+            (header_length,) = SNAPSHOT_HEADER.unpack_from(payload)
+            header_end = SNAPSHOT_HEADER.size + header_length
+            header = json.loads(payload[SNAPSHOT_HEADER.size : header_end])
+            grid = np.frombuffer(zlib.decompress(payload[header_end:]), np.uint8)
+            state = {
+                "parameters": header["parameters"],
+                "seeds": tuple(header["seeds"]),
+                # Journals written before observations were kept have none
+                "hard_data": header.get("hard_data", []),
+                "field_specs": header.get("field_specs"),
+                "grid": grid.reshape(header["shape"]).copy(),
+            }
+        elif state is None:
+            break  # A journal always opens with a snapshot
+        elif kind == RECORD_DELTA:
+            left, top, width, height = DELTA_HEADER.unpack_from(payload)
+            patch = np.frombuffer(
+                zlib.decompress(payload[DELTA_HEADER.size :]), np.uint8
+            )
+            state["grid"][top : top + height, left : left + width] = patch.reshape(
+                height, width
+            )
+        elif kind == RECORD_FILL:
+            x, y, phase = FILL_RECORD.unpack(payload)
+            grid = state["grid"]
+            VectorOp("fill", phase, (grid.shape[1], grid.shape[0]), [(x, y)]).apply(grid)
+        elif kind == RECORD_CLEAR:
+            state["grid"].fill(CLEAR_RECORD.unpack(payload)[0])
+        elif kind == RECORD_PARAMETERS:
+            state["parameters"] = json.loads(payload)
+        elif kind == RECORD_SEEDS:
+            state["seeds"] = SEEDS_RECORD.unpack(payload)
+        elif kind == RECORD_HARD_DATA:
+            state["hard_data"] = json.loads(payload)
+        elif kind == RECORD_FIELD_SPECS:
+            state["field_specs"] = json.loads(payload)
+    return state
@@ -0,0 +1,103 @@
+import numpy as np
+
+from app.logic.cache import LRUCache
+
+# Constants
+MEMORY_BUDGET_DEFAULT_MB = 2048
+MB = 1 << 20
+
+
+def _root(array):
+    """The array owning the buffer a view looks at"""
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def measure(objects, seen=None):
+    """Bytes held by objects as (resident, mapped)
+
+    Follows numpy arrays (memory-mapped ones count as mapped, since the OS
+    can page them out), QImages, LRUCaches, containers and plain objects'
+    attributes. Objects already in seen (a dict by id, which also keeps
+    them alive so ids are not reused) are skipped, so arrays shared between
+    objects are counted once.
+    """
+    seen = {} if seen is None else seen
+    resident = mapped = 0
+    stack = [objects]
+    while stack:
+        obj = stack.pop()
+        if obj is None or isinstance(obj, (str, bytes, int, float, bool)):
+            continue
+        if isinstance(obj, np.ndarray):
+            root = _root(obj)
+            if id(root) in seen:
+                continue
+            seen[id(root)] = root
+            if isinstance(root, np.memmap):
+                mapped += root.nbytes
+            else:
+                resident += root.nbytes
+            continue
+        if id(obj) in seen:
+            continue
+        seen[id(obj)] = obj
+        if hasattr(obj, "sizeInBytes"):  # QImage
+            resident += obj.sizeInBytes()
+        elif isinstance(obj, LRUCache):
+            stack.extend(obj.entries.values())
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            stack.extend(vars(obj).values())
+    return resident, mapped
+
+
+class MemoryLedger:
+    """Memory held by named components, with a budget enforced by releasing
+
+    Each component gives a function returning the objects it holds and
+    optionally a release function that frees one step (a cache entry, a
+    history entry) and returns whether it freed anything. Components are
+    measured in registration order, so a buffer shared between components is
+    counted once, under the first; they are released in order of priority.
+    """
+
+    def __init__(self, budget_mb=MEMORY_BUDGET_DEFAULT_MB, auto_release=True):
+        self.budget_mb = budget_mb
+        self.auto_release = auto_release  # Release as soon as the budget is exceeded
+        self.components = []  # (name, objects, release, priority)
+
+    def register(self, name, objects, release=None, priority=0):
+        self.components.append((name, objects, release, priority))
+
+    def usage(self):
+        """[(name, resident bytes, mapped bytes)] per component"""
+        seen = {}
+        return [(name, *measure(objects(), seen)) for name, objects, _, _ in self.components]
+
+    def resident(self):
+        return sum(resident for _, resident, _ in self.usage())
+
+    def over_budget(self):
+        return self.resident() > self.budget_mb * MB
+
+    def enforce(self):
+        """Release memory until within budget, lowest priority number first
+
+        Each releasable component is drained until it has nothing left to
+        free before the next is tried. Returns the names of the components
+        that released memory.
+        """
+        released = []
+        releasable = [c for c in self.components if c[2] is not None]
+        for name, _objects, release, _priority in sorted(releasable, key=lambda c: c[3]):
+            while self.over_budget() and release():
+                if name not in released:
+                    released.append(name)
+            if not self.over_budget():
+                break
+        return released
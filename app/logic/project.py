@@ -0,0 +1,160 @@
+import json
+import zlib
+import numpy as np
+
+from app.logic.conditioning import HardData
+from app.logic.service import create_engine
+from app.logic.simulation import NUM_FIELDS_MIN, NUM_PHASES, FieldSpec, lithotype_shape
+from app.logic.vector import VectorLayer
+
+# Constants
+REQUIRED_PARAMETERS = [
+    "width",
+    "height",
+    "len_scale_x",
+    "len_scale_y",
+    "brush_size",
+    "brush_shape",
+    "current_tool",
+    "current_phase",
+]
+# Accepted (min, max) of each parameter; the parameter controls use the same ranges
+PARAMETER_RANGES = {
+    "width": (50, 8000),
+    "height": (50, 8000),
+    "depth": (1, 500),  # A depth of 1 is the 2D mode
+    "len_scale_x": (1.0, 100.0),
+    "len_scale_y": (1.0, 100.0),
+    "len_scale_z": (1.0, 100.0),
+    "brush_size": (1, 75),
+}
+CELLS_MAX = 8000 * 8000  # Largest width × height × depth, that of the largest 2D domain
+BRUSH_SHAPES = ["circle", "triangle", "square"]
+TOOLS = ["brush", "fill"]
+
+
+class ProjectError(ValueError):
+    """A project file that cannot be loaded, with a message for the user"""
+
+
+def read_project(filename):
+    """Parse and validate a saved state file
+
+    Returns {"parameters", "grid", "vector_layer", "hard_data", "field_specs"}:
+    grid is the lithotype at lithotype_shape(width, height), rasterized from
+    the vector layer when the file has one (vector_layer is None otherwise).
+    field_specs is None for files without them. Raises ProjectError.
+    """
+    try:
+        with open(filename, "r") as f:
+            state = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ProjectError(f"Not a valid project file: {e}") from e
+
+    params = state.get("parameters")
+    if not isinstance(params, dict):
+        raise ProjectError("Missing parameters")
+    missing = [name for name in REQUIRED_PARAMETERS if name not in params]
+    if missing:
+        raise ProjectError(f"Missing parameters: {', '.join(missing)}")
+
+    params = dict(params)
+    # Files saved before 3D support have no depth or z length scale
+    params.setdefault("depth", 1)
+    params.setdefault("len_scale_z", params["len_scale_x"])
+    for name in ("width", "height", "depth", "brush_size", "current_phase"):
+        if not isinstance(params[name], int) or isinstance(params[name], bool):
+            raise ProjectError(f"{name} must be an integer")
+    for name in ("len_scale_x", "len_scale_y", "len_scale_z"):
+        if not isinstance(params[name], (int, float)):
+            raise ProjectError(f"{name} must be a number")
+    for name, (low, high) in PARAMETER_RANGES.items():
+        if not low <= params[name] <= high:
+            raise ProjectError(f"{name} must be between {low} and {high}, not {params[name]}")
+    cells = params["width"] * params["height"] * params["depth"]
+    if cells > CELLS_MAX:
+        raise ProjectError(f"The domain has {cells:,} cells; at most {CELLS_MAX:,} are supported")
+    shape = params["brush_shape"]
+    if not isinstance(shape, str) or shape.lower() not in BRUSH_SHAPES:
+        raise ProjectError(f"brush_shape must be one of {', '.join(BRUSH_SHAPES)}")
+    if params["current_tool"] not in TOOLS:
+        raise ProjectError(f"current_tool must be one of {', '.join(TOOLS)}")
+    if not 0 <= params["current_phase"] < NUM_PHASES:
+        raise ProjectError(f"current_phase must be between 0 and {NUM_PHASES - 1}")
+
+    expected = lithotype_shape(params["width"], params["height"])
+    vector_layer = None
+    if "vector_layer" in state:
+        try:
+            vector_layer = VectorLayer.from_dict(state["vector_layer"])
+            grid = vector_layer.rasterize(expected[1], expected[0]).astype(int)
+        except (KeyError, TypeError, ValueError, AttributeError, zlib.error) as e:
+            raise ProjectError(f"Invalid vector layer: {e}") from e
+    elif "lithotype_grid" in state:
+        try:
+            grid = np.array(state["lithotype_grid"], dtype=int)
+        except (TypeError, ValueError) as e:
+            raise ProjectError("Lithotype grid is not a rectangular integer array") from e
+        if grid.shape != expected:
+            raise ProjectError(
+                f"Lithotype grid is {grid.shape[1]}x{grid.shape[0]} "
+                f"but the domain needs {expected[1]}x{expected[0]}"
+            )
+    else:
+        raise ProjectError("No lithotype grid or vector layer")
+
+    if grid.size and (grid.min() < 0 or grid.max() >= NUM_PHASES):
+        raise ProjectError(f"Phase values must be between 0 and {NUM_PHASES - 1}")
+
+    hard_data = HardData()
+    if "hard_data" in state:
+        try:
+            hard_data = HardData.from_list(state["hard_data"])
+        except (TypeError, ValueError, IndexError) as e:
+            raise ProjectError("Hard data must be lists of cell indices and a phase") from e
+        if params["depth"] > 1:
+            domain = (params["depth"], params["height"], params["width"])
+        else:
+            domain = (params["height"], params["width"])
+        if len(hard_data.within(domain)) != len(hard_data):
+            raise ProjectError("Hard data lies outside the domain")
+        if any(not 0 <= phase < NUM_PHASES for phase in hard_data.points.values()):
+            raise ProjectError(f"Observed phases must be between 0 and {NUM_PHASES - 1}")
+
+    field_specs = None
+    if "field_specs" in state:
+        try:
+            field_specs = [FieldSpec.from_dict(spec) for spec in state["field_specs"]]
+        except (TypeError, KeyError, ValueError, AttributeError) as e:
+            raise ProjectError(f"Invalid field specs: {e}") from e
+        if len(field_specs) < NUM_FIELDS_MIN:
+            raise ProjectError(f"At least {NUM_FIELDS_MIN} field specs are needed")
+
+    return {
+        "parameters": params,
+        "grid": grid,
+        "vector_layer": vector_layer,
+        "hard_data": hard_data,
+        "field_specs": field_specs,
+    }
+
+
+def prepare_engine(params, grid, hard_data=None, process=False, field_specs=None):
+    """Build an engine for a loaded project and simulate its lithotype
+
+    With process set the engine runs in a service process (see create_engine).
+    """
+    engine = create_engine(
+        process,
+        width=params["width"],
+        height=params["height"],
+        len_scale_x=params["len_scale_x"],
+        len_scale_y=params["len_scale_y"],
+        depth=params["depth"],
+        len_scale_z=params["len_scale_z"],
+        field_specs=field_specs,
+    )
+    engine.update_lithotypes(grid)
+    if hard_data is not None:
+        engine.set_hard_data(hard_data)
+    return engine, engine.simulate()
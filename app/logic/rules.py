@@ -0,0 +1,174 @@
+import numpy as np
+
+
+def gaussian_quantiles(probabilities):
+    """Standard Gaussian field values below which the given proportions fall"""
+    from scipy.special import ndtri  # Deferred to keep startup fast
+
+    return ndtri(np.clip(np.sort(np.asarray(probabilities, dtype=float)), 1e-9, 1 - 1e-9))
+
+
+class Thresholds:
+    """Simple rule: phases in order along one field, split at increasing values"""
+
+    def __init__(self, field, values, phases=None):
+        self.field = field  # 0 for field 1, 1 for field 2
+        self.values = np.sort(np.asarray(values, dtype=float))
+        if phases is None:
+            phases = range(len(self.values) + 1)
+        self.phases = np.asarray(phases, dtype=np.uint8)
+
+    def evaluate(self, field_values):
+        """Phase of each field value, straight from np.digitize"""
+        return self.phases[np.digitize(field_values, self.values)]
+
+
+class Threshold:
+    """Node of a truncation tree; below/above are a phase or another node
+
+    field indexes the engine's fields, so trees may split on more than two.
+    """
+
+    def __init__(self, field, value, below, above):
+        self.field = field
+        self.value = value
+        self.below = below
+        self.above = above
+
+
+class Rectangle:
+    """Axis-aligned box in (field 1, field 2) space"""
+
+    def __init__(self, phase, field1=(-np.inf, np.inf), field2=(-np.inf, np.inf)):
+        self.phase = phase
+        self.field1 = field1
+        self.field2 = field2
+
+    def contains(self, values1, values2):
+        return (
+            (values1 >= self.field1[0])
+            & (values1 < self.field1[1])
+            & (values2 >= self.field2[0])
+            & (values2 < self.field2[1])
+        )
+
+
+class Sector:
+    """Angular sector around (0, 0), angles in degrees from field 2's axis
+
+    Field values are used as they are; (0, 0) is the field means only
+    because the engine's fields have zero mean.
+    """
+
+    def __init__(self, phase, start, end, inner=0.0, outer=np.inf):
+        self.phase = phase
+        self.start = start
+        self.end = end
+        self.inner = inner
+        self.outer = outer
+
+    def contains(self, values1, values2):
+        radius = np.hypot(values1, values2)
+        angle = np.degrees(np.arctan2(values1, values2)) % 360.0
+        span = (self.end - self.start) % 360.0 or 360.0
+        in_angle = (angle - self.start) % 360.0 < span
+        return in_angle & (radius >= self.inner) & (radius < self.outer)
+
+
+class TruncationTree:
+    """A Threshold tree flattened to arrays for level-by-level evaluation
+
+    Node 0 is the root. Leaves become nodes that send every value back to
+    themselves (value +inf, both children the leaf), so all cells can take
+    one step down the tree per level and the cost is one vectorised pass
+    per level, whatever the number of nodes or fields.
+    """
+
+    def __init__(self, root):
+        fields, values, below, above, phases = [], [], [], [], []
+        self.depth = 0
+
+        def add(node, level):
+            index = len(fields)
+            fields.append(0)
+            values.append(np.inf)
+            below.append(index)
+            above.append(index)
+            phases.append(0)
+            if isinstance(node, Threshold):
+                self.depth = max(self.depth, level + 1)
+                fields[index] = node.field
+                values[index] = node.value
+                below[index] = add(node.below, level + 1)
+                above[index] = add(node.above, level + 1)
+            else:
+                phases[index] = node
+            return index
+
+        add(root, 0)
+        self.fields = np.asarray(fields, dtype=np.intp)
+        self.values = np.asarray(values, dtype=float)
+        self.below = np.asarray(below, dtype=np.intp)
+        self.above = np.asarray(above, dtype=np.intp)
+        self.phases = np.asarray(phases, dtype=np.uint8)
+        self.num_fields = int(self.fields.max()) + 1
+
+    def key(self):
+        """Hashable description, for caching realisations of this tree"""
+        return (
+            "tree",
+            self.fields.tobytes(),
+            self.values.tobytes(),
+            self.below.tobytes(),
+            self.above.tobytes(),
+            self.phases.tobytes(),
+        )
+
+    def evaluate(self, fields):
+        """Phases for a sequence of broadcastable field value arrays"""
+        stacked = np.stack(np.broadcast_arrays(*fields[: self.num_fields]))
+        node = np.zeros(stacked.shape[1:], dtype=np.intp)
+        for _ in range(self.depth):
+            field = self.fields[node]
+            values = np.take_along_axis(stacked, field[None], axis=0)[0]
+            node = np.where(values < self.values[node], self.below[node], self.above[node])
+        return self.phases[node]
+
+
+def rule_fields(rule):
+    """Number of fields a rule reads; only rules on two fields have an image"""
+    if isinstance(rule, Thresholds):
+        return max(2, rule.field + 1)
+    if isinstance(rule, Threshold):
+        return max(2, TruncationTree(rule).num_fields)
+    return 2
+
+
+def evaluate_rule(rule, values1, values2, base_phase=0):
+    """Phases for broadcastable arrays of field 1 and field 2 values
+
+    A rule is a Thresholds, a Threshold tree, or a list of Rectangle/Sector
+    shapes painted in order over base_phase.
+    """
+    values1, values2 = np.broadcast_arrays(values1, values2)
+    if isinstance(rule, Thresholds):
+        return rule.evaluate((values1, values2)[rule.field])
+
+    if isinstance(rule, Threshold):
+        return TruncationTree(rule).evaluate((values1, values2))
+
+    out = np.full(values1.shape, base_phase, dtype=np.uint8)
+
+    for shape in rule:
+        out[shape.contains(values1, values2)] = shape.phase
+    return out
+
+
+def compile_rule(rule, axes, base_phase=0):
+    """Build the lithotype image for a rule on the given lithotype axes
+
+    Row i of the image is hit by field values in [axis[i-1], axis[i]), so each
+    cell is evaluated at the lower edge of that interval.
+    """
+    axis1, axis2 = (np.concatenate(([axis[0]], axis[:-1])) for axis in axes)
+    return evaluate_rule(rule, axis1[:, None], axis2[None, :], base_phase)
@@ -0,0 +1,275 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+from app.logic.cache import LRUCache
+from app.logic.conditioning import HardData
+from app.logic.rules import Thresholds, rule_fields
+from app.logic.simulation import SimulationEngine, lithotype_shape
+
+# Constants
+SHARED_MIN_BYTES = 1 << 16  # Smaller arrays are simply pickled with the message
+START_METHOD = "spawn"  # Forking a process that runs Qt threads is unsafe
+ENGINE_METHODS = {
+    "simulate",
+    "regenerate_fields",
+    "update_lithotypes",
+    "set_hard_data",
+    "set_length_scales",
+    "set_domain_size",
+    "set_field_specs",
+    "compile_rule",
+    "simulate_rule",
+    "tune_lithotypes",
+    "drop_histogram",
+    "prefetch_deformation",
+    "drop_deformation",
+    "deform",
+}
+ENGINE_ATTRIBUTES = {"lithotypes"}  # Readable with a "get" request
+# Mirrored to the client after every request
+ENGINE_STATE = [
+    "width",
+    "height",
+    "depth",
+    "len_scale_x",
+    "len_scale_y",
+    "len_scale_z",
+    "field_specs",
+    "grid_shape",
+    "num_phases",
+    "seeds",
+    "field_stats",
+    "field_generation",
+    "last_key",
+    "thresholds",
+    "hard_data",
+    "conditioning_error",
+    "deformation_seeds",
+]
+
+
+class EngineServiceError(RuntimeError):
+    """A request the engine service failed, with the remote error message"""
+
+
+class EngineServiceLost(EngineServiceError):
+    """The service process exited or its connection broke; the client is unusable"""
+
+
+class ArrayHandle:
+    """Picklable reference to an array copied into a shared memory block
+
+    The receiver takes ownership: open() copies the array out and unlinks
+    the block, so a handle must be opened exactly once.
+    """
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        try:
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        finally:
+            block.close()
+        self.name = block.name
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+
+    def open(self):
+        block = shared_memory.SharedMemory(name=self.name)
+        try:
+            return np.ndarray(self.shape, self.dtype, buffer=block.buf).copy()
+        finally:
+            block.close()
+            block.unlink()
+
+
+def _pack(value):
+    """Replace large arrays in a message, also inside tuples and lists, by handles"""
+    if isinstance(value, np.ndarray) and value.nbytes >= SHARED_MIN_BYTES:
+        return ArrayHandle(value)
+    if isinstance(value, (tuple, list)):
+        return type(value)(_pack(v) for v in value)
+    return value
+
+
+def _unpack(value):
+    if isinstance(value, ArrayHandle):
+        return value.open()
+    if isinstance(value, (tuple, list)):
+        return type(value)(_unpack(v) for v in value)
+    return value
+
+
+def _engine_state(engine):
+    if engine is None:
+        return {}
+    return {name: getattr(engine, name) for name in ENGINE_STATE}
+
+
+def serve(connection):
+    """Answer engine requests on a connection until it closes
+
+    Requests are ("init", kwargs), ("call", method, args, kwargs),
+    ("get", attribute) or ("close",); each is answered with ("ok", result,
+    state) or ("error", message, state), where state mirrors ENGINE_STATE.
+    Large arrays travel as ArrayHandles in both directions.
+    """
+    engine = None
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        kind = request[0]
+        if kind == "close":
+            connection.send(("ok", None, {}))
+            break
+        try:
+            if kind == "init":
+                engine = SimulationEngine(**request[1])
+                result = None
+            elif kind == "call" and request[1] in ENGINE_METHODS:
+                _, method, args, kwargs = request
+                result = getattr(engine, method)(*_unpack(args), **_unpack(kwargs))
+            elif kind == "get" and request[1] in ENGINE_ATTRIBUTES:
+                result = getattr(engine, request[1])
+            else:
+                raise EngineServiceError(f"Unsupported request: {request[:2]}")
+            connection.send(("ok", _pack(result), _engine_state(engine)))
+        except Exception as e:
+            connection.send(("error", f"{type(e).__name__}: {e}", _engine_state(engine)))
+    connection.close()
+
+
+def _run_service(connection):
+    # Entry point of the service process
+    serve(connection)
+
+
+class EngineClient:
+    """SimulationEngine in a separate process, behind the same interface
+
+    Fields, caches and the gstools work live in the service process; only
+    lithotype grids and realisations cross, through shared memory. Engine
+    state the GUI reads (sizes, seeds, cache key, hard data, ...) is
+    mirrored after every request. Calls block until the service answers.
+    """
+
+    # Methods that only read mirrored state run locally
+    is_3d = SimulationEngine.is_3d
+    is_tiled = SimulationEngine.is_tiled
+    get_num_phases = SimulationEngine.get_num_phases
+    lithotype_axes = SimulationEngine.lithotype_axes
+    threshold_rule = SimulationEngine.threshold_rule
+    phase_proportions = SimulationEngine.phase_proportions
+
+    def __init__(self, connection=None, process=None, **parameters):
+        self.connection = connection
+        self.process = process
+        if connection is None:
+            context = multiprocessing.get_context(START_METHOD)
+            self.connection, remote = context.Pipe()
+            self.process = context.Process(
+                target=_run_service, args=(remote,), name="pgs-engine", daemon=True
+            )
+            self.process.start()
+            remote.close()
+
+        # The GUI process holds no realisations or kriging systems
+        self.cache = LRUCache(0)
+        self.kriging_cache = LRUCache(0)
+        self.hard_data = HardData()
+        self.lithotypes = None
+        self._request("init", parameters)
+        self.lithotypes = np.zeros(lithotype_shape(self.width, self.height))
+
+    def _request(self, *request):
+        if self.connection is None:
+            raise EngineServiceLost("Engine service is closed")
+        try:
+            self.connection.send(request)
+            status, result, state = self.connection.recv()
+        except (EOFError, OSError) as e:
+            raise EngineServiceLost(f"Engine service stopped: {e or type(e).__name__}") from e
+        self.__dict__.update((name, state[name]) for name in ENGINE_STATE if name in state)
+        if status == "error":
+            raise EngineServiceError(result)
+        return _unpack(result)
+
+    def _call(self, method, *args, **kwargs):
+        return self._request("call", method, _pack(args), _pack(kwargs))
+
+    def simulate(self):
+        return self._call("simulate")
+
+    def regenerate_fields(self, seeds=None):
+        return self._call("regenerate_fields", seeds)
+
+    def update_lithotypes(self, grid):
+        # The service keeps its own copy, so later edits to grid need another update
+        self.lithotypes = np.array(grid)
+        self._call("update_lithotypes", self.lithotypes)
+
+    def set_hard_data(self, hard_data):
+        self._call("set_hard_data", hard_data)
+
+    def set_length_scales(self, len_scale_x, len_scale_y, len_scale_z=None, seeds=None):
+        self._call("set_length_scales", len_scale_x, len_scale_y, len_scale_z, seeds)
+
+    def set_field_specs(self, specs):
+        self._call("set_field_specs", list(specs))
+
+    def set_domain_size(self, width, height, depth=None, seeds=None):
+        self._call("set_domain_size", width, height, depth, seeds)
+        # The service resized the lithotype, keeping what still fits
+        self.lithotypes = self._request("get", "lithotypes")
+
+    def compile_rule(self, rule, base_phase=0):
+        return self._call("compile_rule", rule, base_phase)
+
+    def simulate_rule(self, rule):
+        p_field = self._call("simulate_rule", rule)
+        if rule_fields(rule) <= 2 and (not isinstance(rule, Thresholds) or len(self.hard_data)):
+            # Compiled rules replace the lithotype image on the service side
+            self.lithotypes = self._request("get", "lithotypes")
+        return p_field
+
+    def tune_lithotypes(self, targets):
+        return self._call("tune_lithotypes", list(targets))
+
+    def drop_histogram(self):
+        return self._call("drop_histogram")
+
+    def prefetch_deformation(self, seeds=None):
+        self._call("prefetch_deformation", seeds)
+
+    def drop_deformation(self):
+        return self._call("drop_deformation")
+
+    def deform(self, angle):
+        return self._call("deform", angle)
+
+    def close(self):
+        """Stop the service process; the client cannot be used afterwards"""
+        if self.connection is None:
+            return
+        try:
+            self._request("close")
+        except EngineServiceLost:
+            pass  # The service already exited
+        self.connection.close()
+        self.connection = None
+        if self.process is not None:
+            self.process.join()
+
+
+def create_engine(process=False, **parameters):
+    """A SimulationEngine, or with process set an EngineClient to a new service
+
+    The in-process engine is the local stand-in for the service: both have
+    the same interface, so callers need not know which they hold.
+    """
+    if process:
+        return EngineClient(**parameters)
+    return SimulationEngine(**parameters)
@@ -1,98 +1,646 @@
+import itertools
+import os
 import numpy as np
-import gstools as gs
+
+from app.logic.cache import LRUCache, lithotype_hash
+from app.logic.conditioning import (
+    ConditioningError,
+    HardData,
+    KrigingSystem,
+    gibbs_sample,
+    lithotype_index,
+)
+from app.logic.instrumentation import instruments
+from app.logic.rules import (
+    Thresholds,
+    TruncationTree,
+    compile_rule,
+    gaussian_quantiles,
+    rule_fields,
+)
+from app.logic.tiled import TiledArray, TILE_SIZE
+from app.logic.tuning import field_histogram, tune_lithotypes
+
+# Constants
+LITHOTYPE_SIZE_MAX = 500  # Largest lithotype side; the rule lives in field-value space
+NUM_PHASES = 6
+THRESHOLDS_DEFAULT = [0.16, 0.32, 0.48, 0.64, 0.8]  # Cumulative phase proportions
+KRIGING_CACHE_SIZE = 4  # Factorised data covariances kept across realisations
+NUM_FIELDS_MIN = 2  # The lithotype image needs a pair of fields
+# Numbers field generations across every engine, so ids never repeat
+_generation_counter = itertools.count(1)
+# Tells engine service processes apart; each one imports this module afresh
+_PROCESS_TOKEN = os.urandom(8).hex()
+
+
+def next_field_generation():
+    """Id of a new field draw, unique across engines and processes
+
+    Realisation keys include it, and caches such as the result view's
+    render cache outlive engines, so a per-engine counter would let a new
+    engine's realisations collide with an old one's.
+    """
+    return (_PROCESS_TOKEN, next(_generation_counter))
+
+
+def lithotype_shape(width, height):
+    """Lithotype grid shape for a domain, scaled down to fit LITHOTYPE_SIZE_MAX"""
+    scale = min(1.0, LITHOTYPE_SIZE_MAX / max(width, height))
+    return (max(1, int(round(height * scale))), max(1, int(round(width * scale))))
+
+
+def get_slice(volume, axis, index):
+    """2D slice of a 3D realisation; axis 0, 1, 2 is z, y, x"""
+    index = min(max(index, 0), volume.shape[axis] - 1)
+    return np.take(volume, index, axis=axis)
+
+
+class FieldSpec:
+    """Covariance model of one Gaussian field
+
+    model names a gstools covariance model; scale multiplies the engine's
+    length scales, so fields can be smoother or rougher than the others.
+    """
+
+    def __init__(self, model="Gaussian", scale=1.0):
+        self.model = model
+        self.scale = scale
+
+    def to_dict(self):
+        return {"model": self.model, "scale": self.scale}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Spec from to_dict output, raising ValueError for unknown models"""
+        import gstools as gs
+
+        model = getattr(gs, str(data["model"]), None)
+        if not (isinstance(model, type) and issubclass(model, gs.CovModel)):
+            raise ValueError(f"Unknown covariance model: {data['model']}")
+        scale = float(data.get("scale", 1.0))
+        if not scale > 0:
+            raise ValueError("Field scale must be positive")
+        return cls(data["model"], scale)
+
+
+def _checked_specs(specs):
+    specs = list(specs)
+    if len(specs) < NUM_FIELDS_MIN:
+        raise ValueError(f"At least {NUM_FIELDS_MIN} fields are needed, not {len(specs)}")
+    return specs
+
+
+def field_seed(seeds, index):
+    """Seed of an extra field, derived from the (seed1, seed2) pair"""
+    return int(np.random.SeedSequence([*seeds, index]).generate_state(1)[0])
 
 
 class SimulationEngine:
-    def __init__(self, width=250, height=250, len_scale_x=10.0, len_scale_y=10.0):
+    def __init__(
+        self,
+        width=250,
+        height=250,
+        len_scale_x=10.0,
+        len_scale_y=10.0,
+        depth=1,
+        len_scale_z=10.0,
+        field_specs=None,
+        generate=True,
+    ):
+        """generate=False leaves the fields empty until regenerate_fields
+
+        field_specs is as for set_field_specs; two Gaussian fields by default.
+        """
         self.width = width
         self.height = height
-        self.grid_shape = (height, width)
-        self.lithotypes = np.zeros(self.grid_shape)
+        self.depth = depth  # A depth of 1 is the plain 2D mode
+        self.grid_shape = self._grid_shape()
+        self.lithotypes = np.zeros(lithotype_shape(width, height))
         self.len_scale_x = len_scale_x
         self.len_scale_y = len_scale_y
-        self.num_phases = 6
+        self.len_scale_z = len_scale_z
+        self.num_phases = NUM_PHASES
+        # One spec per field; the first two are the lithotype image's pair
+        if field_specs is None:
+            field_specs = [FieldSpec() for _ in range(NUM_FIELDS_MIN)]
+        self.field_specs = _checked_specs(field_specs)
 
         # Define coordinates for the structured grid
-        x = np.arange(0, width, 1)  # x-coordinates (columns)
-        y = np.arange(0, height, 1)  # y-coordinates (rows)
-        self.coords = [
-            y,
-            x,
-        ]  # GSTools expects [y, x] for (rows, columns) array
-
-        # Create two independent SRFs for a 2D PGS
-        self.model1 = gs.Gaussian(
-            dim=2, var=1.0, len_scale=[self.len_scale_x, self.len_scale_y]
-        )
-        self.srf1 = gs.SRF(self.model1)
+        self.coords = self._grid_coords()
 
-        self.model2 = gs.Gaussian(
-            dim=2, var=1.0, len_scale=[self.len_scale_x, self.len_scale_y]
-        )
-        self.srf2 = gs.SRF(self.model2)
+        # Create independent SRFs, two for the PGS and any extra ones
+        self._build_models()
 
         self.pgs = None
-        self.thresholds = [
-            0.16,
-            0.32,
-            0.48,
-            0.64,
-            0.8,
-        ]  # Fixed thresholds for 6 phases (0-5)
+        # Fields and their (min, max, mean), used for tiling and rule compilation
+        self.field1 = None
+        self.field2 = None
+        self.extra_fields = []  # Fields 3 onwards, only read by truncation trees
+        self.field_stats = None
+        self.seeds = None  # (seed1, seed2) the current fields were drawn with
 
-        self.regenerate_fields()
+        # Realisations keyed by (lithotype hash, field generation id); see
+        # next_field_generation. None until fields are drawn
+        self.field_generation = None
+        self.cache = LRUCache()
+        self.last_key = None
+        # Default cumulative phase proportions for the threshold rule (0-5)
+        self.thresholds = list(THRESHOLDS_DEFAULT)
 
-    def set_length_scales(self, len_scale_x, len_scale_y):
+        # Observed phases the realisations are conditioned on
+        self.hard_data = HardData()
+        self.kriging_cache = LRUCache(KRIGING_CACHE_SIZE)
+        self.conditioning_error = None  # Why the last realisation is unconditional
+
+        # Field-pair histogram over the lithotype cells, for proportion tuning
+        self.histogram = None
+        self.histogram_key = None
+
+        # Second field pair that gradual deformation moves towards
+        self.deformation_fields = None
+        self.deformation_seeds = None
+
+        if generate:
+            self.regenerate_fields()
+
+    def is_3d(self):
+        return self.depth > 1
+
+    def _grid_shape(self):
+        if self.is_3d():
+            return (self.depth, self.height, self.width)
+        return (self.height, self.width)
+
+    def _grid_coords(self):
+        x = np.arange(0, self.width, 1)  # x-coordinates (columns)
+        y = np.arange(0, self.height, 1)  # y-coordinates (rows)
+        if self.is_3d():
+            z = np.arange(0, self.depth, 1)  # z-coordinates (slices)
+            return [z, y, x]
+        return [y, x]  # GSTools expects [y, x] for (rows, columns) array
+
+    def _model_len_scale(self, scale=1.0):
+        if self.is_3d():
+            return [scale * s for s in (self.len_scale_z, self.len_scale_x, self.len_scale_y)]
+        return [scale * self.len_scale_x, scale * self.len_scale_y]
+
+    def _build_models(self):
+        """(Re)create every covariance model and SRF for the current dimension"""
+        # gstools takes about half a second to import, so defer it to first use
+        import gstools as gs
+
+        dim = len(self.grid_shape)
+        self.models = [
+            getattr(gs, spec.model)(
+                dim=dim, var=1.0, len_scale=self._model_len_scale(spec.scale)
+            )
+            for spec in self.field_specs
+        ]
+        self.srfs = [gs.SRF(model) for model in self.models]
+        self.model1, self.model2 = self.models[:2]
+        self.srf1, self.srf2 = self.srfs[:2]
+
+    def set_length_scales(self, len_scale_x, len_scale_y, len_scale_z=None, seeds=None):
+        """Change the length scales and draw new fields, from seeds if given"""
         self.len_scale_x = len_scale_x
         self.len_scale_y = len_scale_y
-        self.model1.len_scale = [self.len_scale_x, self.len_scale_y]
-        self.model2.len_scale = [self.len_scale_x, self.len_scale_y]
+        if len_scale_z is not None:
+            self.len_scale_z = len_scale_z
+        for model, spec in zip(self.models, self.field_specs):
+            model.len_scale = self._model_len_scale(spec.scale)
+        self.regenerate_fields(seeds)
+
+    def set_field_specs(self, specs):
+        """Use one field per spec, at least two, and draw new fields
+
+        The first two fields keep feeding the lithotype image; extra fields
+        are only read by truncation trees that split on them.
+        """
+        self.field_specs = _checked_specs(specs)
+        self._build_models()
+        self.kriging_cache.clear()  # Systems of the old models are never hit again
         self.regenerate_fields()
 
-    def set_domain_size(self, width, height):
-        """Update domain size and reinitialize grid and coordinates"""
+    def fields(self):
+        """Every field, the lithotype pair first"""
+        return [self.field1, self.field2, *self.extra_fields]
+
+    def set_domain_size(self, width, height, depth=None, seeds=None):
+        """Update domain size and reinitialize grid and coordinates
+
+        New fields are drawn, from seeds if given.
+        """
+        was_3d = self.is_3d()
         self.width = width
         self.height = height
-        self.grid_shape = (height, width)
+        if depth is not None:
+            self.depth = depth
+        self.grid_shape = self._grid_shape()
 
         # Preserve existing lithotypes if possible, otherwise reset
         old_lithotypes = self.lithotypes.copy()
-        self.lithotypes = np.zeros(self.grid_shape)
+        lith_height, lith_width = lithotype_shape(width, height)
+        self.lithotypes = np.zeros((lith_height, lith_width))
 
         # Copy over lithotypes that fit in the new grid
-        min_height = min(old_lithotypes.shape[0], height)
-        min_width = min(old_lithotypes.shape[1], width)
+        min_height = min(old_lithotypes.shape[0], lith_height)
+        min_width = min(old_lithotypes.shape[1], lith_width)
         self.lithotypes[:min_height, :min_width] = old_lithotypes[
             :min_height, :min_width
         ]
 
         # Update coordinates for new grid size
-        x = np.arange(0, width, 1)  # x-coordinates (columns)
-        y = np.arange(0, height, 1)  # y-coordinates (rows)
-        self.coords = [y, x]
+        self.coords = self._grid_coords()
+
+        # Switching between 2D and 3D changes the model dimension
+        if self.is_3d() != was_3d:
+            self._build_models()
+            self.hard_data = HardData()
+        else:
+            # Observations outside the new domain are dropped
+            self.hard_data = self.hard_data.within(self.grid_shape)
 
         # Regenerate fields with new domain size
-        self.regenerate_fields()
+        self.regenerate_fields(seeds)
 
     def update_lithotypes(self, grid: np.ndarray):
         self.lithotypes = grid
 
+    def close(self):
+        """Nothing to release in process; EngineClient stops its service here"""
+
+    def set_hard_data(self, hard_data):
+        self.hard_data = hard_data
+
     def get_num_phases(self):
         return self.num_phases
 
+    def is_tiled(self):
+        """Large and 3D domains are generated and mapped block by block"""
+        return self.is_3d() or max(self.width, self.height) > TILE_SIZE
+
     def simulate(self):
+        """Return the realisation for the current lithotypes, reusing cached results"""
+        key = (lithotype_hash(self.lithotypes), self.field_generation)
+        if len(self.hard_data):
+            key += (self.hard_data.key,)
+        self.last_key = key
+        p_field = self.cache.get(key)
+        if p_field is not None:
+            return p_field
+
+        self.conditioning_error = None
+        if len(self.hard_data):
+            try:
+                with instruments.timer("engine.simulate_conditional"):
+                    p_field = self._simulate_conditional()
+            except ConditioningError as e:
+                # Show the unconditional realisation and say why; not cached.
+                # last_key must name what is shown, not the failed conditioning
+                self.conditioning_error = str(e)
+                self.last_key = key[:2]
+                return self._simulate()
+        else:
+            with instruments.timer("engine.simulate"):
+                p_field = self._simulate()
+        self.cache.put(key, p_field)
+        return p_field
+
+    def _simulate(self):
+        if self.is_tiled():
+            return self._simulate_tiled()
+
         # Get the continuous field from the PGS model
         continuous_field = self.pgs(self.lithotypes)
 
         return continuous_field.astype(int)
 
-    def regenerate_fields(self):
-        seed1 = np.random.randint(0, 1E6)
-        seed2 = np.random.randint(0, 1E6)
+    def regenerate_fields(self, seeds=None):
+        """Draw new fields, from the given (seed1, seed2) or from fresh seeds"""
+        with instruments.timer("engine.regenerate_fields"):
+            self._generate_fields(seeds)
+        return self.simulate()
+
+    def _generate_fields(self, seeds=None):
+        if seeds is None:
+            seeds = (np.random.randint(0, 1E6), np.random.randint(0, 1E6))
+        seed1, seed2 = (int(seed) for seed in seeds)
+        self.seeds = (seed1, seed2)
+
+        # New fields make every cached realisation unreachable
+        self.field_generation = next_field_generation()
+        self.cache.clear()
+        # The target pair may no longer match the grid or the models
+        self.drop_deformation()
+
+        # Extra fields get seeds derived from the pair, so seeds stay two numbers
+        extra_seeds = [field_seed(self.seeds, i) for i in range(2, len(self.srfs))]
+
+        if self.is_tiled():
+            self.pgs = None
+            self.field1, stats1 = self._generate_tiled(self.srf1, seed1)
+            self.field2, stats2 = self._generate_tiled(self.srf2, seed2)
+            self.field_stats = [stats1, stats2]
+            self.extra_fields = [
+                self._generate_tiled(srf, seed)[0]
+                for srf, seed in zip(self.srfs[2:], extra_seeds)
+            ]
+            return
 
         field1 = self.srf1.structured(self.coords, seed=seed1)
         field2 = self.srf2.structured(self.coords, seed=seed2)
+        self.field1, self.field2 = field1, field2
+        self.extra_fields = [
+            srf.structured(self.coords, seed=seed)
+            for srf, seed in zip(self.srfs[2:], extra_seeds)
+        ]
+        self.field_stats = [(f.min(), f.max(), f.mean()) for f in (field1, field2)]
+
+        import gstools as gs
 
         # The PGS class itself doesn't take thresholds
         self.pgs = gs.PGS(dim=2, fields=[field1, field2])
-        return self.simulate()
+
+    def threshold_rule(self, field=0, thresholds=None):
+        """Thresholds rule on one field from cumulative phase proportions"""
+        if thresholds is None:
+            thresholds = self.thresholds
+        return Thresholds(field, gaussian_quantiles(thresholds))
+
+    def compile_rule(self, rule, base_phase=0):
+        """Lithotype image for a parametric rule at the current lithotype size"""
+        return compile_rule(
+            rule, self.lithotype_axes(self.lithotypes.shape), base_phase
+        )
+
+    def simulate_rule(self, rule):
+        """Realisation for a parametric rule
+
+        Simple Thresholds rules are evaluated directly on the fields with
+        np.digitize, so no lithotype image is involved, and so are truncation
+        trees over more than two fields, one vectorised pass per tree level.
+        Other rules are compiled to a lithotype image and mapped as usual.
+        """
+        num_fields = rule_fields(rule)
+        if num_fields > len(self.srfs):
+            raise ValueError(f"Rule reads {num_fields} fields, the engine has {len(self.srfs)}")
+        multi_field = num_fields > NUM_FIELDS_MIN
+        if not multi_field and (not isinstance(rule, Thresholds) or len(self.hard_data)):
+            # Conditioning needs the lithotype image for admissible regions
+            self.update_lithotypes(self.compile_rule(rule))
+            return self.simulate()
+
+        if isinstance(rule, Thresholds):
+            key = (("thresholds", rule.field, tuple(rule.values)), self.field_generation)
+            fields = [self.fields()[rule.field]]
+            evaluate = lambda values: rule.evaluate(values[0])
+        else:
+            tree = TruncationTree(rule)
+            key = (tree.key(), self.field_generation)
+            fields = self.fields()[: tree.num_fields]
+            evaluate = tree.evaluate
+        self.last_key = key
+        self.conditioning_error = None
+        if len(self.hard_data):
+            # Admissible regions only exist in the two-field lithotype image
+            self.conditioning_error = (
+                "Hard data are not honoured by rules on more than two fields"
+            )
+        p_field = self.cache.get(key)
+        if p_field is not None:
+            return p_field
+
+        with instruments.timer("engine.simulate_rule"):
+            if self.is_tiled():
+                result = TiledArray(self.grid_shape, np.uint8)
+                for block in result.tiles():
+                    result[block] = evaluate([field[block] for field in fields])
+                p_field = result.data
+            else:
+                p_field = evaluate(fields).astype(int)
+
+        self.cache.put(key, p_field)
+        return p_field
+
+    def _kriging_systems(self):
+        """Factorised data covariance of each field of the lithotype pair
+
+        Reused while the data and that field's model are unchanged; fields
+        with the same spec share one system.
+        """
+        systems = []
+        for model, spec in zip(self.models[:2], self.field_specs):
+            len_scale = tuple(self._model_len_scale(spec.scale))
+            key = (self.hard_data.key, spec.model, len_scale, self.grid_shape)
+            system = self.kriging_cache.get(key)
+            if system is None:
+                with instruments.timer("engine.kriging_factorise"):
+                    system = KrigingSystem(model, self.coords, self.hard_data.indices())
+                self.kriging_cache.put(key, system)
+            systems.append(system)
+        return systems
+
+    def _simulate_conditional(self):
+        """Realisation honouring the hard data
+
+        Gaussian values at the data points are drawn with a Gibbs sampler
+        from the regions of the lithotype image holding each observed phase,
+        then both fields are conditioned to them by simple kriging of the
+        residuals and mapped through the lithotype image block by block.
+        """
+        indices = self.hard_data.indices()
+        phases = self.hard_data.phases()
+        systems = self._kriging_systems()
+        lithotypes = np.asarray(self.lithotypes).astype(np.uint8)
+        axes = self.lithotype_axes(lithotypes.shape)
+
+        # Seeded by the fields and the data, so a cached key stays reproducible
+        rng = np.random.default_rng([*self.seeds, int(self.hard_data.key[:8], 16)])
+        with instruments.timer("engine.gibbs"):
+            values = gibbs_sample(systems, phases, lithotypes, axes, rng)
+
+        fields = [np.asarray(field) for field in (self.field1, self.field2)]
+        observed = np.array([field[tuple(indices.T)] for field in fields])
+        residuals = values - observed
+        if systems[0] is systems[1]:
+            # One factorisation krigs both fields together
+            blocks = systems[0].corrections(systems[0].weights(residuals.T))
+        else:
+            per_field = [
+                system.corrections(system.weights(residuals[field])[:, None])
+                for field, system in enumerate(systems)
+            ]
+            blocks = (
+                (cells, np.concatenate([first, second]))
+                for (cells, first), (_, second) in zip(*per_field)
+            )
+
+        flat = [field.reshape(-1) for field in fields]
+        if self.is_tiled():
+            result = TiledArray(self.grid_shape, np.uint8).data
+        else:
+            result = np.empty(self.grid_shape, dtype=int)
+        out = result.reshape(-1)
+        for block, corrections in blocks:
+            rows = lithotype_index(flat[0][block] + corrections[0], axes[0])
+            cols = lithotype_index(flat[1][block] + corrections[1], axes[1])
+            out[block] = lithotypes[rows, cols]
+
+        # Kriging with a nugget reproduces the data only to ~1e-6
+        result[tuple(indices.T)] = phases
+        return result
+
+    def _generate_tiled(self, srf, seed):
+        """Generate a field block by block, returning it with its (min, max, mean)"""
+        field = TiledArray(self.grid_shape, np.float32)
+        low, high, total = np.inf, -np.inf, 0.0
+
+        for block in field.tiles():
+            # The randomisation method is evaluated pointwise, so a fixed seed
+            # gives exactly the same values as generating the whole grid at once
+            coords = [axis[part] for axis, part in zip(self.coords, block)]
+            tile = srf.structured(coords, seed=seed)
+            field[block] = tile
+            low = min(low, tile.min())
+            high = max(high, tile.max())
+            total += tile.sum()
+
+        return field, (low, high, total / field.data.size)
+
+    def lithotype_axes(self, lithotypes_shape):
+        """Lithotype axes in field-value space, matching gs.PGS.calc_lithotype_axes"""
+        pos_lith = []
+        for d, (low, high, mean) in enumerate(self.field_stats):
+            l = np.floor(low) - 1
+            h = np.ceil(high) + 1
+            m = (h + l) / 2.0
+            dist = max(np.abs(h - m), np.abs(l - m))
+            pos_lith.append(np.linspace(mean - dist, mean + dist, lithotypes_shape[d]))
+        return pos_lith
+
+    def field_histogram(self):
+        """Grid cells per lithotype cell for the current fields, cached"""
+        key = (self.field_generation, self.lithotypes.shape)
+        if self.histogram_key != key:
+            axes = self.lithotype_axes(self.lithotypes.shape)
+            # Tiled fields are read tile by tile, like when they are mapped
+            blocks = self.field1.tiles() if self.is_tiled() else None
+            self.histogram = field_histogram(self.field1, self.field2, axes, blocks)
+            self.histogram_key = key
+        return self.histogram
+
+    def drop_histogram(self):
+        """Free the cached field histogram; False when there is none"""
+        if self.histogram is None:
+            return False
+        self.histogram = None
+        self.histogram_key = None
+        return True
+
+    def prefetch_deformation(self, seeds=None):
+        """Draw the field pair gradual deformation moves towards
+
+        The current fields are kept; seeds are (seed1, seed2) or fresh.
+        """
+        if seeds is None:
+            seeds = (np.random.randint(0, 1E6), np.random.randint(0, 1E6))
+        self.deformation_seeds = tuple(int(seed) for seed in seeds)
+        with instruments.timer("engine.prefetch_deformation"):
+            if self.is_tiled():
+                self.deformation_fields = [
+                    self._generate_tiled(srf, seed)[0]
+                    for srf, seed in zip(self.srfs, self.deformation_seeds)
+                ]
+            else:
+                self.deformation_fields = [
+                    srf.structured(self.coords, seed=seed)
+                    for srf, seed in zip(self.srfs, self.deformation_seeds)
+                ]
+
+    def drop_deformation(self):
+        """Free the prefetched deformation fields; False when there are none"""
+        if self.deformation_fields is None:
+            return False
+        self.deformation_fields = None
+        self.deformation_seeds = None
+        return True
+
+    def deform(self, angle):
+        """Realisation of the fields cos(angle)·A + sin(angle)·B
+
+        A is the current field pair and B the prefetched one, drawn on first
+        use. Independent standard Gaussian fields combine into a standard
+        Gaussian field with the same covariance, so every angle gives a valid
+        realisation: angle 0 gives the current one, pi / 2 one of B alone. A frame
+        costs a linear combination and the lithotype lookup, and is not cached
+        or conditioned on hard data.
+        """
+        if self.deformation_fields is None:
+            self.prefetch_deformation()
+        lithotypes = np.asarray(self.lithotypes).astype(np.uint8)
+        axis1, axis2 = self.lithotype_axes(lithotypes.shape)
+        weight_a, weight_b = np.float32(np.cos(angle)), np.float32(np.sin(angle))
+        field1_b, field2_b = self.deformation_fields
+
+        self.last_key = (
+            lithotype_hash(lithotypes),
+            self.field_generation,
+            ("deformation", self.deformation_seeds, float(angle)),
+        )
+        self.conditioning_error = None
+        if len(self.hard_data):
+            self.conditioning_error = "Deformation frames are not conditioned on hard data"
+
+        def lookup(field1, field2, field1_b, field2_b):
+            rows = lithotype_index(weight_a * field1 + weight_b * field1_b, axis1)
+            cols = lithotype_index(weight_a * field2 + weight_b * field2_b, axis2)
+            return lithotypes[rows, cols]
+
+        with instruments.timer("engine.deform"):
+            if not self.is_tiled():
+                return lookup(self.field1, self.field2, field1_b, field2_b).astype(int)
+            result = TiledArray(self.grid_shape, np.uint8)
+            for block in result.tiles():
+                result[block] = lookup(
+                    self.field1[block], self.field2[block], field1_b[block], field2_b[block]
+                )
+            return result.data
+
+    def phase_proportions(self, p_field):
+        """Share of the grid taken by each phase in a realisation"""
+        # Blocks along the first axis keep memory-mapped realisations paged
+        counts = np.zeros(self.num_phases)
+        step = max(1, TILE_SIZE**2 // max(1, p_field[0].size))
+        for start in range(0, len(p_field), step):
+            counts += np.bincount(
+                np.ravel(p_field[start : start + step]), minlength=self.num_phases
+            )[: self.num_phases]
+        return counts / counts.sum()
+
+    def tune_lithotypes(self, targets):
+        """Lithotype image moved towards target phase proportions
+
+        Returns (lithotypes, predicted proportions, iterations, converged);
+        the engine's own lithotype image is left unchanged.
+        """
+        with instruments.timer("engine.tune_lithotypes"):
+            return tune_lithotypes(
+                np.asarray(self.lithotypes, dtype=int), self.field_histogram(), targets
+            )
+
+    def _simulate_tiled(self):
+        """Map the tiled fields through the lithotype image into a uint8 realisation
+
+        The 2D lithotype rule applies unchanged to 3D field pairs, since it only
+        depends on the two field values at each cell.
+        """
+        lithotypes = np.asarray(self.lithotypes).astype(np.uint8)
+        axis1, axis2 = self.lithotype_axes(lithotypes.shape)
+        result = TiledArray(self.grid_shape, np.uint8)
+
+        for block in result.tiles():
+            rows_lith = np.digitize(self.field1[block], axis1)
+            cols_lith = np.digitize(self.field2[block], axis2)
+            result[block] = lithotypes[rows_lith, cols_lith]
+
+        return result.data
@@ -0,0 +1,73 @@
+import tempfile
+import numpy as np
+
+# Constants
+TILE_SIZE = 512  # Side length of the square tiles used for generation and mapping
+MEMMAP_THRESHOLD = 2048 * 2048  # Arrays with more cells than this go to disk
+
+
+class TiledArray:
+    """2D or 3D array processed in blocks, optionally backed by a memory-mapped file
+
+    2D arrays are split into square tiles. 3D (nz, ny, nx) arrays are chunked
+    along z, several slices per block when the slices are small.
+    """
+
+    def __init__(self, shape, dtype, tile_size=TILE_SIZE, memmap=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.tile_size = tile_size
+
+        if memmap is None:
+            memmap = int(np.prod(self.shape)) > MEMMAP_THRESHOLD
+        self.memmap = memmap
+
+        if memmap:
+            # Anonymous temporary file, removed by the OS once the map is released
+            self.data = np.memmap(
+                tempfile.TemporaryFile(), dtype=self.dtype, mode="w+", shape=self.shape
+            )
+        else:
+            self.data = np.zeros(self.shape, dtype=self.dtype)
+
+    def tiles(self):
+        """Yield tuples of slices, one per axis, covering the whole array"""
+        if len(self.shape) == 2:
+            yield from self._tiles_2d(self.shape)
+            return
+
+        depth, rows, cols = self.shape
+        if rows * cols >= self.tile_size**2:
+            # Large slices: tile every z-slice on its own
+            for z in range(depth):
+                for tile in self._tiles_2d((rows, cols)):
+                    yield (slice(z, z + 1),) + tile
+        else:
+            # Small slices: group consecutive z-slices into one chunk
+            step = self.tile_size**2 // (rows * cols)
+            for z in range(0, depth, step):
+                yield (slice(z, min(z + step, depth)), slice(None), slice(None))
+
+    def _tiles_2d(self, shape):
+        rows, cols = shape
+        for r in range(0, rows, self.tile_size):
+            for c in range(0, cols, self.tile_size):
+                yield (
+                    slice(r, min(r + self.tile_size, rows)),
+                    slice(c, min(c + self.tile_size, cols)),
+                )
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return np.asarray(self.data)
+        return np.asarray(self.data, dtype=dtype)
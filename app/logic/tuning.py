@@ -0,0 +1,144 @@
+import numpy as np
+
+from app.logic.conditioning import lithotype_index
+
+# Constants
+TUNING_TOLERANCE = 0.005  # Largest allowed |target - proportion| per phase
+TUNING_ITERATIONS_MAX = 500
+FLOW_FRACTION = 0.25  # Share of a phase pair's deficit difference moved per iteration
+
+
+def field_histogram(field1, field2, axes, blocks=None):
+    """Number of grid cells whose field pair falls in each lithotype cell
+
+    Mapping the fields through any lithotype image then gives phase counts
+    as a weighted bincount over the image, independent of the grid size.
+    blocks optionally iterates the fields in parts (for tiled fields).
+    """
+    shape = (len(axes[0]), len(axes[1]))
+    histogram = np.zeros(shape[0] * shape[1])
+    for block in blocks if blocks is not None else [Ellipsis]:
+        rows = lithotype_index(np.asarray(field1[block]), axes[0])
+        cols = lithotype_index(np.asarray(field2[block]), axes[1])
+        histogram += np.bincount(
+            (rows * shape[1] + cols).ravel(), minlength=histogram.size
+        )
+    return histogram.reshape(shape)
+
+
+def lithotype_proportions(lithotypes, histogram, num_phases):
+    """Phase proportions a lithotype image gives for a field histogram"""
+    counts = np.bincount(
+        np.asarray(lithotypes, dtype=np.intp).ravel(),
+        weights=histogram.ravel(),
+        minlength=num_phases,
+    )
+    return counts[:num_phases] / histogram.sum()
+
+
+def _neighbours(grid):
+    """The four edge-padded neighbour grids, so borders see their own phase"""
+    padded = np.pad(grid, 1, mode="edge")
+    return (padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:])
+
+
+def tune_lithotypes(
+    lithotypes,
+    histogram,
+    targets,
+    tolerance=TUNING_TOLERANCE,
+    max_iterations=TUNING_ITERATIONS_MAX,
+):
+    """Move phase boundaries in the lithotype image towards target proportions
+
+    Mass flows down the deficit gradient like diffusion: each iteration hands
+    boundary cells that carry field mass to the neighbouring phase with the
+    largest deficit relative to their own, at most FLOW_FRACTION of the
+    difference per phase pair. Phases on target between a surplus and a
+    deficit pass mass along, so regions need not touch. Phases missing from
+    the image are seeded at the heaviest cell of the largest surplus.
+
+    Returns (lithotypes, proportions, iterations, converged); converged is
+    False when the image could not be brought within tolerance.
+    """
+    grid = np.asarray(lithotypes, dtype=np.intp).copy()
+    num_phases = len(targets)
+    targets = np.asarray(targets, dtype=float)
+    targets = targets / targets.sum()
+    weights = histogram.ravel() / histogram.sum()
+
+    # Cells without field mass never change the proportions; work on the
+    # bounding box of those with mass
+    rows = np.flatnonzero(histogram.any(axis=1))
+    cols = np.flatnonzero(histogram.any(axis=0))
+    window = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+    region = grid[window].copy()  # Contiguous, so flat below is a view
+    region_weights = (histogram[window] / histogram.sum()).reshape(-1)
+    flat = region.reshape(-1)
+    has_mass = region_weights > 0
+
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        proportions = np.bincount(flat, weights=region_weights, minlength=num_phases)
+        deficit = targets - proportions[:num_phases]
+        if np.abs(deficit).max() <= tolerance:
+            break
+
+        missing = np.flatnonzero((deficit > tolerance) & (proportions[:num_phases] == 0))
+        if missing.size:
+            surplus = -deficit
+            surplus[missing] = -np.inf
+            for phase in missing:
+                donor = surplus.argmax()
+                cell = np.argmax(np.where(flat == donor, region_weights, -1.0))
+                flat[cell] = phase
+                surplus[donor] -= region_weights[cell]
+            continue  # Seeded phases grow from the next iteration on
+
+        # Best neighbouring phase to hand each cell to
+        best_gain = np.zeros(region.shape)
+        best_phase = region.copy()
+        own_deficit = deficit[region]
+        for neighbour in _neighbours(region):
+            gain = deficit[neighbour] - own_deficit
+            better = gain > best_gain
+            best_gain[better] = gain[better]
+            best_phase[better] = neighbour[better]
+
+        # Out-of-tolerance phases trade down any gradient, so surplus chains
+        # drain fully; others only pass mass along steep enough gradients
+        gains = best_gain.reshape(-1)
+        outside = np.abs(deficit) > tolerance
+        moving = (gains > tolerance) | (
+            (gains > 0) & (outside[flat] | outside[best_phase.reshape(-1)])
+        )
+        # Cells without mass cost nothing, so boundaries cross empty
+        # stretches of the image instead of stalling in front of them
+        free = np.flatnonzero(moving & ~has_mass)
+        candidates = np.flatnonzero(moving & has_mass)
+        if candidates.size == 0 and free.size == 0:
+            break
+
+        # Heaviest cells first, so boundaries move where the field mass is
+        order = candidates[np.argsort(-region_weights[candidates], kind="stable")]
+        receiver = best_phase.reshape(-1)[order]
+        giver = flat[order]
+        mass = region_weights[order]
+
+        pair = giver * num_phases + receiver
+        accept = np.zeros(order.size, dtype=bool)
+        for key in np.unique(pair):
+            members = np.flatnonzero(pair == key)
+            limit = FLOW_FRACTION * gains[order[members[0]]]
+            cumulative = np.cumsum(mass[members])
+            accept[members[cumulative - mass[members] / 2 <= limit]] = True
+        if not accept.any() and free.size == 0:
+            break
+        flat[free] = best_phase.reshape(-1)[free]
+        flat[order[accept]] = receiver[accept]
+
+    grid[window] = region
+    proportions = np.bincount(grid.reshape(-1), weights=weights, minlength=num_phases)
+    proportions = proportions[:num_phases]
+    converged = bool(np.abs(targets - proportions).max() <= tolerance)
+    return grid, proportions, iteration, converged
@@ -0,0 +1,167 @@
+import base64
+import itertools
+import math
+import zlib
+import numpy as np
+
+from app.logic.cache import LRUCache
+
+# Constants
+RASTER_CACHE_SIZE = 8  # Rasters kept per layer, keyed by (op serial, width, height)
+
+_serials = itertools.count(1)
+
+
+class VectorOp:
+    """One recorded lithotype action, in the pixel space it was recorded in
+
+    kind is "stroke" (brush stamps at points), "fill" (flood fill from a
+    point), "clear" (whole grid to one phase) or "raster" (a grid image,
+    e.g. from a rule or an older project file). Ops are never mutated, so a
+    serial number identifies an op together with everything before it.
+    """
+
+    def __init__(self, kind, phase, size, points=(), shape="circle", brush=0, data=None):
+        self.kind = kind
+        self.phase = phase
+        self.size = size  # (width, height) of the grid the op was recorded on
+        self.points = tuple(points)  # (x, y) pixel positions
+        self.shape = shape
+        self.brush = brush  # Brush size in recorded pixels
+        self.data = data  # uint8 grid for raster ops
+        self.serial = next(_serials)
+
+    def to_dict(self):
+        op = {"kind": self.kind, "phase": self.phase, "size": list(self.size)}
+        if self.kind in ("stroke", "fill"):
+            # Flat coordinate list keeps long strokes compact in JSON
+            op["points"] = [int(v) for point in self.points for v in point]
+        if self.kind == "stroke":
+            op["shape"] = self.shape
+            op["brush"] = self.brush
+        if self.kind == "raster":
+            packed = zlib.compress(np.ascontiguousarray(self.data, np.uint8).tobytes())
+            op["data"] = base64.b64encode(packed).decode("ascii")
+        return op
+
+    def apply(self, grid):
+        """Replay this op onto grid (height, width) in place"""
+        _apply(grid, self)
+
+    @classmethod
+    def from_dict(cls, op):
+        size = tuple(op["size"])
+        flat = op.get("points", [])
+        points = list(zip(flat[0::2], flat[1::2]))
+        data = None
+        if op["kind"] == "raster":
+            raw = zlib.decompress(base64.b64decode(op["data"]))
+            data = np.frombuffer(raw, dtype=np.uint8).reshape(size[1], size[0])
+        return cls(
+            op["kind"],
+            op["phase"],
+            size,
+            points,
+            op.get("shape", "circle"),
+            op.get("brush", 0),
+            data,
+        )
+
+
+def _stamp_mask(shape, dx, dy, half_brush):
+    """Brush masks on (possibly fractional) offsets, as in CanvasWidget"""
+    if shape == "triangle":
+        height = int(half_brush * math.sqrt(3))
+        return (dy >= np.abs(dx) * math.sqrt(3) - height // 2) & (dy <= height // 2)
+    if shape == "square":
+        return (np.abs(dx) <= half_brush) & (np.abs(dy) <= half_brush)
+    return dx**2 + dy**2 <= half_brush**2
+
+
+def _apply(grid, op):
+    """Replay one op onto grid (height, width) in place"""
+    height, width = grid.shape
+    scale_x = width / op.size[0]
+    scale_y = height / op.size[1]
+
+    if op.kind == "clear":
+        grid.fill(op.phase)
+    elif op.kind == "raster":
+        # Nearest-neighbour resample of the recorded grid
+        rows = np.minimum((np.arange(height) / scale_y).astype(int), op.size[1] - 1)
+        cols = np.minimum((np.arange(width) / scale_x).astype(int), op.size[0] - 1)
+        grid[:] = op.data[rows[:, None], cols[None, :]]
+    elif op.kind == "fill":
+        from scipy import ndimage  # Deferred to keep startup fast
+
+        for x, y in op.points:
+            c = min(int(x * scale_x), width - 1)
+            r = min(int(y * scale_y), height - 1)
+            labels, _ = ndimage.label(grid == grid[r, c])
+            grid[labels == labels[r, c]] = op.phase
+    elif op.kind == "stroke":
+        half_brush = op.brush // 2
+        for x, y in op.points:
+            # Bounding box of the stamp in target pixels
+            left = max(0, math.floor((x - half_brush) * scale_x))
+            right = min(width, math.ceil((x + half_brush + 1) * scale_x))
+            top = max(0, math.floor((y - half_brush) * scale_y))
+            bottom = min(height, math.ceil((y + half_brush + 1) * scale_y))
+            if left >= right or top >= bottom:
+                continue
+            # Target pixel centres mapped back to recorded pixel coordinates;
+            # at the recorded size this is exactly the raster brush
+            dx = (np.arange(left, right) + 0.5) / scale_x - 0.5 - x
+            dy = (np.arange(top, bottom) + 0.5) / scale_y - 0.5 - y
+            mask = _stamp_mask(op.shape, dx[None, :], dy[:, None], half_brush)
+            grid[top:bottom, left:right][mask] = op.phase
+
+
+class VectorLayer:
+    """Lithotype described by recorded ops and rasterized on demand"""
+
+    def __init__(self):
+        self.ops = ()
+        self.raster_cache = LRUCache(RASTER_CACHE_SIZE)
+
+    def append(self, op):
+        self.ops = self.ops + (op,)
+
+    def snapshot(self):
+        """Cheap history entry: the op tuple is shared, never copied"""
+        return self.ops
+
+    def restore(self, snapshot):
+        self.ops = snapshot
+
+    def prime(self, grid):
+        """Cache an already-drawn raster for the current state"""
+        if self.ops:
+            height, width = grid.shape
+            self.raster_cache.put((self.ops[-1].serial, width, height), grid.copy())
+
+    def rasterize(self, width, height):
+        """Grid (height, width) for the current ops, replaying only uncached ops"""
+        start = 0
+        grid = np.zeros((height, width), dtype=int)
+        # Resume from the latest cached prefix
+        for i in range(len(self.ops) - 1, -1, -1):
+            cached = self.raster_cache.get((self.ops[i].serial, width, height))
+            if cached is not None:
+                grid = cached.copy()
+                start = i + 1
+                break
+
+        for op in self.ops[start:]:
+            _apply(grid, op)
+        self.prime(grid)
+        return grid
+
+    def to_dict(self):
+        return {"ops": [op.to_dict() for op in self.ops]}
+
+    @classmethod
+    def from_dict(cls, state):
+        layer = cls()
+        layer.ops = tuple(VectorOp.from_dict(op) for op in state["ops"])
+        return layer
@@ -1,15 +1,85 @@
+import time
+
+STARTUP_TIME = time.perf_counter()  # Taken first so imports are included
+
 import sys
 import os
 
 # Add project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.ui.main_window import MainWindow
 from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject, QEvent
+from app.ui.main_window import MainWindow
+from app.logic.memory import MEMORY_BUDGET_DEFAULT_MB
+from app.logic.service import EngineServiceError
+
+IMPORT_TIME = time.perf_counter()
+
+
+class StartupTimer(QObject):
+    """Report import, construction, first-paint and engine-ready times, then quit"""
+
+    def __init__(self, app, window, constructed_time):
+        super().__init__()
+        self.app = app
+        self.timings = [
+            ("import", IMPORT_TIME),
+            ("construction", constructed_time),
+        ]
+        self.painted = False
+        app.installEventFilter(self)
+        window.engineReady.connect(self.on_engine_ready)
+
+    def eventFilter(self, obj, event):
+        if not self.painted and event.type() == QEvent.Paint:
+            self.painted = True
+            self.timings.append(("first paint", time.perf_counter()))
+        return False
+
+    def on_engine_ready(self):
+        self.timings.append(("engine ready", time.perf_counter()))
+        previous = STARTUP_TIME
+        for name, stamp in self.timings:
+            print(
+                f"{name:>14}: {(stamp - previous) * 1000:8.1f} ms"
+                f"  (total {(stamp - STARTUP_TIME) * 1000:8.1f} ms)"
+            )
+            previous = stamp
+        self.app.quit()
+
+
+def report_engine_errors(window):
+    """Send engine service failures raised in Qt slots to the window
+
+    Other exceptions are printed as usual; with a custom hook set, PyQt no
+    longer aborts the application on an exception in a slot.
+    """
+
+    def excepthook(kind, error, traceback):
+        if isinstance(error, EngineServiceError):
+            window.report_engine_error(error)
+        else:
+            sys.__excepthook__(kind, error, traceback)
+
+    sys.excepthook = excepthook
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    window = MainWindow()
+    timing = "--startup-timing" in sys.argv
+    # --memory-budget=MB caps what this instance holds, e.g. on shared machines
+    budget = [a.split("=", 1)[1] for a in sys.argv if a.startswith("--memory-budget=")]
+    budget_mb = int(budget[-1]) if budget else MEMORY_BUDGET_DEFAULT_MB
+    # --engine-process simulates in a separate process, off the GUI's interpreter
+    engine_process = "--engine-process" in sys.argv
+    # Timing runs quit without closing the window, so they must not journal
+    window = MainWindow(
+        autosave=not timing, memory_budget_mb=budget_mb, engine_process=engine_process
+    )
+    report_engine_errors(window)
+    if timing:
+        startup_timer = StartupTimer(app, window, time.perf_counter())
     window.resize(1600, 600)  # Set initial window size
     window.show()
     sys.exit(app.exec_())
@@ -0,0 +1,207 @@
+import numpy as np
+from PyQt5.QtWidgets import (
+    QDialog,
+    QVBoxLayout,
+    QHBoxLayout,
+    QLabel,
+    QPushButton,
+    QSpinBox,
+    QProgressBar,
+    QTableWidget,
+    QTableWidgetItem,
+    QFileDialog,
+    QMessageBox,
+    QWidget,
+)
+from PyQt5.QtGui import QPainter, QColor, QIcon, QPen, QPixmap, QPolygonF
+from PyQt5.QtCore import Qt, QPointF, QRectF, pyqtSignal
+
+from app.logic.analysis import DIRECTIONS, write_analysis
+
+# Constants
+ENSEMBLE_SIZE_MAX = 1000
+PLOT_MARGIN = 48
+PLOT_BACKGROUND = QColor(140, 140, 140)  # Mid grey, so black and white phases show
+DIRECTION_STYLES = [Qt.SolidLine, Qt.DashLine, Qt.DotLine]  # x, y, z
+LINE_STYLE_NAMES = ["solid", "dashed", "dotted"]
+TABLE_COLUMNS = (
+    ["Share"]
+    + [f"Range {d.upper()}" for d in DIRECTIONS]
+    + ["Components", "Largest"]
+    + [f"Spans {d.upper()}" for d in DIRECTIONS]
+)
+
+
+class VariogramPlot(QWidget):
+    """Indicator variograms per phase, one line style per direction"""
+
+    def __init__(self, colors, parent=None):
+        super().__init__(parent)
+        self.colors = colors
+        self.lags = None
+        self.variograms = None
+        self.setMinimumSize(420, 260)
+
+    def set_data(self, lags, variograms):
+        self.lags = lags
+        self.variograms = variograms
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        area = QRectF(self.rect()).adjusted(PLOT_MARGIN, 8, -8, -PLOT_MARGIN)
+        painter.fillRect(area, PLOT_BACKGROUND)
+        if self.variograms is None:
+            return
+
+        lag_max = max(self.lags[-1], 1)
+        gamma_max = np.nanmax(self.variograms)
+        gamma_max = gamma_max if gamma_max > 0 else 1.0
+
+        # Axes labels: lag in cells along the bottom, gamma up the side
+        painter.setPen(self.palette().text().color())
+        painter.drawText(
+            QRectF(area.left(), area.bottom() + 4, area.width(), 16),
+            Qt.AlignCenter,
+            f"lag (cells), 0 - {lag_max}",
+        )
+        label_width = PLOT_MARGIN - 4
+        painter.drawText(
+            QRectF(0, area.top(), label_width, 16), Qt.AlignRight, f"{gamma_max:.2f}"
+        )
+        painter.drawText(QRectF(0, area.bottom() - 16, label_width, 16), Qt.AlignRight, "0")
+        directions = self.variograms.shape[1]
+        legend = ", ".join(
+            f"{name}: {style}"
+            for name, style in zip(DIRECTIONS[:directions], LINE_STYLE_NAMES)
+        )
+        painter.drawText(
+            QRectF(area.left(), area.bottom() + 18, area.width(), 16), Qt.AlignCenter, legend
+        )
+
+        for phase, curves in enumerate(self.variograms):
+            for d, gamma in enumerate(curves):
+                valid = np.isfinite(gamma)
+                if not valid.any():
+                    continue
+                xs = area.left() + area.width() * self.lags[valid] / lag_max
+                ys = area.bottom() - area.height() * gamma[valid] / gamma_max
+                pen = QPen(QColor(self.colors[phase]), 1.5, DIRECTION_STYLES[d])
+                painter.setPen(pen)
+                painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in zip(xs, ys)]))
+
+
+class AnalysisPanel(QDialog):
+    """Indicator variograms and connectivity of the realisation or an ensemble"""
+
+    analyseRequested = pyqtSignal(int)  # number of new realisations to add
+    cancelRequested = pyqtSignal()
+
+    def __init__(self, colors, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Realisation Analysis")
+        self.summary = None
+        layout = QVBoxLayout(self)
+
+        run_layout = QHBoxLayout()
+        run_layout.addWidget(QLabel("New realisations:"))
+        self.ensemble_spinbox = QSpinBox()
+        self.ensemble_spinbox.setToolTip(
+            "Also simulate and analyse this many realisations with new random "
+            "fields; results are averaged with the current realisation."
+        )
+        self.ensemble_spinbox.setRange(0, ENSEMBLE_SIZE_MAX)
+        run_layout.addWidget(self.ensemble_spinbox)
+        self.analyse_button = QPushButton("Analyse")
+        self.analyse_button.clicked.connect(
+            lambda: self.analyseRequested.emit(self.ensemble_spinbox.value())
+        )
+        run_layout.addWidget(self.analyse_button)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancelRequested)
+        run_layout.addWidget(self.cancel_button)
+        layout.addLayout(run_layout)
+
+        self.progress_bar = QProgressBar()
+        layout.addWidget(self.progress_bar)
+        self.status_label = QLabel("")
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        self.plot = VariogramPlot(colors)
+        layout.addWidget(self.plot)
+
+        self.table = QTableWidget(len(colors), len(TABLE_COLUMNS))
+        self.table.setHorizontalHeaderLabels(TABLE_COLUMNS)
+        self.table.setVerticalHeaderLabels([f"Phase {i}" for i in range(len(colors))])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        for phase, color in enumerate(colors):
+            pixmap = QPixmap(12, 12)
+            pixmap.fill(QColor(color))
+            self.table.verticalHeaderItem(phase).setIcon(QIcon(pixmap))
+        # Room for every phase without scrolling
+        header = self.table.horizontalHeader().sizeHint().height()
+        rows = self.table.verticalHeader().defaultSectionSize() * len(colors)
+        self.table.setMinimumHeight(header + rows + 2 * self.table.frameWidth() + 20)
+        layout.addWidget(self.table)
+
+        self.export_button = QPushButton("Export...")
+        self.export_button.setToolTip(
+            "Save the statistics as JSON and the variograms as CSV."
+        )
+        self.export_button.clicked.connect(self._export)
+        layout.addWidget(self.export_button)
+        self.set_running(False)
+
+    def set_running(self, running):
+        self.analyse_button.setEnabled(not running)
+        self.cancel_button.setEnabled(running)
+        self.export_button.setEnabled(not running and self.summary is not None)
+        if not running:
+            self.progress_bar.reset()
+
+    def set_progress(self, percent, label):
+        self.progress_bar.setValue(percent)
+        self.status_label.setText(f"Analysing {label}...")
+
+    def show_summary(self, summary):
+        self.summary = summary
+        members = summary["members"]
+        self.status_label.setText(
+            f"{members} realisation{'' if members == 1 else 's'}; shares and ranges "
+            "are means, spans the share of realisations that percolate"
+        )
+        self.plot.set_data(summary["lags"], summary["variograms"])
+
+        directions = summary["variograms"].shape[1]
+        for phase in range(self.table.rowCount()):
+            cells = [f"{100 * summary['proportions'][phase]:.1f}%"]
+            for d in range(len(DIRECTIONS)):
+                value = summary["ranges"][phase, d] if d < directions else np.nan
+                cells.append(f"{value:.1f}" if np.isfinite(value) else "-")
+            cells.append(f"{summary['component_count'][phase]:.1f}")
+            cells.append(f"{100 * summary['largest_fraction'][phase]:.0f}%")
+            for d in range(len(DIRECTIONS)):
+                if d < directions:
+                    cells.append(f"{100 * summary['percolation_probability'][phase, d]:.0f}%")
+                else:
+                    cells.append("-")
+            for column, text in enumerate(cells):
+                self.table.setItem(phase, column, QTableWidgetItem(text))
+        self.table.resizeColumnsToContents()
+        self.set_running(False)
+
+    def _export(self):
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Export Analysis", "analysis.json", "JSON Files (*.json)"
+        )
+        if not filename:
+            return
+        base_path = filename[: -len(".json")] if filename.endswith(".json") else filename
+        try:
+            paths = write_analysis(self.summary, base_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to export analysis: {e}")
+            return
+        QMessageBox.information(self, "Success", "Exported:\n" + "\n".join(paths))
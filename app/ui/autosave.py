@@ -0,0 +1,103 @@
+import glob
+import os
+from PyQt5.QtCore import QLockFile, QObject, QStandardPaths
+
+from app.logic.journal import Journal
+
+# Constants
+AUTOSAVE_DIR_NAME = "interactive-pgs"
+JOURNAL_FILE_PATTERN = "autosave-{}.journal"  # One journal per running instance
+
+
+def journal_dir():
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericDataLocation)
+    return os.path.join(base, AUTOSAVE_DIR_NAME)
+
+
+def journal_path():
+    return os.path.join(journal_dir(), JOURNAL_FILE_PATTERN.format(os.getpid()))
+
+
+def claim_orphaned_journal(directory=None):
+    """(path, lock) of the newest journal no running instance holds, or None
+
+    Each instance locks its journal while it runs; QLockFile treats the lock
+    of an instance that crashed as stale, so only abandoned journals can be
+    claimed. The caller unlocks once it has recovered or discarded it.
+    """
+    pattern = os.path.join(directory or journal_dir(), JOURNAL_FILE_PATTERN.format("*"))
+    for path in sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True):
+        lock = QLockFile(path + ".lock")
+        if lock.tryLock(0):
+            return path, lock
+    return None
+
+
+class Autosave(QObject):
+    """Journal every completed action of a MainWindow for crash recovery
+
+    Slots run after the window's own handlers, so each sync sees the state
+    the action produced and journals only what changed.
+    """
+
+    def __init__(self, window, path=None):
+        super().__init__(window)
+        self.window = window
+        self.journal = Journal(path or journal_path())
+        os.makedirs(os.path.dirname(self.journal.path) or ".", exist_ok=True)
+        # Held until a clean exit, so other instances leave this journal alone
+        self.lock = QLockFile(self.journal.path + ".lock")
+        self.lock.tryLock(0)
+
+        canvas = window.l_canvas_widget
+        controls = window.controls_widget
+        canvas.actionFinished.connect(self._on_action)
+        canvas.strokeFinished.connect(self.sync)
+        for signal in (
+            controls.regenerate,
+            controls.clearLithotype,
+            controls.updateParameters,
+            controls.undoRequested,
+            controls.redoRequested,
+            controls.resetToDefaults,
+            controls.applyThresholds,
+            controls.tuneProportions,
+            controls.clearHardData,
+            window.p_canvas_widget.cellClicked,
+        ):
+            signal.connect(self.sync)
+
+    def start(self):
+        """Replace any previous journal with a snapshot of the current state"""
+        engine = self.window.simulation_engine
+        self.journal.start(
+            self.window.l_canvas_widget.grid,
+            self.window.engine_parameters(),
+            engine.seeds,
+            engine.hard_data.to_list(),
+            [spec.to_dict() for spec in engine.field_specs],
+        )
+
+    def is_active(self):
+        return self.journal.file is not None
+
+    def _on_action(self, op):
+        # Fills are journaled by their seed point instead of the changed area
+        if op.kind == "fill" and self.is_active():
+            x, y = op.points[0]
+            self.journal.record_fill(x, y, op.phase, self.window.l_canvas_widget.grid)
+
+    def sync(self, *_args):
+        if not self.is_active():
+            return
+        engine = self.window.simulation_engine
+        self.journal.record_parameters(self.window.engine_parameters())
+        self.journal.record_seeds(engine.seeds)
+        self.journal.record_hard_data(engine.hard_data.to_list())
+        self.journal.record_field_specs([spec.to_dict() for spec in engine.field_specs])
+        self.journal.record_grid(self.window.l_canvas_widget.grid)
+
+    def close(self):
+        """Stop journaling after a clean exit; nothing is left to recover"""
+        self.journal.close(discard=True)
+        self.lock.unlock()
@@ -1,12 +1,22 @@
 from PyQt5.QtWidgets import QWidget, QApplication
 from PyQt5.QtGui import QImage, QPainter, QColor, QPen, QPolygon
-from PyQt5.QtCore import Qt, QSize, pyqtSignal, QPoint, QRect
+from PyQt5.QtCore import Qt, QSize, pyqtSignal, QPoint, QRect, QTimer
 import numpy as np
 import math
+import time
+
+from app.logic.instrumentation import instruments
+from app.logic.vector import VectorLayer, VectorOp
+from app.ui.rendering import phase_image
+
+# Constants
+FRAME_INTERVAL_MS = 16  # Queued input is processed at most once per ~60 Hz frame
 
 
 class CanvasWidget(QWidget):
     strokeFinished = pyqtSignal(np.ndarray)
+    actionFinished = pyqtSignal(object)  # VectorOp describing a stroke or fill
+    historyStepped = pyqtSignal(str)  # "undo" or "redo" from the keyboard
 
     COLORS = [
         QColor(0, 0, 0),  # Phase 0 - Black
@@ -36,6 +46,12 @@ class CanvasWidget(QWidget):
         self.history_index = 0
         self.max_history = 20  # Limit history to prevent memory issues
 
+        # Optional shape-based record of the lithotype; history then holds
+        # op tuples instead of grid copies
+        self.vector_layer = None
+        self.preview_op = None  # Raster op of a preview not yet saved to history
+        self.stroke_points = []  # Stamp positions of the stroke in progress
+
         self.target_rect = QRect()
 
         self.setMinimumSize(200, 200)
@@ -45,6 +61,21 @@ class CanvasWidget(QWidget):
         # Brush preview
         self.mouse_pos = QPoint(-1, -1)  # Track mouse position
         self.show_preview = False
+        self.preview_rect = QRect()  # Widget area covered by the last preview
+
+        # Frame scheduler: input is queued and handled once per frame
+        self.pending_points = []  # Image coordinates of stamps not yet applied
+        self.pending_events = 0
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.setInterval(FRAME_INTERVAL_MS)
+        self.frame_timer.timeout.connect(self.process_frame)
+
+        # Counters for tuning the scheduler
+        self.frame_count = 0
+        self.event_count = 0
+        self.last_frame_time = 0.0  # Seconds spent in the last processed frame
+        self.last_frame_events = 0  # Input events coalesced into the last frame
 
     def set_brush_size(self, size):
         self.brush_size = size
@@ -58,13 +89,92 @@ class CanvasWidget(QWidget):
     def set_phase(self, phase):
         self.current_phase = phase
 
+    def set_vector_mode(self, enabled):
+        """Start or stop recording actions as vector ops, seeded from the grid
+
+        The undo history is kept: grids become single raster ops when vector
+        mode starts, and op lists are rasterized when it stops. The switch
+        itself is not an undo step.
+        """
+        if enabled == (self.vector_layer is not None):
+            return
+        if enabled:
+            self.history = [(self._raster_op(grid),) for grid in self.history]
+            self.vector_layer = VectorLayer()
+            self.record_raster()
+        else:
+            history = []
+            for entry in self.history:
+                self.vector_layer.restore(entry)
+                history.append(self.vector_layer.rasterize(*self._grid_size()))
+            self.history = history
+            self.vector_layer = None
+            self.preview_op = None
+
+    def _record(self, op):
+        if self.vector_layer is not None:
+            self.vector_layer.append(op)
+            self.vector_layer.prime(self.grid)
+        if op.kind in ("stroke", "fill"):
+            self.actionFinished.emit(op)
+
+    def _grid_size(self):
+        return (self.grid.shape[1], self.grid.shape[0])
+
+    @staticmethod
+    def _raster_op(grid):
+        return VectorOp("raster", 0, (grid.shape[1], grid.shape[0]), data=grid.astype(np.uint8))
+
+    def record_raster(self):
+        """Record the current grid as-is, e.g. after applying a rule"""
+        self._record(self._raster_op(self.grid))
+
+    def record_preview(self):
+        """Record a previewed grid, replacing the op of an unsaved preview before it
+
+        Dragging a threshold slider thus leaves one raster op, not one per step.
+        """
+        if self.vector_layer is None:
+            return
+        ops = self.vector_layer.ops
+        if ops and ops[-1] is self.preview_op:
+            self.vector_layer.restore(ops[:-1])
+        self.record_raster()
+        self.preview_op = self.vector_layer.ops[-1]
+
+    def record_clear(self, phase=0):
+        self._record(VectorOp("clear", phase, self._grid_size()))
+
+    def rasterize(self, width, height):
+        """Redraw the grid at a new size from the vector layer"""
+        self.set_data(self.vector_layer.rasterize(width, height))
+
+    def _snapshot(self):
+        if self.vector_layer is not None:
+            return self.vector_layer.snapshot()
+        return self.grid.copy()
+
+    def _restore(self, entry):
+        if self.vector_layer is not None:
+            self.vector_layer.restore(entry)
+            self.set_data(self.vector_layer.rasterize(*self._grid_size()))
+        else:
+            self.grid = entry.copy()
+            self.set_data(self.grid)
+
+    def reset_history(self):
+        """Make the current grid the only history entry"""
+        self.history = [self._snapshot()]
+        self.history_index = 0
+
     def save_state(self):
         """Save current grid state to history after an action is completed"""
+        self.preview_op = None  # A saved preview is kept by later previews
         # Remove any states after current index (when user made changes after undo)
         self.history = self.history[: self.history_index + 1]
 
         # Add the new state (current grid after the action)
-        self.history.append(self.grid.copy())
+        self.history.append(self._snapshot())
         self.history_index = len(self.history) - 1
 
         # Limit history size
@@ -72,12 +182,25 @@ class CanvasWidget(QWidget):
             self.history.pop(0)
             self.history_index -= 1
 
+    def trim_history(self):
+        """Drop the oldest undo entry, or else the furthest redo entry
+
+        The current state always stays. Returns False when nothing is left to drop.
+        """
+        if self.history_index > 0:
+            self.history.pop(0)
+            self.history_index -= 1
+            return True
+        if len(self.history) > 1:
+            self.history.pop()
+            return True
+        return False
+
     def undo(self):
         """Undo last operation"""
         if self.history_index > 0:
             self.history_index -= 1
-            self.grid = self.history[self.history_index].copy()
-            self.set_data(self.grid)
+            self._restore(self.history[self.history_index])
             return True
         return False
 
@@ -85,8 +208,7 @@ class CanvasWidget(QWidget):
         """Redo last undone operation"""
         if self.history_index < len(self.history) - 1:
             self.history_index += 1
-            self.grid = self.history[self.history_index].copy()
-            self.set_data(self.grid)
+            self._restore(self.history[self.history_index])
             return True
         return False
 
@@ -98,16 +220,6 @@ class CanvasWidget(QWidget):
         """Check if redo is possible"""
         return self.history_index < len(self.history) - 1
 
-    def _create_triangle_polygon(self, center_x, center_y, half_brush):
-        """Create equilateral triangle polygon centered at given coordinates"""
-        height = int(half_brush * math.sqrt(3))
-        points = [
-            QPoint(center_x, center_y - height // 2),  # Top vertex
-            QPoint(center_x - half_brush, center_y + height // 2),  # Bottom left
-            QPoint(center_x + half_brush, center_y + height // 2),  # Bottom right
-        ]
-        return QPolygon(points)
-
     def _create_triangle_mask(self, x_coords, y_coords, half_brush):
         """Create equilateral triangle mask for brush operations"""
         height = int(half_brush * math.sqrt(3))
@@ -127,6 +239,7 @@ class CanvasWidget(QWidget):
         self.target_rect.moveCenter(widget_rect.center())
 
         painter.drawImage(self.target_rect, self.image, self.image.rect())
+        instruments.mark_painted()
 
         # Draw brush preview
         if self.show_preview and self.current_tool == "brush" and not self.drawing:
@@ -136,13 +249,12 @@ class CanvasWidget(QWidget):
         if event.button() == Qt.LeftButton and self.target_rect.contains(event.pos()):
             ix, iy = self.map_widget_to_image_coords(event.pos())
             if self.current_tool == "fill":
-                self._flood_fill(iy, ix, self.grid[iy, ix], self.current_phase)
-                # Save state after fill operation is complete
-                self.save_state()
-                self.strokeFinished.emit(self.grid)
+                self.perform_fill(ix, iy)
             elif self.current_tool == "brush":
                 self.drawing = True
-                self.draw_at_pos(event.pos())
+                self.stroke_points = []
+                self.pending_points.append((ix, iy))
+                self.schedule_frame()
 
     def mouseMoveEvent(self, event):
         # Update mouse position for brush preview
@@ -150,28 +262,64 @@ class CanvasWidget(QWidget):
             self.mouse_pos = event.pos()
             self.show_preview = True
             if self.drawing:
-                self.draw_at_pos(event.pos())
+                self.pending_points.append(self.map_widget_to_image_coords(event.pos()))
         else:
             self.show_preview = False
-        self.update()  # Trigger repaint for preview
+        self.schedule_frame()  # Repaint for preview on the next frame
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton and self.drawing:
-            self.drawing = False
-            # Save state after brush stroke is complete
-            self.save_state()
-            self.strokeFinished.emit(self.grid)
+            # Apply any stamps still queued before the stroke is recorded
+            self.process_frame()
+            self._finish_stroke()
+
+    def perform_fill(self, ix, iy):
+        """Flood fill from image coordinates as a complete, undoable action"""
+        with instruments.timer("canvas.flood_fill"):
+            self._flood_fill(iy, ix, self.grid[iy, ix], self.current_phase)
+        self._record(
+            VectorOp("fill", self.current_phase, self._grid_size(), [(ix, iy)])
+        )
+        # Save state after fill operation is complete
+        self.save_state()
+        self.strokeFinished.emit(self.grid)
+
+    def perform_stroke(self, points):
+        """Draw a whole stroke through image coordinates, as on mouse release"""
+        self.drawing = True
+        self.stroke_points = []
+        self.pending_points = list(points)
+        self.process_frame()
+        self._finish_stroke()
+
+    def _finish_stroke(self):
+        self.drawing = False
+        self._record(
+            VectorOp(
+                "stroke",
+                self.current_phase,
+                self._grid_size(),
+                self.stroke_points,
+                self.brush_shape,
+                self.brush_size,
+            )
+        )
+        # Save state after brush stroke is complete
+        self.save_state()
+        self.strokeFinished.emit(self.grid)
 
     def keyPressEvent(self, event):
         """Handle keyboard shortcuts for undo/redo"""
         if event.modifiers() & Qt.ControlModifier:
             if event.key() == Qt.Key_Z:
                 if self.undo():
+                    self.historyStepped.emit("undo")
                     self.strokeFinished.emit(self.grid)
                 event.accept()
                 return
             elif event.key() == Qt.Key_Y:
                 if self.redo():
+                    self.historyStepped.emit("redo")
                     self.strokeFinished.emit(self.grid)
                 event.accept()
                 return
@@ -187,6 +335,68 @@ class CanvasWidget(QWidget):
         self.show_preview = False
         self.update()
 
+    def schedule_frame(self):
+        """Queue one input event; the frame timer coalesces everything until it fires"""
+        self.pending_events += 1
+        self.event_count += 1
+        if not self.frame_timer.isActive():
+            self.frame_timer.start()
+
+    def process_frame(self):
+        """Apply all queued stamps as one grid update and repaint one region"""
+        self.frame_timer.stop()
+        start = time.perf_counter()
+
+        dirty = QRect()
+        with instruments.timer("canvas.stamp"):
+            for ix, iy in self.pending_points:
+                dirty = dirty.united(self._stamp(ix, iy))
+        if self.drawing:
+            self.stroke_points.extend(self.pending_points)
+        self.pending_points = []
+        if not dirty.isEmpty():
+            with instruments.timer("canvas.refresh_image"):
+                self._refresh_image(dirty)
+
+        # Repaint the stamped area plus the old and new brush previews
+        region = self._image_rect_to_widget(dirty)
+        new_preview = self._preview_widget_rect()
+        region = region.united(self.preview_rect).united(new_preview)
+        self.preview_rect = new_preview
+        if not region.isEmpty():
+            self.update(region)
+
+        self.frame_count += 1
+        self.last_frame_events = self.pending_events
+        self.pending_events = 0
+        self.last_frame_time = time.perf_counter() - start
+
+    def _preview_widget_rect(self):
+        """Widget rectangle enclosing the brush preview, or an empty rect"""
+        if not self.show_preview or self.mouse_pos.x() < 0 or self.image.width() == 0:
+            return QRect()
+        scale = self.target_rect.width() / self.image.width()
+        # Half the brush, plus room for the dashed pen and rounding
+        extent = int(self.brush_size * scale / 2) + 4
+        return QRect(
+            self.mouse_pos.x() - extent,
+            self.mouse_pos.y() - extent,
+            2 * extent + 1,
+            2 * extent + 1,
+        )
+
+    def _image_rect_to_widget(self, rect):
+        """Map a rectangle in image pixels to the widget area it is drawn in"""
+        if rect.isEmpty() or self.image.width() == 0:
+            return QRect()
+        scale_x = self.target_rect.width() / self.image.width()
+        scale_y = self.target_rect.height() / self.image.height()
+        left = self.target_rect.x() + int(rect.x() * scale_x)
+        top = self.target_rect.y() + int(rect.y() * scale_y)
+        right = self.target_rect.x() + math.ceil((rect.right() + 1) * scale_x)
+        bottom = self.target_rect.y() + math.ceil((rect.bottom() + 1) * scale_y)
+        return QRect(QPoint(left, top), QPoint(right, bottom))
+
     def draw_brush_preview(self, painter):
         """Draw brush preview at mouse position"""
         if self.mouse_pos.x() < 0 or self.mouse_pos.y() < 0:
@@ -250,32 +460,16 @@ class CanvasWidget(QWidget):
         )
 
     def draw_at_pos(self, pos):
+        """Stamp the brush at a widget position immediately"""
         ix, iy = self.map_widget_to_image_coords(pos)
+        dirty = self._stamp(ix, iy)
+        if not dirty.isEmpty():
+            self._refresh_image(dirty)
+        self.update()
 
-        painter = QPainter(self.image)
-        color = self.COLORS[self.current_phase]
-        painter.setBrush(color)
-        painter.setPen(Qt.NoPen)
-
+    def _brush_mask(self):
+        """Boolean mask of the current brush, centred on the stamp position"""
         half_brush = self.brush_size // 2
-        start_x = ix - half_brush
-        start_y = iy - half_brush
-
-        if self.brush_shape == "circle":
-            painter.drawEllipse(QPoint(ix, iy), half_brush, half_brush)
-        elif self.brush_shape == "triangle":
-            polygon = self._create_triangle_polygon(ix, iy, half_brush)
-            painter.drawPolygon(polygon)
-        elif self.brush_shape == "square":
-            painter.drawRect(start_x, start_y, self.brush_size, self.brush_size)
-        else:
-            # Default to circle if an unknown shape is somehow selected
-            painter.drawEllipse(QPoint(ix, iy), half_brush, half_brush)
-
-        painter.end()
-
-        # Update grid
-        phase_to_set = self.current_phase
 
         # Create a mask for the brush shape
         y_coords, x_coords = np.ogrid[
@@ -291,16 +485,33 @@ class CanvasWidget(QWidget):
         else:
             # Default to circle mask
             mask = x_coords**2 + y_coords**2 <= half_brush**2
+        return mask
+
+    def _stamp(self, ix, iy):
+        """Apply the brush to the grid at image coordinates, returning the dirty rect"""
+        mask = self._brush_mask()
+        half_brush = self.brush_size // 2
+        start_x = ix - half_brush
+        start_y = iy - half_brush
+        rows, cols = self.grid.shape
 
-        # Apply the mask to the grid
-        for r in range(mask.shape[0]):
-            for c in range(mask.shape[1]):
-                if mask[r, c]:
-                    ny, nx = start_y + r, start_x + c
-                    if 0 <= ny < self.grid.shape[0] and 0 <= nx < self.grid.shape[1]:
-                        self.grid[ny, nx] = phase_to_set
+        # Clip the mask to the grid
+        top, left = max(start_y, 0), max(start_x, 0)
+        bottom = min(start_y + mask.shape[0], rows)
+        right = min(start_x + mask.shape[1], cols)
+        if top >= bottom or left >= right:
+            return QRect()
 
-        self.set_data(self.grid)
+        mask = mask[top - start_y : bottom - start_y, left - start_x : right - start_x]
+        self.grid[top:bottom, left:right][mask] = self.current_phase
+        return QRect(left, top, right - left, bottom - top)
+
+    def _refresh_image(self, rect):
+        """Re-render the image inside rect from the grid"""
+        block = self.grid[rect.top() : rect.bottom() + 1, rect.left() : rect.right() + 1]
+        painter = QPainter(self.image)
+        painter.drawImage(rect.topLeft(), phase_image(block, self.COLORS))
+        painter.end()
 
     def _flood_fill(self, start_row, start_col, target_phase, replacement_phase):
         if target_phase == replacement_phase:
@@ -332,14 +543,9 @@ class CanvasWidget(QWidget):
     def set_data(self, grid: np.ndarray):
         self.grid = grid.astype(int)  # Ensure grid contains integers
         height, width = self.grid.shape
-        if self.image.size() != QSize(width, height):
-            self.image = QImage(width, height, QImage.Format_RGB32)
-            self.image_size = QSize(width, height)
-
-        for y in range(height):
-            for x in range(width):
-                phase = int(self.grid[y, x])  # Explicitly convert to int
-                self.image.setPixelColor(x, y, self.COLORS[phase % len(self.COLORS)])
+        self.image_size = QSize(width, height)
+        with instruments.timer("canvas.set_data"):
+            self.image = phase_image(self.grid, self.COLORS)
         self.update()
 
 
@@ -11,23 +11,26 @@ from PyQt5.QtWidgets import (
     QSpinBox,
     QDoubleSpinBox,
     QButtonGroup,
+    QCheckBox,
 )
 from PyQt5.QtCore import pyqtSignal, Qt
 from PyQt5.QtGui import QIcon, QPixmap, QColor
 
+from app.logic.project import CELLS_MAX, PARAMETER_RANGES
+
 # Constants
-BRUSH_SIZE_MIN = 1
-BRUSH_SIZE_MAX = 75
+BRUSH_SIZE_MIN, BRUSH_SIZE_MAX = PARAMETER_RANGES["brush_size"]
 BRUSH_SIZE_DEFAULT = 25
-LENGTH_SCALE_MIN = 1.0
-LENGTH_SCALE_MAX = 100.0
+LENGTH_SCALE_MIN, LENGTH_SCALE_MAX = PARAMETER_RANGES["len_scale_x"]
 LENGTH_SCALE_DEFAULT = 15.0
-DOMAIN_WIDTH_MIN = 50
-DOMAIN_WIDTH_MAX = 500
-DOMAIN_HEIGHT_MIN = 50
-DOMAIN_HEIGHT_MAX = 500
+DOMAIN_WIDTH_MIN, DOMAIN_WIDTH_MAX = PARAMETER_RANGES["width"]
+DOMAIN_HEIGHT_MIN, DOMAIN_HEIGHT_MAX = PARAMETER_RANGES["height"]
 DOMAIN_SIZE_DEFAULT = 250
 DOMAIN_SIZE_STEP = 10
+DOMAIN_DEPTH_MIN, DOMAIN_DEPTH_MAX = PARAMETER_RANGES["depth"]
+DOMAIN_DEPTH_DEFAULT = 1
+SLICE_AXES = ["Z", "Y", "X"]
+DEFORMATION_DEGREES = 360  # A full cycle returns to the current realisation
 
 
 class ControlsPanel(QWidget):
@@ -45,6 +48,18 @@ class ControlsPanel(QWidget):
     saveState = pyqtSignal()
     loadState = pyqtSignal()
     exportImages = pyqtSignal()
+    analyseRealisation = pyqtSignal()
+    showMemory = pyqtSignal()
+    sliceChanged = pyqtSignal(int, int)  # axis (0=z, 1=y, 2=x), index
+    thresholdsChanged = pyqtSignal(int, list)  # field index, cumulative proportions
+    applyThresholds = pyqtSignal(int, list)
+    vectorModeChanged = pyqtSignal(bool)
+    hardDataModeChanged = pyqtSignal(bool)
+    clearHardData = pyqtSignal()
+    tuneProportions = pyqtSignal(list)  # target proportion per phase
+    deformationAngleChanged = pyqtSignal(int)  # degrees
+    animateDeformation = pyqtSignal(bool)
+    newDeformationTarget = pyqtSignal()
 
     def __init__(self):
         super().__init__()
@@ -109,6 +124,14 @@ class ControlsPanel(QWidget):
 
         brush_layout.addLayout(undo_redo_layout)
 
+        self.vector_checkbox = QCheckBox("Vector Lithotype")
+        self.vector_checkbox.setToolTip(
+            "Record strokes and fills as shapes, so resizing redraws them "
+            "instead of cropping."
+        )
+        self.vector_checkbox.toggled.connect(self.vectorModeChanged)
+        brush_layout.addWidget(self.vector_checkbox)
+
         self.layout.addWidget(brush_group)
 
         # Phase Controls
@@ -167,11 +190,28 @@ class ControlsPanel(QWidget):
 
         sim_layout.addLayout(save_load_layout)
 
-        self.export_button = QPushButton("Export Images")
-        self.export_button.setToolTip("Export lithotype and realization as PNG images.")
+        self.export_button = QPushButton("Export...")
+        self.export_button.setToolTip(
+            "Export lithotype, realization and optionally an ensemble as PNG, NumPy, VTK or GSLIB."
+        )
         self.export_button.clicked.connect(self.exportImages)
         sim_layout.addWidget(self.export_button)
 
+        self.analyse_button = QPushButton("Analyse...")
+        self.analyse_button.setToolTip(
+            "Indicator variograms and connectivity of each phase, for the "
+            "realisation or an ensemble."
+        )
+        self.analyse_button.clicked.connect(self.analyseRealisation)
+        sim_layout.addWidget(self.analyse_button)
+
+        self.memory_button = QPushButton("Memory...")
+        self.memory_button.setToolTip(
+            "Memory held by history, caches, fields and images, and its budget."
+        )
+        self.memory_button.clicked.connect(self.showMemory)
+        sim_layout.addWidget(self.memory_button)
+
         # Length Scale Inputs
         length_scale_group = QGroupBox("Length Scales")
         length_scale_layout = QHBoxLayout()
@@ -196,12 +236,24 @@ class ControlsPanel(QWidget):
         # Remove automatic updates - will be triggered by button instead
         y_layout.addWidget(self.len_scale_y_spinbox)
         length_scale_layout.addLayout(y_layout)
+
+        z_layout = QVBoxLayout()
+        z_layout.addWidget(QLabel("Length Scale Z:"))
+        self.len_scale_z_spinbox = QDoubleSpinBox()
+        self.len_scale_z_spinbox.setRange(LENGTH_SCALE_MIN, LENGTH_SCALE_MAX)
+        self.len_scale_z_spinbox.setValue(LENGTH_SCALE_DEFAULT)
+        self.len_scale_z_spinbox.setSingleStep(1.0)
+        self.len_scale_z_spinbox.setToolTip("Only used when depth is above 1.")
+        z_layout.addWidget(self.len_scale_z_spinbox)
+        length_scale_layout.addLayout(z_layout)
         self.layout.addWidget(length_scale_group)
 
         # Domain Size Inputs
         domain_size_group = QGroupBox("Domain Size")
+        domain_group_layout = QVBoxLayout()
+        domain_size_group.setLayout(domain_group_layout)
         domain_size_layout = QHBoxLayout()
-        domain_size_group.setLayout(domain_size_layout)
+        domain_group_layout.addLayout(domain_size_layout)
 
         width_layout = QVBoxLayout()
         width_layout.addWidget(QLabel("Width:"))
@@ -220,14 +272,276 @@ class ControlsPanel(QWidget):
         self.height_spinbox.setSingleStep(DOMAIN_SIZE_STEP)
         height_layout.addWidget(self.height_spinbox)
         domain_size_layout.addLayout(height_layout)
+
+        depth_layout = QVBoxLayout()
+        depth_layout.addWidget(QLabel("Depth:"))
+        self.depth_spinbox = QSpinBox()
+        self.depth_spinbox.setToolTip("Number of z-slices; 1 gives a 2D domain.")
+        self.depth_spinbox.setRange(DOMAIN_DEPTH_MIN, DOMAIN_DEPTH_MAX)
+        self.depth_spinbox.setValue(DOMAIN_DEPTH_DEFAULT)
+        depth_layout.addWidget(self.depth_spinbox)
+        domain_size_layout.addLayout(depth_layout)
+
+        # Shown, with Update Parameters disabled, while the domain is too large
+        self.domain_cells_label = QLabel()
+        self.domain_cells_label.setWordWrap(True)
+        self.domain_cells_label.hide()
+        domain_group_layout.addWidget(self.domain_cells_label)
+        for spinbox in (self.width_spinbox, self.height_spinbox, self.depth_spinbox):
+            spinbox.valueChanged.connect(self._on_domain_changed)
         self.layout.addWidget(domain_size_group)
 
+        # Slice view for 3D domains
+        self.slice_group = QGroupBox("Slice View")
+        slice_layout = QHBoxLayout()
+        self.slice_group.setLayout(slice_layout)
+
+        self.slice_axis_combo = QComboBox()
+        self.slice_axis_combo.setToolTip("Axis normal to the displayed slice.")
+        self.slice_axis_combo.addItems(SLICE_AXES)
+        self.slice_axis_combo.currentIndexChanged.connect(self._on_slice_axis_changed)
+        slice_layout.addWidget(self.slice_axis_combo)
+
+        self.slice_slider = QSlider(Qt.Horizontal)
+        self.slice_slider.setToolTip("Index of the displayed slice.")
+        self.slice_slider.setRange(0, 0)
+        self.slice_slider.valueChanged.connect(self._on_slice_changed)
+        slice_layout.addWidget(self.slice_slider)
+
+        self.slice_label = QLabel("0")
+        slice_layout.addWidget(self.slice_label)
+
+        self.slice_shape = None  # Shape of the 3D realisation being viewed
+        self.slice_group.setEnabled(False)  # Only active for 3D domains
+        self.layout.addWidget(self.slice_group)
+
         self.layout.addWidget(sim_group)
 
+        # Gradual deformation: blend the fields with a second pair
+        deformation_group = QGroupBox("Gradual Deformation")
+        deformation_layout = QVBoxLayout()
+        deformation_group.setLayout(deformation_layout)
+
+        angle_layout = QHBoxLayout()
+        self.deformation_slider = QSlider(Qt.Horizontal)
+        self.deformation_slider.setToolTip(
+            "Angle t of the fields cos(t)·current + sin(t)·target; 0 is the "
+            "current realisation."
+        )
+        self.deformation_slider.setRange(0, DEFORMATION_DEGREES - 1)
+        self.deformation_slider.valueChanged.connect(self._on_deformation_changed)
+        angle_layout.addWidget(self.deformation_slider)
+        self.deformation_label = QLabel("0°")
+        angle_layout.addWidget(self.deformation_label)
+        deformation_layout.addLayout(angle_layout)
+
+        deformation_buttons = QHBoxLayout()
+        self.animate_button = QPushButton("Animate")
+        self.animate_button.setToolTip(
+            "Move smoothly through intermediate realisations without regenerating."
+        )
+        self.animate_button.setCheckable(True)
+        self.animate_button.toggled.connect(self.animateDeformation)
+        deformation_buttons.addWidget(self.animate_button)
+        self.new_target_button = QPushButton("New Target")
+        self.new_target_button.setToolTip("Draw a new field pair to deform towards.")
+        self.new_target_button.clicked.connect(self.newDeformationTarget)
+        deformation_buttons.addWidget(self.new_target_button)
+        deformation_layout.addLayout(deformation_buttons)
+        self.layout.addWidget(deformation_group)
+
+        # Threshold rule: sweep cumulative proportions along one field
+        threshold_group = QGroupBox("Threshold Rule")
+        threshold_layout = QVBoxLayout()
+        threshold_group.setLayout(threshold_layout)
+
+        self.threshold_field_combo = QComboBox()
+        self.threshold_field_combo.setToolTip("Field whose values are thresholded.")
+        self.threshold_field_combo.addItems(["Field 1", "Field 2"])
+        self.threshold_field_combo.currentIndexChanged.connect(
+            self._on_thresholds_changed
+        )
+        threshold_layout.addWidget(self.threshold_field_combo)
+
+        self.threshold_spinboxes_layout = QHBoxLayout()
+        threshold_layout.addLayout(self.threshold_spinboxes_layout)
+        self.threshold_spinboxes = []
+
+        self.apply_thresholds_button = QPushButton("Apply Threshold Rule")
+        self.apply_thresholds_button.setToolTip(
+            "Replace the lithotype with the threshold rule (undoable)."
+        )
+        self.apply_thresholds_button.clicked.connect(
+            lambda: self.applyThresholds.emit(
+                self.threshold_field_combo.currentIndex(), self.threshold_values()
+            )
+        )
+        threshold_layout.addWidget(self.apply_thresholds_button)
+        self.layout.addWidget(threshold_group)
+
+        # Hard data: observed phases the realisation is conditioned on
+        hard_data_group = QGroupBox("Hard Data")
+        hard_data_layout = QVBoxLayout()
+        hard_data_group.setLayout(hard_data_layout)
+
+        self.hard_data_checkbox = QCheckBox("Place Observations")
+        self.hard_data_checkbox.setToolTip(
+            "Click the realisation to observe the selected phase at a cell; "
+            "right-click removes an observation."
+        )
+        self.hard_data_checkbox.toggled.connect(self.hardDataModeChanged)
+        hard_data_layout.addWidget(self.hard_data_checkbox)
+
+        hard_data_row = QHBoxLayout()
+        self.hard_data_label = QLabel("0 observations")
+        hard_data_row.addWidget(self.hard_data_label)
+        self.clear_hard_data_button = QPushButton("Clear")
+        self.clear_hard_data_button.setToolTip("Remove all observations.")
+        self.clear_hard_data_button.clicked.connect(self.clearHardData)
+        hard_data_row.addWidget(self.clear_hard_data_button)
+        hard_data_layout.addLayout(hard_data_row)
+        self.layout.addWidget(hard_data_group)
+
+        # Phase proportions: live shares of the realisation and tuning targets
+        proportions_group = QGroupBox("Phase Proportions")
+        proportions_layout = QVBoxLayout()
+        proportions_group.setLayout(proportions_layout)
+
+        self.live_proportions_layout = QHBoxLayout()
+        proportions_layout.addLayout(self.live_proportions_layout)
+        self.live_proportion_labels = []
+        self.target_spinboxes_layout = QHBoxLayout()
+        proportions_layout.addLayout(self.target_spinboxes_layout)
+        self.target_spinboxes = []
+
+        self.tune_button = QPushButton("Auto-Tune Lithotype")
+        self.tune_button.setToolTip(
+            "Move the phase boundaries of the lithotype until the realisation "
+            "has the target proportions (undoable)."
+        )
+        self.tune_button.clicked.connect(
+            lambda: self.tuneProportions.emit(self.target_proportions())
+        )
+        proportions_layout.addWidget(self.tune_button)
+        self.layout.addWidget(proportions_group)
+
     def _on_tool_toggled(self, tool_name, checked):
         if checked:
             self.toolChanged.emit(tool_name)
 
+    def _on_slice_changed(self, _value):
+        self.slice_label.setText(str(self.slice_slider.value()))
+        self.sliceChanged.emit(
+            self.slice_axis_combo.currentIndex(), self.slice_slider.value()
+        )
+
+    def _on_slice_axis_changed(self, axis):
+        if self.slice_shape is not None:
+            # Changing the range may clamp the value, which emits on its own
+            self.slice_slider.blockSignals(True)
+            self.slice_slider.setRange(0, self.slice_shape[axis] - 1)
+            self.slice_slider.blockSignals(False)
+        self._on_slice_changed(axis)
+
+    def _on_domain_changed(self, _value):
+        cells = self.domain_cells()
+        too_large = cells > CELLS_MAX
+        self.domain_cells_label.setText(
+            f"{cells:,} cells; at most {CELLS_MAX:,} are supported." if too_large else ""
+        )
+        self.domain_cells_label.setVisible(too_large)
+        self.update_parameters_button.setEnabled(not too_large)
+
+    def domain_cells(self):
+        return (
+            self.width_spinbox.value() * self.height_spinbox.value() * self.depth_spinbox.value()
+        )
+
+    def _on_deformation_changed(self, value):
+        self.deformation_label.setText(f"{value}°")
+        self.deformationAngleChanged.emit(value)
+
+    def set_deformation_angle(self, degrees):
+        """Move the deformation slider without emitting deformationAngleChanged"""
+        self.deformation_slider.blockSignals(True)
+        self.deformation_slider.setValue(degrees % DEFORMATION_DEGREES)
+        self.deformation_slider.blockSignals(False)
+        self.deformation_label.setText(f"{self.deformation_slider.value()}°")
+
+    def deformation_angle(self):
+        return self.deformation_slider.value()
+
+    def set_hard_data_count(self, count):
+        self.hard_data_label.setText(
+            f"{count} observation" + ("" if count == 1 else "s")
+        )
+
+    def update_slice_range(self, shape):
+        """Enable slice controls for a 3D shape (nz, ny, nx) and bound the index"""
+        self.slice_shape = shape if len(shape) == 3 else None
+        self.slice_group.setEnabled(self.slice_shape is not None)
+        if self.slice_shape is not None:
+            axis_length = shape[self.slice_axis_combo.currentIndex()]
+            self.slice_slider.blockSignals(True)
+            self.slice_slider.setRange(0, axis_length - 1)
+            self.slice_slider.blockSignals(False)
+            self.slice_label.setText(str(self.slice_slider.value()))
+
+    def set_thresholds(self, values):
+        """Create one spinbox per threshold, without emitting changes"""
+        for spinbox in self.threshold_spinboxes:
+            self.threshold_spinboxes_layout.removeWidget(spinbox)
+            spinbox.deleteLater()
+        self.threshold_spinboxes = []
+
+        for value in values:
+            spinbox = QDoubleSpinBox()
+            spinbox.setToolTip("Cumulative proportion of the phases below this split.")
+            spinbox.setRange(0.0, 1.0)
+            spinbox.setSingleStep(0.01)
+            spinbox.setValue(value)
+            spinbox.valueChanged.connect(self._on_thresholds_changed)
+            self.threshold_spinboxes_layout.addWidget(spinbox)
+            self.threshold_spinboxes.append(spinbox)
+
+    def threshold_values(self):
+        return [spinbox.value() for spinbox in self.threshold_spinboxes]
+
+    def _on_thresholds_changed(self, _value):
+        self.thresholdsChanged.emit(
+            self.threshold_field_combo.currentIndex(), self.threshold_values()
+        )
+
+    def set_target_proportions(self, values, colors):
+        """Create one target spinbox and live label per phase, in percent"""
+        for widget in self.target_spinboxes + self.live_proportion_labels:
+            widget.deleteLater()
+        self.target_spinboxes = []
+        self.live_proportion_labels = []
+
+        for value, color in zip(values, colors):
+            label = QLabel("-")
+            label.setToolTip("Share of the current realisation.")
+            label.setAlignment(Qt.AlignCenter)
+            label.setStyleSheet(f"border-bottom: 3px solid {QColor(color).name()};")
+            self.live_proportions_layout.addWidget(label)
+            self.live_proportion_labels.append(label)
+
+            spinbox = QSpinBox()
+            spinbox.setToolTip("Target share of this phase in percent.")
+            spinbox.setRange(0, 100)
+            spinbox.setSuffix("%")
+            spinbox.setValue(round(100 * value))
+            self.target_spinboxes_layout.addWidget(spinbox)
+            self.target_spinboxes.append(spinbox)
+
+    def target_proportions(self):
+        return [spinbox.value() / 100 for spinbox in self.target_spinboxes]
+
+    def set_live_proportions(self, proportions):
+        for label, proportion in zip(self.live_proportion_labels, proportions):
+            label.setText(f"{100 * proportion:.1f}%")
+
     def update_phase_buttons(self, num_phases, colors):
         # Clear existing buttons
         for button in self.phase_buttons:
@@ -272,8 +586,10 @@ class ControlsPanel(QWidget):
         self.shape_combo.setCurrentText("Circle")
         self.len_scale_x_spinbox.setValue(LENGTH_SCALE_DEFAULT)
         self.len_scale_y_spinbox.setValue(LENGTH_SCALE_DEFAULT)
+        self.len_scale_z_spinbox.setValue(LENGTH_SCALE_DEFAULT)
         self.width_spinbox.setValue(DOMAIN_SIZE_DEFAULT)
         self.height_spinbox.setValue(DOMAIN_SIZE_DEFAULT)
+        self.depth_spinbox.setValue(DOMAIN_DEPTH_DEFAULT)
 
         # Reset tool selection
         self.brush_tool_button.setChecked(True)
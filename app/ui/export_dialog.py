@@ -0,0 +1,113 @@
+from PyQt5.QtWidgets import (
+    QDialog,
+    QVBoxLayout,
+    QHBoxLayout,
+    QGroupBox,
+    QCheckBox,
+    QLabel,
+    QLineEdit,
+    QPushButton,
+    QSpinBox,
+    QDialogButtonBox,
+    QFileDialog,
+)
+
+from app.logic.export import EXPORT_FORMATS
+
+# Constants
+FORMAT_LABELS = {
+    "png": "PNG (indexed palette)",
+    "npy": "NumPy array (.npy, uint8)",
+    "vtk": "VTK image data (.vtk)",
+    "gslib": "GSLIB ASCII (.gslib)",
+}
+ENSEMBLE_SIZE_MAX = 1000
+DEFORMATION_FRAMES_MAX = 3600
+
+
+class ExportDialog(QDialog):
+    """Choose export formats, an optional ensemble, deformation frames and a directory"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Export")
+        layout = QVBoxLayout(self)
+
+        format_group = QGroupBox("Formats")
+        format_layout = QVBoxLayout()
+        self.format_checkboxes = {}
+        for fmt in EXPORT_FORMATS:
+            checkbox = QCheckBox(FORMAT_LABELS[fmt])
+            checkbox.setChecked(fmt == "png")
+            checkbox.toggled.connect(self._update_ok_button)
+            format_layout.addWidget(checkbox)
+            self.format_checkboxes[fmt] = checkbox
+        format_group.setLayout(format_layout)
+        layout.addWidget(format_group)
+
+        ensemble_layout = QHBoxLayout()
+        ensemble_layout.addWidget(QLabel("Ensemble realisations:"))
+        self.ensemble_spinbox = QSpinBox()
+        self.ensemble_spinbox.setToolTip(
+            "Also simulate and export this many realisations with new random fields."
+        )
+        self.ensemble_spinbox.setRange(0, ENSEMBLE_SIZE_MAX)
+        ensemble_layout.addWidget(self.ensemble_spinbox)
+        layout.addLayout(ensemble_layout)
+
+        deformation_layout = QHBoxLayout()
+        deformation_layout.addWidget(QLabel("Deformation frames:"))
+        self.deformation_spinbox = QSpinBox()
+        self.deformation_spinbox.setToolTip(
+            "Also export this many frames of gradual deformation, evenly spaced "
+            "over a full cycle so they loop."
+        )
+        self.deformation_spinbox.setRange(0, DEFORMATION_FRAMES_MAX)
+        deformation_layout.addWidget(self.deformation_spinbox)
+        self.stack_checkbox = QCheckBox("Stack into one .npy")
+        self.stack_checkbox.setToolTip(
+            "Write the frames as a single (frames, rows, columns) uint8 NumPy "
+            "array instead of one file per frame and format."
+        )
+        deformation_layout.addWidget(self.stack_checkbox)
+        layout.addLayout(deformation_layout)
+
+        directory_layout = QHBoxLayout()
+        self.directory_edit = QLineEdit()
+        self.directory_edit.textChanged.connect(self._update_ok_button)
+        directory_layout.addWidget(self.directory_edit)
+        browse_button = QPushButton("Browse...")
+        browse_button.clicked.connect(self._browse)
+        directory_layout.addWidget(browse_button)
+        layout.addLayout(directory_layout)
+
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+        layout.addWidget(self.buttons)
+        self._update_ok_button()
+
+    def _browse(self):
+        directory = QFileDialog.getExistingDirectory(self, "Select Export Directory")
+        if directory:
+            self.directory_edit.setText(directory)
+
+    def _update_ok_button(self):
+        self.buttons.button(QDialogButtonBox.Ok).setEnabled(
+            bool(self.directory_edit.text()) and bool(self.formats())
+        )
+
+    def formats(self):
+        return [fmt for fmt, checkbox in self.format_checkboxes.items() if checkbox.isChecked()]
+
+    def directory(self):
+        return self.directory_edit.text()
+
+    def ensemble_size(self):
+        return self.ensemble_spinbox.value()
+
+    def deformation_frames(self):
+        return self.deformation_spinbox.value()
+
+    def stack_frames(self):
+        return self.stack_checkbox.isChecked()
@@ -0,0 +1,65 @@
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPainter, QColor, QFont
+from PyQt5.QtCore import Qt, QTimer
+
+from app.logic.instrumentation import instruments
+
+# Constants
+HUD_REFRESH_MS = 500
+HUD_MARGIN = 8
+
+
+class PerformanceHUD(QWidget):
+    """Translucent overlay listing per-stage latency percentiles and frames/second"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setAttribute(Qt.WA_NoSystemBackground)
+        font = QFont("Monospace", 9)
+        font.setStyleHint(QFont.TypeWriter)
+        self.setFont(font)
+        self.lines = []
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(HUD_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def set_active(self, active):
+        """Showing the HUD also switches instrumentation on"""
+        instruments.enabled = active
+        if active:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+            self.hide()
+
+    def refresh(self):
+        self.lines = [f"{'stage':<26}{'n':>5}{'p50':>8}{'p90':>8}{'p99':>8}  ms"]
+        for name, stats in instruments.summary().items():
+            self.lines.append(
+                f"{name:<26}{stats['count']:>5}"
+                f"{stats['p50']:>8.2f}{stats['p90']:>8.2f}{stats['p99']:>8.2f}"
+            )
+        self.lines.append(f"{'frames/second':<26}{instruments.fps():>10.1f}")
+
+        # Size to the text and stay in the parent's top-right corner
+        metrics = self.fontMetrics()
+        width = max(metrics.horizontalAdvance(line) for line in self.lines) + 16
+        height = metrics.height() * len(self.lines) + 12
+        self.resize(width, height)
+        if self.parent() is not None:
+            self.move(self.parent().width() - width - HUD_MARGIN, HUD_MARGIN)
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(0, 0, 0, 170))
+        painter.setPen(QColor(255, 255, 255))
+        line_height = self.fontMetrics().height()
+        for i, line in enumerate(self.lines):
+            painter.drawText(8, 6 + line_height * (i + 1) - 3, line)
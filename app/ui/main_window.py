@@ -1,4 +1,5 @@
 import json
+import os
 import numpy as np
 from PyQt5.QtWidgets import (
     QApplication,
@@ -11,23 +12,51 @@ from PyQt5.QtWidgets import (
     QFileDialog,
     QMessageBox,
     QLabel,
+    QShortcut,
+    QDialog,
+    QProgressDialog,
 )
-from PyQt5.QtCore import Qt, QSize
-from PyQt5.QtGui import QImage
+from PyQt5.QtCore import QEvent, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QKeySequence
 
 # Constants
 CONTROLS_WIDTH = 350
 CANVAS_WIDTH = 600
 TITLE_HEIGHT = 20
 DEFAULT_SPLITTER_SIZES = [350, 600, 600]
+DEFORMATION_FRAME_MS = 33  # About 30 frames per second while animating
+DEFORMATION_STEP_DEGREES = 2  # A full cycle takes six seconds
+MEMORY_CHECK_MS = 500  # Realisations shown within this share one memory check
+# Engine settings that reproduce its fields, for engines built elsewhere
+ENGINE_PARAMETERS = ["width", "height", "depth", "len_scale_x", "len_scale_y", "len_scale_z"]
 from app.ui.canvas import CanvasWidget
 from app.ui.controls import ControlsPanel
 from app.ui.result_widget import ResultWidget
-from app.logic.simulation import SimulationEngine
+from app.logic.instrumentation import instruments
+from app.logic.simulation import NUM_PHASES, THRESHOLDS_DEFAULT, FieldSpec, get_slice
+from app.ui.hud import PerformanceHUD
+from app.ui.recorder import InteractionRecorder
+from app.ui.autosave import Autosave, claim_orphaned_journal
+from app.logic.conditioning import HardData
+from app.logic.journal import read_journal
+from app.logic.project import prepare_engine, read_project
+from app.logic.service import EngineServiceLost, create_engine
+from app.ui.workers import AnalysisWorker, EngineLoader, ExportWorker, ProjectLoader
+from app.ui.export_dialog import ExportDialog
+from app.ui.analysis_panel import AnalysisPanel
+from app.ui.memory_panel import MemoryPanel, format_mb
+from app.logic.memory import MEMORY_BUDGET_DEFAULT_MB, MemoryLedger
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    engineReady = pyqtSignal()
+
+    def __init__(
+        self,
+        autosave=True,
+        memory_budget_mb=MEMORY_BUDGET_DEFAULT_MB,
+        engine_process=False,
+    ):
         super().__init__()
         self.setWindowTitle("Interactive Plurigaussian Simulation")
         self.central_widget = QWidget()
@@ -47,14 +76,15 @@ class MainWindow(QMainWindow):
         fixed_width = 250
         fixed_height = 250
 
-        # Simulation Engine
-        self.simulation_engine = SimulationEngine(
-            width=fixed_width, height=fixed_height
-        )
+        # Simulation Engine, built on a background thread so the window
+        # appears before gstools is imported and the first fields exist
+        self.simulation_engine = None
+        # Run the engine in a service process instead of the GUI process
+        self.engine_process = engine_process
 
         self.l_canvas_widget = CanvasWidget(width=fixed_width, height=fixed_height)
         self.p_canvas_widget = ResultWidget(width=fixed_width, height=fixed_height)
-        self.p_canvas_widget.set_data(self.simulation_engine.simulate())
+        self.realisation = None  # Latest realisation, 2D or a 3D volume
 
         self.controls_scroll_area = QScrollArea()
         self.controls_scroll_area.setWidgetResizable(True)
@@ -95,7 +125,11 @@ class MainWindow(QMainWindow):
         self.l_canvas_widget.set_phase(0)
         self.l_canvas_widget.set_brush_size(self.controls_widget.size_slider.value())
         self.controls_widget.update_phase_buttons(
-            self.simulation_engine.get_num_phases(), self.l_canvas_widget.COLORS
+            NUM_PHASES, self.l_canvas_widget.COLORS
+        )
+        self.controls_widget.set_thresholds(THRESHOLDS_DEFAULT)
+        self.controls_widget.set_target_proportions(
+            np.diff([0.0] + THRESHOLDS_DEFAULT + [1.0]), self.l_canvas_widget.COLORS
         )
 
         # Connections
@@ -116,66 +150,559 @@ class MainWindow(QMainWindow):
         self.controls_widget.saveState.connect(self.save_state)
         self.controls_widget.loadState.connect(self.load_state)
         self.controls_widget.exportImages.connect(self.export_images)
+        self.controls_widget.analyseRealisation.connect(self.show_analysis)
+        self.controls_widget.showMemory.connect(self.show_memory)
+        self.controls_widget.sliceChanged.connect(self.show_slice)
+        self.controls_widget.thresholdsChanged.connect(self.preview_thresholds)
+        self.controls_widget.applyThresholds.connect(self.apply_thresholds)
+        self.controls_widget.tuneProportions.connect(self.tune_proportions)
+        self.controls_widget.vectorModeChanged.connect(self.set_vector_mode)
+        self.controls_widget.hardDataModeChanged.connect(
+            self.p_canvas_widget.set_place_mode
+        )
+        self.controls_widget.clearHardData.connect(
+            lambda: self.set_hard_data(HardData())
+        )
+        self.p_canvas_widget.cellClicked.connect(self.place_observation)
+        self.controls_widget.deformationAngleChanged.connect(self.show_deformation)
+        self.controls_widget.animateDeformation.connect(self.animate_deformation)
+        self.controls_widget.newDeformationTarget.connect(self.new_deformation_target)
+
+        # Gradual deformation advances one step per tick while animating
+        self.deformation_timer = QTimer(self)
+        self.deformation_timer.setInterval(DEFORMATION_FRAME_MS)
+        self.deformation_timer.timeout.connect(self._advance_deformation)
+
+        # Performance overlay (F3) and Chrome trace dump (Ctrl+Shift+T)
+        self.hud = PerformanceHUD(self.central_widget)
+        QShortcut(QKeySequence("F3"), self, self.toggle_hud)
+        QShortcut(QKeySequence("Ctrl+Shift+T"), self, self.dump_trace)
+
+        # Interaction recording for headless replay (Ctrl+Shift+R)
+        self.recorder = None
+        QShortcut(QKeySequence("Ctrl+Shift+R"), self, self.toggle_recording)
+        if instruments.enabled:
+            self.hud.set_active(True)
+
+        self.export_worker = None
+        self.project_loader = None
+        self.analysis_panel = None
+        self.analysis_worker = None
+
+        # Memory held per component, checked shortly after realisations are
+        # shown, so deformation frames are not each measured
+        self.memory = MemoryLedger(memory_budget_mb)
+        self._register_memory()
+        self.memory_panel = None
+        self.memory_check_timer = QTimer(self)
+        self.memory_check_timer.setSingleShot(True)
+        self.memory_check_timer.setInterval(MEMORY_CHECK_MS)
+        self.memory_check_timer.timeout.connect(self.check_memory)
+
+        # Crash-safe journal of completed actions, started once the engine exists
+        self.autosave = Autosave(self) if autosave else None
+
+        # Controls wait for the engine; the lithotype can be drawn meanwhile
+        self.controls_widget.setEnabled(False)
+        self.statusBar().showMessage("Generating random fields...")
+        self.engine_loader = EngineLoader(fixed_width, fixed_height, engine_process, self)
+        self.engine_loader.loaded.connect(self._on_engine_loaded)
+        self.engine_loader.failed.connect(self._on_engine_failed)
+        self.engine_loader.start()
+
+    def _on_engine_loaded(self, engine, p_field):
+        self.simulation_engine = engine
+        if self.l_canvas_widget.grid.any():
+            # Strokes made while loading still need simulating
+            self.run_simulation(self.l_canvas_widget.grid)
+        else:
+            self.show_realisation(p_field)
+        self.controls_widget.setEnabled(True)
+        self.statusBar().clearMessage()
+        if self.autosave is not None:
+            self.offer_recovery()
+            self.autosave.start()
+        self.engineReady.emit()
+
+    def offer_recovery(self):
+        """Offer to restore work journaled by a session that did not exit cleanly
+
+        Journals of instances still running are locked and left alone; a
+        claimed journal is removed once recovered or declined.
+        """
+        claimed = claim_orphaned_journal()
+        if claimed is None:
+            return
+        path, lock = claimed
+        state = read_journal(path)
+        if state is not None:
+            answer = QMessageBox.question(
+                self,
+                "Recover Work",
+                "A previous session did not close normally. "
+                "Recover its lithotype, parameters and observations?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.Yes,
+            )
+            if answer == QMessageBox.Yes:
+                self.restore_journal_state(state)
+        os.remove(path)
+        lock.unlock()
+
+    def restore_journal_state(self, state):
+        """Rebuild the engine from a journal, drawing its fields only once"""
+        params = state["parameters"]
+        self.controls_widget.blockSignals(True)
+        try:
+            self._show_parameters(params)
+        finally:
+            self.controls_widget.blockSignals(False)
+
+        field_specs = None
+        if state["field_specs"] is not None:
+            field_specs = [FieldSpec.from_dict(spec) for spec in state["field_specs"]]
+        engine = create_engine(
+            self.engine_process,
+            field_specs=field_specs,
+            generate=False,
+            **{name: params[name] for name in ENGINE_PARAMETERS},
+        )
+        hard_data = HardData.from_list(state["hard_data"]).within(engine.grid_shape)
+        engine.set_hard_data(hard_data)
+        engine.update_lithotypes(state["grid"])
+        realisation = engine.regenerate_fields(state["seeds"])
+
+        self._install_engine(engine)
+        self.l_canvas_widget.set_data(state["grid"])
+        self.l_canvas_widget.reset_history()
+        self.show_realisation(realisation)
+        self.update_undo_redo_buttons()
+
+    def _on_engine_failed(self, message):
+        self.statusBar().clearMessage()
+        QMessageBox.critical(
+            self, "Error", f"Failed to initialise simulation: {message}"
+        )
+
+    def toggle_hud(self):
+        self.hud.set_active(not self.hud.isVisible())
+
+    def dump_trace(self):
+        """Save recorded stage timings as a Chrome trace JSON file"""
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Save Trace", "trace.json", "JSON Files (*.json);;All Files (*)"
+        )
+        if filename:
+            try:
+                instruments.dump_trace(filename)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to save trace: {str(e)}")
+
+    def toggle_recording(self):
+        """Start recording interactions to a trace file, or stop recording"""
+        if self.recorder is not None:
+            self.recorder.stop_recording()
+            self.recorder = None
+            self.statusBar().showMessage("Recording stopped", 3000)
+            return
+        if self.simulation_engine is None:
+            return
+        filename, _ = QFileDialog.getSaveFileName(
+            self,
+            "Record Interactions",
+            "interactions.jsonl",
+            "JSON Lines Files (*.jsonl);;All Files (*)",
+        )
+        if filename:
+            try:
+                self.recorder = InteractionRecorder(self, filename)
+                self.recorder.start_recording()
+                self.statusBar().showMessage("Recording interactions...")
+            except Exception as e:
+                self.recorder = None
+                QMessageBox.critical(
+                    self, "Error", f"Failed to start recording: {str(e)}"
+                )
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.hud.isVisible():
+            self.hud.refresh()  # Keep the overlay in the top-right corner
+
+    def event(self, event):
+        handled = super().event(event)
+        if event.type() == QEvent.UpdateRequest:
+            # Canvases repainted in this update are one displayed frame
+            instruments.frame()
+        return handled
+
+    def closeEvent(self, event):
+        # The loader thread must not outlive the window
+        self.engine_loader.wait()
+        if self.project_loader is not None:
+            self.project_loader.wait()
+        for worker in (self.export_worker, self.analysis_worker):
+            if worker is not None:
+                worker.cancel()
+                worker.wait()
+        if self.recorder is not None:
+            self.recorder.stop_recording()
+        if self.autosave is not None:
+            self.autosave.close()
+        self.deformation_timer.stop()
+        self.memory_check_timer.stop()
+        if self.simulation_engine is not None:
+            self.simulation_engine.close()
+        super().closeEvent(event)
 
     def run_simulation(self, grid):
-        self.simulation_engine.update_lithotypes(grid)
-        p_field = self.simulation_engine.simulate()
-        self.p_canvas_widget.set_data(p_field)
+        if self.simulation_engine is None:
+            return  # Picked up once the engine is ready
+        if self.controls_widget.deformation_angle():
+            # Edits while deformed keep showing the deformed frame
+            self.show_deformation(self.controls_widget.deformation_angle())
+            return
+        with instruments.timer("window.run_simulation"):
+            self.simulation_engine.update_lithotypes(grid)
+            p_field = self.simulation_engine.simulate()
+            self.show_realisation(p_field)
+
+    def show_realisation(self, p_field):
+        """Display a realisation; 3D volumes show only the selected slice"""
+        self.realisation = p_field
+        self.controls_widget.update_slice_range(p_field.shape)
+        self.controls_widget.set_hard_data_count(len(self.simulation_engine.hard_data))
+        self.controls_widget.set_live_proportions(
+            self.simulation_engine.phase_proportions(p_field)
+        )
+        if self.simulation_engine.conditioning_error:
+            self.statusBar().showMessage(
+                f"Not conditioned: {self.simulation_engine.conditioning_error}", 5000
+            )
+        if p_field.ndim == 3:
+            self.show_slice(
+                self.controls_widget.slice_axis_combo.currentIndex(),
+                self.controls_widget.slice_slider.value(),
+            )
+        else:
+            self.p_canvas_widget.set_data(p_field, self.simulation_engine.last_key)
+            self.p_canvas_widget.set_markers(
+                (row, col, phase)
+                for (row, col), phase in self.simulation_engine.hard_data.points.items()
+            )
+        if not self.memory_check_timer.isActive():
+            self.memory_check_timer.start()
+
+    def _register_memory(self):
+        """Components the memory ledger measures and, for caches, may release
+
+        Measured in this order, so the displayed realisation counts under
+        the view rather than the caches that also hold it. Releasing evicts
+        renders first, then realisations and kriging systems, then the
+        field histogram, and trims the undo history last.
+        """
+        canvas = self.l_canvas_widget
+        view = self.p_canvas_widget
+
+        def engine(*names):
+            # The engine is built in the background and replaced on load
+            return lambda: [getattr(self.simulation_engine, n, None) for n in names]
+
+        def engine_release(release):
+            return lambda: self.simulation_engine is not None and release(
+                self.simulation_engine
+            )
+
+        def trim_history():
+            trimmed = canvas.trim_history()
+            self.update_undo_redo_buttons()
+            return trimmed
+
+        ledger = self.memory
+        ledger.register("Random fields", engine("field1", "field2", "extra_fields", "pgs"))
+        ledger.register("Lithotype (engine)", engine("lithotypes"))
+        ledger.register("Lithotype canvas", lambda: [canvas.grid, canvas.image])
+        ledger.register(
+            "Realisation view",
+            lambda: [
+                self.realisation,
+                view.grid,
+                view.levels,
+                view._image,
+                view._viewport_cache,
+            ],
+        )
+        ledger.register("Undo history", lambda: canvas.history, trim_history, priority=3)
+        ledger.register(
+            "Realisation cache",
+            engine("cache"),
+            engine_release(lambda e: e.cache.evict_oldest()),
+            priority=1,
+        )
+        ledger.register(
+            "Render cache", lambda: view.render_cache, view.render_cache.evict_oldest
+        )
+        ledger.register(
+            "Kriging cache",
+            engine("kriging_cache"),
+            engine_release(lambda e: e.kriging_cache.evict_oldest()),
+            priority=1,
+        )
+        ledger.register(
+            "Field histogram",
+            engine("histogram"),
+            engine_release(lambda e: e.drop_histogram()),
+            priority=2,
+        )
+        ledger.register(
+            "Deformation fields",
+            engine("deformation_fields"),
+            engine_release(lambda e: e.drop_deformation()),
+            priority=2,
+        )
+
+    def check_memory(self):
+        """Warn, and release if enabled, when the memory budget is exceeded"""
+        with instruments.timer("window.check_memory"):
+            if not self.memory.over_budget():
+                return
+            released = self.memory.enforce() if self.memory.auto_release else []
+            resident = self.memory.resident()
+        if self.memory.over_budget():
+            self.statusBar().showMessage(
+                f"Memory use {format_mb(resident)} exceeds the "
+                f"{self.memory.budget_mb:,} MB budget",
+                5000,
+            )
+        elif released:
+            self.statusBar().showMessage(
+                f"Memory budget reached; released {', '.join(released).lower()}", 5000
+            )
+        if self.memory_panel is not None and self.memory_panel.isVisible():
+            self.memory_panel.refresh()
+
+    def release_memory(self):
+        self.memory.enforce()
+        self.memory_panel.refresh()
+
+    def show_memory(self):
+        if self.memory_panel is None:
+            self.memory_panel = MemoryPanel(self.memory, self)
+            self.memory_panel.releaseRequested.connect(self.release_memory)
+        self.memory_panel.show()
+        self.memory_panel.raise_()
+
+    def show_slice(self, axis, index):
+        """Render one slice of the stored volume without recomputing it"""
+        if self.realisation is not None and self.realisation.ndim == 3:
+            key = self.simulation_engine.last_key + (axis, index)
+            self.p_canvas_widget.set_data(
+                get_slice(self.realisation, axis, index), key
+            )
+            index = min(max(index, 0), self.realisation.shape[axis] - 1)
+            markers = []
+            for point, phase in self.simulation_engine.hard_data.points.items():
+                if point[axis] == index:
+                    rest = point[:axis] + point[axis + 1 :]
+                    markers.append((rest[0], rest[1], phase))
+            self.p_canvas_widget.set_markers(markers)
+
+    def place_observation(self, row, col, button):
+        """Observe the selected phase at a realisation cell, or remove on right-click"""
+        if self.simulation_engine is None or self.realisation is None:
+            return
+        index = (row, col)
+        if self.realisation.ndim == 3:
+            # The clicked cell lies in the displayed slice
+            axis = self.controls_widget.slice_axis_combo.currentIndex()
+            position = self.controls_widget.slice_slider.value()
+            position = min(max(position, 0), self.realisation.shape[axis] - 1)
+            index = index[:axis] + (position,) + index[axis:]
+
+        hard_data = self.simulation_engine.hard_data
+        if button == Qt.RightButton:
+            hard_data = hard_data.without_point(index)
+        else:
+            hard_data = hard_data.with_point(index, self.l_canvas_widget.current_phase)
+        self.set_hard_data(hard_data)
+
+    def set_hard_data(self, hard_data):
+        with instruments.timer("window.set_hard_data"):
+            self.simulation_engine.set_hard_data(hard_data)
+            self.run_simulation(self.l_canvas_widget.grid)
+
+    def show_deformation(self, degrees):
+        """Show the gradual-deformation frame at an angle in degrees"""
+        if self.simulation_engine is None:
+            return
+        with instruments.timer("window.show_deformation"):
+            self.simulation_engine.update_lithotypes(self.l_canvas_widget.grid)
+            self.show_realisation(self.simulation_engine.deform(np.radians(degrees)))
+
+    def animate_deformation(self, animate):
+        if not animate or self.simulation_engine is None:
+            self.deformation_timer.stop()
+            return
+        if self.simulation_engine.deformation_seeds is None:
+            # Drawn now, so the first frames do not stall
+            self.simulation_engine.prefetch_deformation()
+        self.deformation_timer.start()
+
+    def _advance_deformation(self):
+        controls = self.controls_widget
+        controls.set_deformation_angle(controls.deformation_angle() + DEFORMATION_STEP_DEGREES)
+        self.show_deformation(controls.deformation_angle())
+
+    def new_deformation_target(self, seeds=None):
+        if self.simulation_engine is None:
+            return
+        self.simulation_engine.prefetch_deformation(seeds)
+        if self.controls_widget.deformation_angle():
+            self.show_deformation(self.controls_widget.deformation_angle())
+
+    def stop_deformation(self):
+        """Stop animating and return the slider to the current realisation"""
+        self.deformation_timer.stop()
+        self.controls_widget.animate_button.setChecked(False)
+        self.controls_widget.set_deformation_angle(0)
+
+    def preview_thresholds(self, field, thresholds):
+        """Show a threshold rule without recording it in the undo history
+
+        The vector layer does record it, so later edits build on the preview.
+        """
+        self.stop_deformation()
+        rule = self.simulation_engine.threshold_rule(field, thresholds)
+        self.l_canvas_widget.set_data(self.simulation_engine.compile_rule(rule))
+        self.l_canvas_widget.record_preview()
+        self.simulation_engine.update_lithotypes(self.l_canvas_widget.grid)
+        # Fast path: phases come straight from the field, not the image
+        self.show_realisation(self.simulation_engine.simulate_rule(rule))
+
+    def apply_thresholds(self, field, thresholds):
+        self.preview_thresholds(field, thresholds)
+        self.l_canvas_widget.save_state()
+        self.update_undo_redo_buttons()
+
+    def tune_proportions(self, targets):
+        """Move the lithotype boundaries towards target phase proportions"""
+        if sum(targets) <= 0:
+            self.statusBar().showMessage("Set a target proportion above 0%", 5000)
+            return
+        with instruments.timer("window.tune_proportions"):
+            self.simulation_engine.update_lithotypes(self.l_canvas_widget.grid)
+            result = self.simulation_engine.tune_lithotypes(targets)
+            grid, proportions, iterations, converged = result
+            self.l_canvas_widget.set_data(grid)
+            self.l_canvas_widget.record_raster()
+            self.l_canvas_widget.save_state()
+            self.run_simulation(self.l_canvas_widget.grid)
+            self.update_undo_redo_buttons()
+        targets = np.asarray(targets) / sum(targets)
+        deviation = 100 * np.abs(proportions - targets).max()
+        if converged:
+            message = f"Tuned in {iterations} steps; largest deviation {deviation:.1f}%"
+        else:
+            message = (
+                f"Could not reach targets; largest deviation {deviation:.1f}% "
+                f"after {iterations} steps"
+            )
+        self.statusBar().showMessage(message, 5000)
 
     def clear_lithotype(self):
         self.l_canvas_widget.grid.fill(0)  # Set all cells to phase 0
         self.l_canvas_widget.set_data(self.l_canvas_widget.grid)  # Redraw canvas
+        self.l_canvas_widget.record_clear()
         self.l_canvas_widget.save_state()  # Save state so clear is undoable
         self.run_simulation(self.l_canvas_widget.grid)  # Trigger simulation update
         self.update_undo_redo_buttons()  # Update button states
 
-    def regenerate_fields(self):
-        p_field = self.simulation_engine.regenerate_fields()
-        self.p_canvas_widget.set_data(p_field)
+    def set_vector_mode(self, enabled):
+        self.l_canvas_widget.set_vector_mode(enabled)
+        self.update_undo_redo_buttons()
+
+    def regenerate_fields(self, seeds=None):
+        self.stop_deformation()
+        with instruments.timer("window.regenerate_fields"):
+            p_field = self.simulation_engine.regenerate_fields(seeds)
+            self.show_realisation(p_field)
 
-    def update_parameters(self):
+    def update_parameters(self, seeds=None):
+        """Apply the parameter controls to the engine, drawing fields from seeds if given"""
+        # New fields drop the deformation target
+        self.stop_deformation()
         # Get current parameter values from the controls
         len_scale_x = self.controls_widget.len_scale_x_spinbox.value()
         len_scale_y = self.controls_widget.len_scale_y_spinbox.value()
+        len_scale_z = self.controls_widget.len_scale_z_spinbox.value()
         width = self.controls_widget.width_spinbox.value()
         height = self.controls_widget.height_spinbox.value()
+        depth = self.controls_widget.depth_spinbox.value()
 
         # Check if domain size changed
         if (
             width != self.simulation_engine.width
             or height != self.simulation_engine.height
+            or depth != self.simulation_engine.depth
         ):
             # Update domain size (this will preserve lithotypes where possible)
-            self.simulation_engine.set_domain_size(width, height)
-            # Update canvas widgets to match new domain size
-            self.l_canvas_widget.image_size = QSize(width, height)
-            self.l_canvas_widget.image = QImage(
-                self.l_canvas_widget.image_size, QImage.Format_RGB32
-            )
-            self.l_canvas_widget.grid = self.simulation_engine.lithotypes.copy()
-            self.l_canvas_widget.set_data(self.l_canvas_widget.grid)
-
-            # P canvas also uses same dimensions (transpose is handled in data, not image size)
-            self.p_canvas_widget.image_size = QSize(width, height)
-            self.p_canvas_widget.image = QImage(
-                self.p_canvas_widget.image_size, QImage.Format_RGB32
-            )
+            self.simulation_engine.set_domain_size(width, height, depth, seeds)
+            # The lithotype grid is capped in size, so it can differ from the domain
+            if self.l_canvas_widget.vector_layer is not None:
+                # Redraw the shapes at the new size rather than cropping
+                lith_height, lith_width = self.simulation_engine.lithotypes.shape
+                self.l_canvas_widget.rasterize(lith_width, lith_height)
+            else:
+                self.l_canvas_widget.grid = self.simulation_engine.lithotypes.copy()
+                self.l_canvas_widget.set_data(self.l_canvas_widget.grid)
         else:
             # Only update length scales if domain size didn't change
-            self.simulation_engine.set_length_scales(len_scale_x, len_scale_y)
+            self.simulation_engine.set_length_scales(
+                len_scale_x, len_scale_y, len_scale_z, seeds
+            )
 
         # Run simulation with current lithotype
         self.run_simulation(self.l_canvas_widget.grid)
 
+    def parameters(self):
+        """Simulation parameters as currently set in the controls"""
+        controls = self.controls_widget
+        return {
+            "width": controls.width_spinbox.value(),
+            "height": controls.height_spinbox.value(),
+            "depth": controls.depth_spinbox.value(),
+            "len_scale_x": controls.len_scale_x_spinbox.value(),
+            "len_scale_y": controls.len_scale_y_spinbox.value(),
+            "len_scale_z": controls.len_scale_z_spinbox.value(),
+        }
+
+    def set_parameters(self, params, seeds=None):
+        """Set the parameter controls and apply them to the engine"""
+        self._show_parameters(params)
+        self.update_parameters(seeds)
+
+    def _show_parameters(self, params):
+        controls = self.controls_widget
+        controls.width_spinbox.setValue(params["width"])
+        controls.height_spinbox.setValue(params["height"])
+        controls.depth_spinbox.setValue(params["depth"])
+        controls.len_scale_x_spinbox.setValue(params["len_scale_x"])
+        controls.len_scale_y_spinbox.setValue(params["len_scale_y"])
+        controls.len_scale_z_spinbox.setValue(params["len_scale_z"])
+
     def handle_undo(self):
         """Handle undo request from controls"""
-        if self.l_canvas_widget.undo():
+        with instruments.timer("window.undo"):
+            undone = self.l_canvas_widget.undo()
+        if undone:
             self.run_simulation(self.l_canvas_widget.grid)
         self.update_undo_redo_buttons()
 
     def handle_redo(self):
         """Handle redo request from controls"""
-        if self.l_canvas_widget.redo():
+        with instruments.timer("window.redo"):
+            redone = self.l_canvas_widget.redo()
+        if redone:
             self.run_simulation(self.l_canvas_widget.grid)
         self.update_undo_redo_buttons()
 
@@ -185,8 +712,11 @@ class MainWindow(QMainWindow):
             self.l_canvas_widget.can_undo(), self.l_canvas_widget.can_redo()
         )
 
-    def reset_to_defaults(self):
-        """Reset all parameters to defaults and clear lithotype"""
+    def reset_to_defaults(self, seeds=None):
+        """Reset all parameters to defaults and clear lithotype
+
+        New fields, if the defaults need them, are drawn from seeds if given.
+        """
         # Reset controls to default values
         self.controls_widget.reset_to_default_values()
 
@@ -194,7 +724,7 @@ class MainWindow(QMainWindow):
         self.clear_lithotype()
 
         # Update parameters to apply defaults
-        self.update_parameters()
+        self.update_parameters(seeds)
 
         # Update button states
         self.update_undo_redo_buttons()
@@ -207,129 +737,307 @@ class MainWindow(QMainWindow):
 
         if filename:
             try:
-                # Collect current state
-                state = {
-                    "lithotype_grid": self.l_canvas_widget.grid.tolist(),
-                    "parameters": {
-                        "width": self.simulation_engine.width,
-                        "height": self.simulation_engine.height,
-                        "len_scale_x": self.simulation_engine.len_scale_x,
-                        "len_scale_y": self.simulation_engine.len_scale_y,
-                        "brush_size": self.l_canvas_widget.brush_size,
-                        "brush_shape": self.l_canvas_widget.brush_shape,
-                        "current_tool": self.l_canvas_widget.current_tool,
-                        "current_phase": self.l_canvas_widget.current_phase,
-                    },
-                }
-
-                # Save to file
-                with open(filename, "w") as f:
-                    json.dump(state, f, indent=2)
-
+                self.write_state(filename)
                 QMessageBox.information(self, "Success", "State saved successfully!")
 
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Failed to save state: {str(e)}")
 
+    def write_state(self, filename):
+        """Write lithotype and parameters to a JSON file, raising on failure"""
+        # Collect current state
+        state = {
+            "parameters": {
+                "width": self.simulation_engine.width,
+                "height": self.simulation_engine.height,
+                "depth": self.simulation_engine.depth,
+                "len_scale_x": self.simulation_engine.len_scale_x,
+                "len_scale_y": self.simulation_engine.len_scale_y,
+                "len_scale_z": self.simulation_engine.len_scale_z,
+                "brush_size": self.l_canvas_widget.brush_size,
+                "brush_shape": self.l_canvas_widget.brush_shape,
+                "current_tool": self.l_canvas_widget.current_tool,
+                "current_phase": self.l_canvas_widget.current_phase,
+            },
+        }
+        if self.l_canvas_widget.vector_layer is not None:
+            # Shapes are far smaller than the grid and resolution-free
+            state["vector_layer"] = self.l_canvas_widget.vector_layer.to_dict()
+        else:
+            state["lithotype_grid"] = self.l_canvas_widget.grid.tolist()
+        if len(self.simulation_engine.hard_data):
+            state["hard_data"] = self.simulation_engine.hard_data.to_list()
+        state["field_specs"] = [spec.to_dict() for spec in self.simulation_engine.field_specs]
+
+        # Save to file
+        with open(filename, "w") as f:
+            json.dump(state, f, indent=2)
+
     def load_state(self):
-        """Load state from JSON file"""
+        """Load state from JSON file on a background thread"""
+        if self.project_loader is not None and self.project_loader.isRunning():
+            return
         filename, _ = QFileDialog.getOpenFileName(
             self, "Load State", "", "JSON Files (*.json);;All Files (*)"
         )
 
         if filename:
-            try:
-                # Load from file
-                with open(filename, "r") as f:
-                    state = json.load(f)
-
-                # Extract data
-                lithotype_grid = np.array(state["lithotype_grid"], dtype=int)
-                params = state["parameters"]
-
-                # Update controls with loaded parameters
-                self.controls_widget.width_spinbox.setValue(params["width"])
-                self.controls_widget.height_spinbox.setValue(params["height"])
-                self.controls_widget.len_scale_x_spinbox.setValue(params["len_scale_x"])
-                self.controls_widget.len_scale_y_spinbox.setValue(params["len_scale_y"])
-                self.controls_widget.size_slider.setValue(params["brush_size"])
-                self.controls_widget.shape_combo.setCurrentText(
-                    params["brush_shape"].title()
-                )
+            self._set_editing_enabled(False)
+            self.project_loader = ProjectLoader(filename, self.engine_process, self)
+            self.project_loader.progress.connect(self.statusBar().showMessage)
+            self.project_loader.loaded.connect(self._on_project_loaded)
+            self.project_loader.failed.connect(self._on_project_failed)
+            self.project_loader.start()
 
-                # Set tool and phase
-                if params["current_tool"] == "brush":
-                    self.controls_widget.brush_tool_button.setChecked(True)
-                else:
-                    self.controls_widget.fill_tool_button.setChecked(True)
+    def _on_project_loaded(self, project, engine, realisation):
+        self.apply_project(project, engine, realisation)
+        self._set_editing_enabled(True)
+        self.statusBar().clearMessage()
+        QMessageBox.information(self, "Success", "State loaded successfully!")
 
-                # Set phase button
-                if self.controls_widget.phase_buttons and 0 <= params[
-                    "current_phase"
-                ] < len(self.controls_widget.phase_buttons):
-                    for i, btn in enumerate(self.controls_widget.phase_buttons):
-                        btn.setChecked(i == params["current_phase"])
+    def _on_project_failed(self, message):
+        self._set_editing_enabled(True)
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "Error", f"Failed to load state: {message}")
 
-                # Update parameters (this will resize domain if needed)
-                self.update_parameters()
+    def _set_editing_enabled(self, enabled):
+        # Edits made while a project loads would be lost when it is applied
+        self.controls_widget.setEnabled(enabled)
+        self.l_canvas_widget.setEnabled(enabled)
+        self.p_canvas_widget.setEnabled(enabled)
 
-                # Load lithotype grid
-                self.l_canvas_widget.grid = lithotype_grid
-                self.l_canvas_widget.set_data(lithotype_grid)
+    def read_state(self, filename):
+        """Apply lithotype and parameters from a JSON file, raising on failure"""
+        project = read_project(filename)
+        engine, realisation = prepare_engine(
+            project["parameters"],
+            project["grid"],
+            project["hard_data"],
+            self.engine_process,
+            project["field_specs"],
+        )
+        self.apply_project(project, engine, realisation)
 
-                # Clear history and add current state
-                self.l_canvas_widget.history = [lithotype_grid.copy()]
-                self.l_canvas_widget.history_index = 0
+    def apply_project(self, project, engine, realisation):
+        """Apply a loaded project and its prepared engine in one step
 
-                # Run simulation with loaded lithotype
-                self.run_simulation(lithotype_grid)
+        Control signals are blocked while values are set, so nothing
+        regenerates fields; the canvas is configured directly instead.
+        """
+        params = project["parameters"]
+        controls = self.controls_widget
+        canvas = self.l_canvas_widget
 
-                # Update button states
-                self.update_undo_redo_buttons()
+        controls.blockSignals(True)
+        try:
+            self._show_parameters(params)
+            controls.size_slider.setValue(params["brush_size"])
+            controls.shape_combo.setCurrentText(params["brush_shape"].title())
+            if params["current_tool"] == "brush":
+                controls.brush_tool_button.setChecked(True)
+            else:
+                controls.fill_tool_button.setChecked(True)
+            if 0 <= params["current_phase"] < len(controls.phase_buttons):
+                for i, btn in enumerate(controls.phase_buttons):
+                    btn.setChecked(i == params["current_phase"])
+            if project["vector_layer"] is not None:
+                controls.vector_checkbox.setChecked(True)
+        finally:
+            controls.blockSignals(False)
 
-                QMessageBox.information(self, "Success", "State loaded successfully!")
+        canvas.set_brush_size(params["brush_size"])
+        canvas.set_brush_shape(controls.shape_combo.currentText())
+        canvas.set_tool(params["current_tool"])
+        canvas.set_phase(params["current_phase"])
 
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to load state: {str(e)}")
+        self._install_engine(engine)
+        if project["vector_layer"] is not None:
+            canvas.vector_layer = project["vector_layer"]
+        canvas.set_data(project["grid"])
+        if project["vector_layer"] is None:
+            canvas.record_raster()
+        canvas.reset_history()
+        engine.update_lithotypes(canvas.grid)
+        self.show_realisation(realisation)
+        self.update_undo_redo_buttons()
+        if self.autosave is not None:
+            self.autosave.sync()
+
+    def report_engine_error(self, error):
+        """Show an engine service failure; a lost service is restarted
+
+        The new service draws the same fields from the mirrored seeds and
+        settings, so the session continues with the same realisation.
+        """
+        if not isinstance(error, EngineServiceLost):
+            QMessageBox.critical(self, "Error", f"Simulation failed: {error}")
+            return
+        QMessageBox.warning(
+            self,
+            "Engine Stopped",
+            f"{error}. A new engine is started with the current fields.",
+        )
+        old = self.simulation_engine
+        try:
+            engine = create_engine(
+                self.engine_process,
+                field_specs=old.field_specs,
+                generate=False,
+                **self.engine_parameters(),
+            )
+            engine.set_hard_data(old.hard_data)
+            engine.update_lithotypes(self.l_canvas_widget.grid)
+            realisation = engine.regenerate_fields(old.seeds)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to restart the engine: {e}")
+            return
+        self._install_engine(engine)
+        self.show_realisation(realisation)
+
+    def _install_engine(self, engine):
+        """Replace the engine, closing the old one
+
+        Renders cached under the old engine's keys are dropped, so a new
+        engine's realisation is never shown from them.
+        """
+        self.stop_deformation()
+        if self.simulation_engine is not None:
+            self.simulation_engine.close()
+        self.simulation_engine = engine
+        self.p_canvas_widget.render_cache.clear()
 
     def export_images(self):
-        """Export lithotype and realization images"""
-        directory = QFileDialog.getExistingDirectory(self, "Select Export Directory")
+        """Export the lithotype, realisation and optional ensemble in the background"""
+        if self.export_worker is not None and self.export_worker.isRunning():
+            return
+        dialog = ExportDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
 
-        if directory:
-            try:
-                # Get current timestamp for unique filenames
-                from datetime import datetime
+        # Get current timestamp for unique filenames
+        from datetime import datetime
 
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        directory = dialog.directory()
+        items = [(f"{directory}/lithotype_{timestamp}", self.l_canvas_widget.grid.copy())]
+        if self.realisation is not None:
+            items.append((f"{directory}/realization_{timestamp}", self.realisation))
 
-                # Export lithotype image
-                lithotype_filename = f"{directory}/lithotype_{timestamp}.png"
-                lithotype_success = self.l_canvas_widget.image.save(lithotype_filename)
+        ensemble = None
+        if dialog.ensemble_size():
+            ensemble = self._ensemble_settings(dialog.ensemble_size())
+            ensemble["base_path"] = f"{directory}/ensemble_{timestamp}"
 
-                # Export realization image
-                realization_filename = f"{directory}/realization_{timestamp}.png"
-                realization_success = self.p_canvas_widget.image.save(
-                    realization_filename
-                )
+        deformation = None
+        if dialog.deformation_frames():
+            deformation = self._deformation_settings(dialog.deformation_frames())
+            deformation["base_path"] = f"{directory}/deformation_{timestamp}"
+            deformation["stacked"] = dialog.stack_frames()
 
-                if lithotype_success and realization_success:
-                    QMessageBox.information(
-                        self,
-                        "Success",
-                        f"Images exported successfully!\n\nLithotype: {lithotype_filename}\nRealization: {realization_filename}",
-                    )
-                else:
-                    QMessageBox.warning(
-                        self,
-                        "Warning",
-                        "Some images may not have been exported successfully.",
-                    )
+        colors = [(c.red(), c.green(), c.blue()) for c in self.l_canvas_widget.COLORS]
+        self.export_worker = ExportWorker(
+            items, dialog.formats(), colors, ensemble, deformation, self
+        )
+        self.export_progress = QProgressDialog("Exporting...", "Cancel", 0, 100, self)
+        self.export_progress.setWindowTitle("Export")
+        self.export_progress.setMinimumDuration(0)
+        self.export_progress.canceled.connect(self.export_worker.cancel)
+        self.export_worker.progress.connect(self._on_export_progress)
+        self.export_worker.exported.connect(self._on_exported)
+        self.export_worker.cancelled.connect(self._on_export_cancelled)
+        self.export_worker.failed.connect(self._on_export_failed)
+        self.export_worker.start()
 
-            except Exception as e:
-                QMessageBox.critical(
-                    self, "Error", f"Failed to export images: {str(e)}"
-                )
+    def engine_parameters(self):
+        """The engine's own settings, as the controls may hold unapplied edits"""
+        engine = self.simulation_engine
+        return {name: getattr(engine, name) for name in ENGINE_PARAMETERS}
+
+    def _ensemble_settings(self, size):
+        """Engine settings and fresh seeds for simulating an ensemble elsewhere"""
+        return {
+            "parameters": self.engine_parameters(),
+            "lithotypes": self.simulation_engine.lithotypes.copy(),
+            "seeds": [
+                (np.random.randint(0, 1E6), np.random.randint(0, 1E6))
+                for _ in range(size)
+            ],
+            "hard_data": self.simulation_engine.hard_data,
+            "field_specs": list(self.simulation_engine.field_specs),
+            "process": self.engine_process,
+        }
+
+    def _deformation_settings(self, frames):
+        """Engine settings and angles for rendering deformation frames elsewhere"""
+        engine = self.simulation_engine
+        target_seeds = engine.deformation_seeds
+        if target_seeds is None:
+            # The worker draws the target itself, off the GUI thread
+            target_seeds = (np.random.randint(0, 1E6), np.random.randint(0, 1E6))
+        return {
+            "parameters": self.engine_parameters(),
+            "lithotypes": self.l_canvas_widget.grid.copy(),
+            "seeds": engine.seeds,
+            "target_seeds": target_seeds,
+            "field_specs": list(engine.field_specs),
+            # A full cycle, so the frames loop back to the current realisation
+            "angles": [float(a) for a in np.linspace(0, 2 * np.pi, frames, endpoint=False)],
+            "process": self.engine_process,
+        }
+
+    def show_analysis(self):
+        """Open the analysis panel and analyse the current realisation"""
+        if self.analysis_panel is None:
+            self.analysis_panel = AnalysisPanel(self.p_canvas_widget.COLORS, self)
+            self.analysis_panel.analyseRequested.connect(self.analyse_realisation)
+            self.analysis_panel.cancelRequested.connect(
+                lambda: self.analysis_worker and self.analysis_worker.cancel()
+            )
+        self.analysis_panel.show()
+        self.analysis_panel.raise_()
+        self.analyse_realisation(0)
+
+    def analyse_realisation(self, ensemble_size):
+        if self.realisation is None:
+            return
+        if self.analysis_worker is not None and self.analysis_worker.isRunning():
+            return
+        ensemble = self._ensemble_settings(ensemble_size) if ensemble_size else None
+        panel = self.analysis_panel
+        self.analysis_worker = AnalysisWorker(self.realisation, NUM_PHASES, ensemble, self)
+        self.analysis_worker.progress.connect(panel.set_progress)
+        self.analysis_worker.analysed.connect(panel.show_summary)
+        self.analysis_worker.cancelled.connect(lambda: panel.set_running(False))
+        self.analysis_worker.failed.connect(self._on_analysis_failed)
+        panel.set_running(True)
+        self.analysis_worker.start()
+
+    def _on_analysis_failed(self, message):
+        self.analysis_panel.set_running(False)
+        QMessageBox.critical(self, "Error", f"Failed to analyse: {message}")
+
+    def _on_export_progress(self, percent, name):
+        if self.export_progress.wasCanceled():
+            return
+        self.export_progress.setLabelText(f"Writing {name}...")
+        self.export_progress.setValue(percent)
+
+    def _on_exported(self, paths):
+        self.export_progress.reset()
+        directory = os.path.dirname(paths[0]) if paths else ""
+        QMessageBox.information(
+            self,
+            "Success",
+            f"Exported {len(paths)} files successfully!\n\nDirectory: {directory}",
+        )
+
+    def _on_export_cancelled(self):
+        self.export_progress.reset()
+        self.statusBar().showMessage("Export cancelled", 3000)
+
+    def _on_export_failed(self, message):
+        self.export_progress.reset()
+        QMessageBox.critical(self, "Error", f"Failed to export: {message}")
 
 
 if __name__ == "__main__":
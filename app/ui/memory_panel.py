@@ -0,0 +1,116 @@
+from PyQt5.QtWidgets import (
+    QDialog,
+    QVBoxLayout,
+    QHBoxLayout,
+    QLabel,
+    QPushButton,
+    QSpinBox,
+    QCheckBox,
+    QTableWidget,
+    QTableWidgetItem,
+)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+
+from app.logic.memory import MB
+
+# Constants
+MEMORY_REFRESH_MS = 1000
+BUDGET_MB_MIN = 1
+BUDGET_MB_MAX = 1 << 20
+TABLE_COLUMNS = ["Component", "Resident", "Memory-mapped"]
+
+
+def format_mb(size):
+    return f"{size / MB:,.1f} MB"
+
+
+class MemoryPanel(QDialog):
+    """Bytes held per component of a window, its budget and release controls"""
+
+    releaseRequested = pyqtSignal()
+
+    def __init__(self, ledger, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Memory")
+        self.ledger = ledger
+        layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(0, len(TABLE_COLUMNS))
+        self.table.setHorizontalHeaderLabels(TABLE_COLUMNS)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        # Room for every component without scrolling
+        rows = self.table.verticalHeader().defaultSectionSize() * len(ledger.components)
+        header = self.table.horizontalHeader().sizeHint().height()
+        self.table.setMinimumSize(420, header + rows + 2 * self.table.frameWidth() + 4)
+        layout.addWidget(self.table)
+
+        self.total_label = QLabel("")
+        layout.addWidget(self.total_label)
+
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("Budget:"))
+        self.budget_spinbox = QSpinBox()
+        self.budget_spinbox.setToolTip("Resident memory this window should stay within.")
+        self.budget_spinbox.setRange(BUDGET_MB_MIN, BUDGET_MB_MAX)
+        self.budget_spinbox.setSuffix(" MB")
+        self.budget_spinbox.setValue(ledger.budget_mb)
+        self.budget_spinbox.valueChanged.connect(self._on_budget_changed)
+        budget_layout.addWidget(self.budget_spinbox)
+        layout.addLayout(budget_layout)
+
+        self.auto_release_checkbox = QCheckBox("Release automatically")
+        self.auto_release_checkbox.setToolTip(
+            "When over budget, evict cached realisations and renders, then "
+            "trim the undo history."
+        )
+        self.auto_release_checkbox.setChecked(ledger.auto_release)
+        self.auto_release_checkbox.toggled.connect(self._on_auto_release_toggled)
+        layout.addWidget(self.auto_release_checkbox)
+
+        self.release_button = QPushButton("Release Now")
+        self.release_button.setToolTip("Free caches and history until within budget.")
+        self.release_button.clicked.connect(self.releaseRequested)
+        layout.addWidget(self.release_button)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(MEMORY_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        usage = self.ledger.usage()
+        self.table.setRowCount(len(usage))
+        for row, (name, resident, mapped) in enumerate(usage):
+            cells = [name, format_mb(resident), format_mb(mapped) if mapped else "-"]
+            for column, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+        self.table.resizeColumnsToContents()
+
+        total = sum(resident for _, resident, _ in usage)
+        over = total > self.ledger.budget_mb * MB
+        self.total_label.setText(
+            f"Total resident: {format_mb(total)} of {self.ledger.budget_mb:,} MB"
+            + (" - over budget" if over else "")
+        )
+        self.total_label.setStyleSheet("color: red;" if over else "")
+
+    def _on_budget_changed(self, value):
+        self.ledger.budget_mb = value
+        self.refresh()
+
+    def _on_auto_release_toggled(self, checked):
+        self.ledger.auto_release = checked
@@ -0,0 +1,264 @@
+import json
+import time
+import numpy as np
+from PyQt5.QtCore import QObject
+from PyQt5.QtWidgets import QApplication
+
+from app.logic.conditioning import HardData
+from app.logic.vector import VectorOp
+
+# Constants
+# Version 1 reseeded NumPy's global RNG instead of storing seeds; version 2 did
+# not record hard data, gradual deformation or resets
+TRACE_VERSION = 3
+
+
+class InteractionRecorder(QObject):
+    """Log canvas and controls signals of a MainWindow to a JSON Lines trace
+
+    The first line is a header with the field seeds, parameters, hard data and
+    starting lithotype; every following line is {"t": seconds, "event": name,
+    ...}. Stroke and fill positions are stored in lithotype image coordinates,
+    and events that draw new fields or deformation targets store the seeds
+    drawn, so a trace replays identically whatever the widget size.
+    """
+
+    def __init__(self, window, filename):
+        super().__init__(window)
+        self.window = window
+        self.filename = filename
+        self.file = None
+        self.start = 0.0
+        self.connections = []
+
+    def start_recording(self):
+        window = self.window
+        canvas = window.l_canvas_widget
+        controls = window.controls_widget
+
+        self.file = open(self.filename, "w")
+        header = {
+            "version": TRACE_VERSION,
+            # The current fields, so replay sees the same realisations
+            "seeds": list(window.simulation_engine.seeds),
+            "parameters": window.engine_parameters(),
+            "hard_data": window.simulation_engine.hard_data.to_list(),
+            "brush_shape": canvas.brush_shape,
+            "brush_size": canvas.brush_size,
+            "tool": canvas.current_tool,
+            "phase": canvas.current_phase,
+            "vector_mode": canvas.vector_layer is not None,
+            "lithotype": VectorOp(
+                "raster", 0, canvas._grid_size(), data=canvas.grid.astype(np.uint8)
+            ).to_dict(),
+        }
+        self.file.write(json.dumps(header) + "\n")
+        self.start = time.perf_counter()
+
+        self._connect(canvas.actionFinished, self._on_action)
+        self._connect(canvas.historyStepped, lambda step: self.log(step))
+        self._connect(controls.shapeChanged, lambda v: self.log("brush_shape", value=v))
+        self._connect(controls.sizeChanged, lambda v: self.log("brush_size", value=v))
+        self._connect(controls.phaseChanged, lambda v: self.log("phase", value=v))
+        self._connect(controls.toolChanged, lambda v: self.log("tool", value=v))
+        # Connected after the window's own slots, so the new seeds are logged
+        self._connect(
+            controls.regenerate, lambda: self.log("regenerate", seeds=self._seeds())
+        )
+        self._connect(controls.clearLithotype, lambda: self.log("clear"))
+        self._connect(controls.undoRequested, lambda: self.log("undo"))
+        self._connect(controls.redoRequested, lambda: self.log("redo"))
+        self._connect(
+            controls.updateParameters,
+            lambda: self.log("parameters", value=window.parameters(), seeds=self._seeds()),
+        )
+        self._connect(
+            controls.sliceChanged,
+            lambda axis, index: self.log("slice", axis=axis, index=index),
+        )
+        self._connect(
+            controls.thresholdsChanged,
+            lambda field, values: self.log("preview_thresholds", field=field, values=values),
+        )
+        self._connect(
+            controls.applyThresholds,
+            lambda field, values: self.log("apply_thresholds", field=field, values=values),
+        )
+        self._connect(
+            controls.tuneProportions,
+            lambda targets: self.log("tune_proportions", targets=targets),
+        )
+        self._connect(controls.vectorModeChanged, lambda v: self.log("vector_mode", value=v))
+        self._connect(
+            window.p_canvas_widget.cellClicked,
+            lambda row, col, button: self.log(
+                "observation", row=row, col=col, button=button
+            ),
+        )
+        self._connect(controls.clearHardData, lambda: self.log("clear_hard_data"))
+        self._connect(
+            controls.resetToDefaults, lambda: self.log("reset", seeds=self._seeds())
+        )
+        # Animation frames move the slider silently, so the timer is logged too
+        self._connect(controls.deformationAngleChanged, lambda v: self._on_deformation())
+        self._connect(window.deformation_timer.timeout, self._on_deformation)
+        self._connect(
+            controls.animateDeformation,
+            lambda v: self.log(
+                "animate_deformation", value=v, seeds=self._deformation_seeds()
+            ),
+        )
+        self._connect(
+            controls.newDeformationTarget,
+            lambda: self.log("deformation_target", seeds=self._deformation_seeds()),
+        )
+
+    def stop_recording(self):
+        for signal, slot in self.connections:
+            signal.disconnect(slot)
+        self.connections = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def is_recording(self):
+        return self.file is not None
+
+    def _connect(self, signal, slot):
+        signal.connect(slot)
+        self.connections.append((signal, slot))
+
+    def _seeds(self):
+        return list(self.window.simulation_engine.seeds)
+
+    def _deformation_seeds(self):
+        seeds = self.window.simulation_engine.deformation_seeds
+        return None if seeds is None else list(seeds)
+
+    def _on_deformation(self):
+        self.log(
+            "deformation",
+            angle=self.window.controls_widget.deformation_angle(),
+            seeds=self._deformation_seeds(),
+        )
+
+    def _on_action(self, op):
+        self.log(op.kind, op=op.to_dict())
+
+    def log(self, event, **fields):
+        record = {"t": round(time.perf_counter() - self.start, 6), "event": event}
+        record.update(fields)
+        self.file.write(json.dumps(record) + "\n")
+
+
+def read_trace(filename):
+    """Return (header, events) from a recorded trace"""
+    with open(filename) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("version") != TRACE_VERSION:
+        raise ValueError(f"{filename} is not a version {TRACE_VERSION} trace")
+    return lines[0], lines[1:]
+
+
+def _use_deformation_seeds(window, seeds):
+    engine = window.simulation_engine
+    if seeds is not None and engine.deformation_seeds != tuple(seeds):
+        engine.prefetch_deformation(seeds)
+
+
+def _dispatch(window, record):
+    canvas = window.l_canvas_widget
+    event = record["event"]
+    if event in ("stroke", "fill"):
+        op = VectorOp.from_dict(record["op"])
+        canvas.set_phase(op.phase)
+        if event == "stroke":
+            canvas.set_brush_shape(op.shape)
+            canvas.set_brush_size(op.brush)
+            canvas.perform_stroke(op.points)
+        else:
+            canvas.perform_fill(*op.points[0])
+        window.update_undo_redo_buttons()
+    elif event == "brush_shape":
+        canvas.set_brush_shape(record["value"])
+    elif event == "brush_size":
+        canvas.set_brush_size(record["value"])
+    elif event == "phase":
+        canvas.set_phase(record["value"])
+    elif event == "tool":
+        canvas.set_tool(record["value"])
+    elif event == "regenerate":
+        window.regenerate_fields(record["seeds"])
+    elif event == "clear":
+        window.clear_lithotype()
+    elif event == "undo":
+        window.handle_undo()
+    elif event == "redo":
+        window.handle_redo()
+    elif event == "parameters":
+        window.set_parameters(record["value"], record["seeds"])
+    elif event == "slice":
+        window.show_slice(record["axis"], record["index"])
+    elif event == "preview_thresholds":
+        window.preview_thresholds(record["field"], record["values"])
+    elif event == "apply_thresholds":
+        window.apply_thresholds(record["field"], record["values"])
+    elif event == "tune_proportions":
+        window.tune_proportions(record["targets"])
+    elif event == "vector_mode":
+        window.set_vector_mode(record["value"])
+    elif event == "observation":
+        window.place_observation(record["row"], record["col"], record["button"])
+    elif event == "clear_hard_data":
+        window.set_hard_data(HardData())
+    elif event == "reset":
+        window.reset_to_defaults(record["seeds"])
+    elif event == "deformation":
+        _use_deformation_seeds(window, record["seeds"])
+        window.controls_widget.set_deformation_angle(record["angle"])
+        window.show_deformation(record["angle"])
+    elif event == "animate_deformation":
+        # Frames were logged as deformation events, so no timer is started
+        _use_deformation_seeds(window, record["seeds"])
+    elif event == "deformation_target":
+        window.new_deformation_target(record["seeds"])
+    else:
+        raise ValueError(f"Unknown trace event: {event}")
+
+
+def replay_trace(window, header, events, render=True):
+    """Replay a trace into a ready MainWindow, returning per-event latencies
+
+    Each latency runs from dispatch until pending Qt events are processed
+    and, with render set, both canvases have been painted once.
+    """
+    app = QApplication.instance()
+    canvas = window.l_canvas_widget
+
+    window.set_parameters(header["parameters"], header["seeds"])
+    canvas.set_brush_shape(header["brush_shape"])
+    canvas.set_brush_size(header["brush_size"])
+    canvas.set_tool(header["tool"])
+    canvas.set_phase(header["phase"])
+    canvas.set_data(VectorOp.from_dict(header["lithotype"]).data.astype(int))
+    window.set_vector_mode(header["vector_mode"])
+    canvas.reset_history()
+    window.simulation_engine.set_hard_data(HardData.from_list(header["hard_data"]))
+    window.run_simulation(canvas.grid)
+
+    latencies = []
+    for record in events:
+        start = time.perf_counter()
+        _dispatch(window, record)
+        app.processEvents()
+        if render:
+            canvas.grab()
+            window.p_canvas_widget.grab()
+        latencies.append(
+            {
+                "t": record["t"],
+                "event": record["event"],
+                "latency": time.perf_counter() - start,
+            }
+        )
+    return latencies
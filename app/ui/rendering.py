@@ -0,0 +1,17 @@
+from PyQt5.QtGui import QImage
+import numpy as np
+
+
+def color_table(colors):
+    """Pack a list of QColors into a uint32 lookup table of 0xAARRGGBB values"""
+    return np.array([color.rgb() for color in colors], dtype=np.uint32)
+
+
+def phase_image(grid, colors):
+    """Render a 2D phase grid to an RGB32 QImage with a single table lookup"""
+    table = color_table(colors)
+    pixels = np.ascontiguousarray(table[np.asarray(grid) % len(table)])
+    height, width = pixels.shape
+    image = QImage(pixels.data, width, height, width * 4, QImage.Format_RGB32)
+    # QImage does not own the numpy buffer, so detach before it goes away
+    return image.copy()
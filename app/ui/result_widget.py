@@ -1,10 +1,24 @@
 from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QImage, QPainter, QColor
-from PyQt5.QtCore import Qt, QSize, QRect, QPoint
+from PyQt5.QtGui import QPainter, QColor, QPen
+from PyQt5.QtCore import Qt, QSize, QRect, QRectF, QPoint, QPointF, pyqtSignal
 import numpy as np
+import math
+
+from app.logic.cache import LRUCache
+from app.logic.instrumentation import instruments
+from app.ui.rendering import phase_image
+
+# Constants
+OVERVIEW_SIZE = 512  # Pyramid levels are halved until they fit in this size
+ZOOM_MIN = 1.0
+ZOOM_MAX = 64.0
+ZOOM_STEP = 1.25
+MARKER_RADIUS = 4  # Screen pixels
 
 
 class ResultWidget(QWidget):
+    cellClicked = pyqtSignal(int, int, int)  # row, column, Qt mouse button
+
     COLORS = [
         QColor(0, 0, 0),  # Phase 0 - Black
         QColor(255, 255, 255),  # Phase 1 - White
@@ -17,28 +31,207 @@ class ResultWidget(QWidget):
     def __init__(self, width=250, height=250):
         super().__init__()
         self.image_size = QSize(width, height)
-        self.image = QImage(self.image_size, QImage.Format_RGB32)
-        self.image.fill(Qt.white)
+        self.grid = np.zeros((height, width), dtype=np.uint8)
+        self.levels = [self.grid]  # Overview pyramid, full resolution first
+        self._image = None  # Full-resolution image, built on demand
+        self._viewport_cache = None  # (key, QImage) of the last rendered viewport
+        # Rendered state (pyramid and full image) per realisation cache key
+        self.render_cache = LRUCache()
+        self._render_entry = {}
         self.target_rect = QRect()
         self.setMinimumSize(200, 200)
 
+        # Viewport: zoom relative to fit-to-widget, centre in image coordinates
+        self.zoom = 1.0
+        self.center = (width / 2, height / 2)
+        self._pan_origin = None
+
+        # Clicks place observations instead of panning while placing
+        self.place_mode = False
+        self.markers = []  # (row, column, phase) drawn over the realisation
+
+    @property
+    def image(self):
+        """Full-resolution image of the realisation (e.g. for export)"""
+        if self._image is None:
+            self._image = phase_image(self.grid, self.COLORS)
+            self._render_entry["image"] = self._image
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self._render_entry["image"] = image
+
+    def reset_view(self):
+        self.zoom = 1.0
+        self.center = (self.image_size.width() / 2, self.image_size.height() / 2)
+        self.update()
+
+    def _build_pyramid(self):
+        """Downsample by striding, which keeps phase values categorical"""
+        self.levels = [self.grid]
+        level = self.grid
+        while max(level.shape) > OVERVIEW_SIZE:
+            level = np.ascontiguousarray(level[::2, ::2])
+            self.levels.append(level)
+
+    def _visible_rect(self):
+        """Return the visible image region as a QRectF in image coordinates"""
+        widget_rect = self.rect()
+        width, height = self.image_size.width(), self.image_size.height()
+        fit = min(widget_rect.width() / width, widget_rect.height() / height)
+        scale = fit * self.zoom
+        view_w = min(width, widget_rect.width() / scale)
+        view_h = min(height, widget_rect.height() / scale)
+
+        # Keep the viewport inside the image
+        cx = min(max(self.center[0], view_w / 2), width - view_w / 2)
+        cy = min(max(self.center[1], view_h / 2), height - view_h / 2)
+        self.center = (cx, cy)
+        return QRectF(cx - view_w / 2, cy - view_h / 2, view_w, view_h), scale
+
+    def _render_viewport(self, source, scale):
+        """Render only the visible region from the coarsest adequate pyramid level"""
+        # Image pixels per screen pixel decides how much detail is needed
+        level_index = 0
+        if scale < 1.0:
+            level_index = min(int(math.log2(1.0 / scale)), len(self.levels) - 1)
+        level = self.levels[level_index]
+        factor = 2**level_index
+
+        top = int(source.top()) // factor
+        left = int(source.left()) // factor
+        bottom = min(level.shape[0], math.ceil(source.bottom() / factor))
+        right = min(level.shape[1], math.ceil(source.right() / factor))
+
+        key = (level_index, top, left, bottom, right)
+        if self._viewport_cache is None or self._viewport_cache[0] != key:
+            with instruments.timer("result.render_viewport"):
+                image = phase_image(level[top:bottom, left:right], self.COLORS)
+            self._viewport_cache = (key, image)
+
+        image = self._viewport_cache[1]
+        # Sub-rectangle of the rendered block matching the exact source region
+        offset = QRectF(
+            source.left() / factor - left,
+            source.top() / factor - top,
+            source.width() / factor,
+            source.height() / factor,
+        )
+        return image, offset
+
     def paintEvent(self, event):
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing, False)
-        widget_rect = self.rect()
-        scaled_size = self.image_size.scaled(widget_rect.size(), Qt.KeepAspectRatio)
-        self.target_rect = QRect(QPoint(0, 0), scaled_size)
-        self.target_rect.moveCenter(widget_rect.center())
-        painter.drawImage(self.target_rect, self.image, self.image.rect())
+        source, scale = self._visible_rect()
+        image, offset = self._render_viewport(source, scale)
+
+        target_size = QSize(
+            int(round(source.width() * scale)), int(round(source.height() * scale))
+        )
+        self.target_rect = QRect(QPoint(0, 0), target_size)
+        self.target_rect.moveCenter(self.rect().center())
+        painter.drawImage(QRectF(self.target_rect), image, offset)
+        if self.markers:
+            self._draw_markers(painter, source, scale)
+        instruments.mark_painted()
+
+    def _draw_markers(self, painter, source, scale):
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        for row, col, phase in self.markers:
+            # Cell centre in widget coordinates
+            x = self.target_rect.left() + (col + 0.5 - source.left()) * scale
+            y = self.target_rect.top() + (row + 0.5 - source.top()) * scale
+            if not self.target_rect.contains(int(x), int(y)):
+                continue
+            painter.setBrush(self.COLORS[phase % len(self.COLORS)])
+            painter.setPen(QPen(QColor(128, 128, 128), 2))
+            painter.drawEllipse(QPointF(x, y), MARKER_RADIUS, MARKER_RADIUS)
+
+    def set_place_mode(self, enabled):
+        self.place_mode = enabled
+        self.setCursor(Qt.CrossCursor if enabled else Qt.ArrowCursor)
+
+    def set_markers(self, markers):
+        self.markers = list(markers)
+        self.update()
+
+    def map_widget_to_cell(self, pos):
+        """Grid (row, column) under a widget position, or None outside the image"""
+        if not self.target_rect.contains(pos):
+            return None
+        source, scale = self._visible_rect()
+        col = int(source.left() + (pos.x() - self.target_rect.left()) / scale)
+        row = int(source.top() + (pos.y() - self.target_rect.top()) / scale)
+        height, width = self.grid.shape
+        return min(max(row, 0), height - 1), min(max(col, 0), width - 1)
+
+    def wheelEvent(self, event):
+        """Zoom around the cursor"""
+        steps = event.angleDelta().y() / 120
+        if not steps:
+            return
+        source, scale = self._visible_rect()
+        pos = event.pos()
+        # Image coordinates under the cursor before zooming
+        ix = source.left() + (pos.x() - self.target_rect.left()) / scale
+        iy = source.top() + (pos.y() - self.target_rect.top()) / scale
+
+        new_zoom = min(ZOOM_MAX, max(ZOOM_MIN, self.zoom * ZOOM_STEP**steps))
+        ratio = self.zoom / new_zoom
+        self.zoom = new_zoom
+        cx, cy = self.center
+        self.center = (ix + (cx - ix) * ratio, iy + (cy - iy) * ratio)
+        self.update()
+        event.accept()
+
+    def mousePressEvent(self, event):
+        if self.place_mode:
+            cell = self.map_widget_to_cell(event.pos())
+            if cell is not None:
+                self.cellClicked.emit(cell[0], cell[1], int(event.button()))
+            return
+        if event.button() == Qt.LeftButton:
+            self._pan_origin = (event.pos(), self.center)
+
+    def mouseMoveEvent(self, event):
+        if self._pan_origin is not None:
+            origin, (cx, cy) = self._pan_origin
+            _, scale = self._visible_rect()
+            delta = event.pos() - origin
+            self.center = (cx - delta.x() / scale, cy - delta.y() / scale)
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._pan_origin = None
+
+    def mouseDoubleClickEvent(self, event):
+        """Double-click restores the fit-to-widget view"""
+        self.reset_view()
 
-    def set_data(self, grid: np.ndarray):
+    def set_data(self, grid: np.ndarray, key=None):
+        """Show a realisation; a cache key lets a repeated realisation skip rendering"""
         height, width = grid.shape
-        if self.image.size() != QSize(width, height):
-            self.image = QImage(width, height, QImage.Format_RGB32)
+        if self.image_size != QSize(width, height):
             self.image_size = QSize(width, height)
+            self.zoom = 1.0
+            self.center = (width / 2, height / 2)
 
-        for y in range(height):
-            for x in range(width):
-                phase = grid[y, x]
-                self.image.setPixelColor(x, y, self.COLORS[phase % len(self.COLORS)])
+        self._viewport_cache = None
+        entry = self.render_cache.get(key) if key is not None else None
+        if entry is not None:
+            self.grid = entry["grid"]
+            self.levels = entry["levels"]
+            self._image = entry.get("image")
+        else:
+            self.grid = grid
+            self._image = None
+            with instruments.timer("result.build_pyramid"):
+                self._build_pyramid()
+            entry = {"grid": self.grid, "levels": self.levels}
+            if key is not None:
+                self.render_cache.put(key, entry)
+        self._render_entry = entry
         self.update()
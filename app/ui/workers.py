@@ -0,0 +1,312 @@
+import os
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+def ensemble_engine(ensemble):
+    """Engine for simulating the members described by ensemble settings
+
+    Its fields are left empty: every caller draws them from the members' seeds.
+    """
+    from app.logic.service import create_engine
+
+    engine = create_engine(
+        ensemble.get("process", False),
+        field_specs=ensemble.get("field_specs"),
+        generate=False,
+        **ensemble["parameters"],
+    )
+    engine.update_lithotypes(ensemble["lithotypes"])
+    if ensemble.get("hard_data") is not None:
+        engine.set_hard_data(ensemble["hard_data"])
+    return engine
+
+
+def _spec_dicts(ensemble):
+    # Manifests name the covariance models even when the defaults were used
+    from app.logic.simulation import NUM_FIELDS_MIN, FieldSpec
+
+    specs = ensemble.get("field_specs") or [FieldSpec()] * NUM_FIELDS_MIN
+    return [spec.to_dict() for spec in specs]
+
+
+class EngineLoader(QThread):
+    """Build a SimulationEngine and its first realisation off the GUI thread"""
+
+    loaded = pyqtSignal(object, object)  # engine, first realisation
+    failed = pyqtSignal(str)
+
+    def __init__(self, width, height, process=False, parent=None):
+        super().__init__(parent)
+        self.width = width
+        self.height = height
+        self.process = process  # Start an engine service process instead
+
+    def run(self):
+        try:
+            # Importing here keeps gstools off the GUI thread entirely
+            from app.logic.service import create_engine
+
+            engine = create_engine(self.process, width=self.width, height=self.height)
+            self.loaded.emit(engine, engine.simulate())
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class ExportWorker(QThread):
+    """Write arrays, and optionally an ensemble or deformation frames, to disk
+
+    items is a list of (base path, array). ensemble, when given, is a dict
+    with the engine "parameters", "lithotypes", per-member "seeds", a
+    "base_path", optionally "hard_data" to condition on, "field_specs" and
+    "process" to simulate in an engine service process; each member is
+    simulated and written in turn, so only one realisation is held in memory
+    at a time.
+    deformation, when given, is a dict with the engine "parameters",
+    "lithotypes", the "seeds" and "target_seeds" of the two field pairs, the
+    "angles" of the frames, a "base_path", "stacked" to write the frames as
+    one (frames, *grid) .npy array instead of one file set per frame, and
+    optionally "field_specs" and "process"; frames are also written one at a
+    time.
+    """
+
+    progress = pyqtSignal(int, str)  # percent done, item being written
+    exported = pyqtSignal(list)  # written paths
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, items, formats, colors, ensemble=None, deformation=None, parent=None):
+        super().__init__(parent)
+        self.items = items
+        self.formats = formats
+        self.colors = colors
+        self.ensemble = ensemble
+        self.deformation = deformation
+        self._cancel = False
+        self._percent = -1
+
+    def cancel(self):
+        self._cancel = True
+
+    def run(self):
+        from app.logic.export import ExportCancelled, export_array
+
+        members = len(self.ensemble["seeds"]) if self.ensemble else 0
+        frames = len(self.deformation["angles"]) if self.deformation else 0
+        total = len(self.items) + members + frames
+        paths = []
+        try:
+            for i, (base_path, array) in enumerate(self.items):
+                report = self._reporter(i, total, base_path)
+                paths += export_array(array, base_path, self.formats, self.colors, report)
+            if self.ensemble:
+                paths += self._export_ensemble(len(self.items), total)
+            if self.deformation:
+                paths += self._export_deformation(len(self.items) + members, total)
+        except ExportCancelled:
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.exported.emit(paths)
+
+    def _export_ensemble(self, done, total):
+        import json
+        from app.logic.export import export_array
+
+        ensemble = self.ensemble
+        engine = ensemble_engine(ensemble)
+        paths = []
+        try:
+            for i, seeds in enumerate(ensemble["seeds"]):
+                base_path = f"{ensemble['base_path']}_{i:03d}"
+                report = self._reporter(done + i, total, base_path)
+                report(0.0)
+                realisation = engine.regenerate_fields(seeds)
+                engine.cache.clear()  # Members are never revisited
+                paths += export_array(realisation, base_path, self.formats, self.colors, report)
+        finally:
+            engine.close()
+
+        manifest_path = ensemble["base_path"] + "_manifest.json"
+        with open(manifest_path, "w") as f:
+            json.dump(
+                {
+                    "parameters": ensemble["parameters"],
+                    "field_specs": _spec_dicts(ensemble),
+                    "seeds": [list(seeds) for seeds in ensemble["seeds"]],
+                    "formats": self.formats,
+                },
+                f,
+                indent=2,
+            )
+        return paths + [manifest_path]
+
+    def _export_deformation(self, done, total):
+        import json
+        from app.logic.export import export_array, write_npy_stack
+
+        deformation = self.deformation
+        angles = deformation["angles"]
+        base_path = deformation["base_path"]
+        engine = ensemble_engine(deformation)
+        try:
+            engine.regenerate_fields(deformation["seeds"])
+            engine.prefetch_deformation(deformation["target_seeds"])
+            if deformation["stacked"]:
+                # The stack spans one progress step per frame
+                frame_report = self._reporter(done, total, base_path)
+                report = lambda fraction: frame_report(fraction * len(angles))
+                frames = (engine.deform(angle) for angle in angles)
+                paths = [
+                    write_npy_stack(
+                        base_path + ".npy", frames, len(angles), engine.grid_shape, report
+                    )
+                ]
+            else:
+                paths = []
+                for i, angle in enumerate(angles):
+                    frame_path = f"{base_path}_{i:03d}"
+                    report = self._reporter(done + i, total, frame_path)
+                    paths += export_array(
+                        engine.deform(angle), frame_path, self.formats, self.colors, report
+                    )
+        finally:
+            engine.close()
+
+        manifest_path = base_path + "_manifest.json"
+        with open(manifest_path, "w") as f:
+            json.dump(
+                {
+                    "parameters": deformation["parameters"],
+                    "field_specs": _spec_dicts(deformation),
+                    "seeds": list(deformation["seeds"]),
+                    "target_seeds": list(deformation["target_seeds"]),
+                    "angles": list(angles),
+                    "formats": ["npy"] if deformation["stacked"] else self.formats,
+                },
+                f,
+                indent=2,
+            )
+        return paths + [manifest_path]
+
+    def _reporter(self, index, total, label):
+        from app.logic.export import ExportCancelled
+
+        name = os.path.basename(label)
+
+        def report(fraction):
+            if self._cancel:
+                raise ExportCancelled()
+            percent = int(100 * (index + fraction) / total)
+            if percent != self._percent:
+                self._percent = percent
+                self.progress.emit(percent, name)
+
+        return report
+
+
+class ProjectLoader(QThread):
+    """Parse, validate and simulate a project file off the GUI thread"""
+
+    progress = pyqtSignal(str)
+    loaded = pyqtSignal(object, object, object)  # project, engine, realisation
+    failed = pyqtSignal(str)
+
+    def __init__(self, filename, process=False, parent=None):
+        super().__init__(parent)
+        self.filename = filename
+        self.process = process  # Simulate in an engine service process
+
+    def run(self):
+        try:
+            from app.logic.project import prepare_engine, read_project
+
+            self.progress.emit("Reading project...")
+            project = read_project(self.filename)
+            self.progress.emit("Generating random fields...")
+            engine, realisation = prepare_engine(
+                project["parameters"],
+                project["grid"],
+                project["hard_data"],
+                self.process,
+                project["field_specs"],
+            )
+            self.loaded.emit(project, engine, realisation)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class AnalysisWorker(QThread):
+    """Analyse the current realisation and optionally an ensemble of new ones
+
+    ensemble, when given, is a dict with the engine "parameters",
+    "lithotypes", per-member "seeds" and optionally "hard_data", "field_specs"
+    and "process", as for ExportWorker. Members are simulated and analysed one at a time and only
+    running statistics are kept.
+    """
+
+    progress = pyqtSignal(int, str)  # percent done, realisation being analysed
+    analysed = pyqtSignal(object)  # ensemble summary
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, realisation, num_phases, ensemble=None, parent=None):
+        super().__init__(parent)
+        self.realisation = realisation
+        self.num_phases = num_phases
+        self.ensemble = ensemble
+        self._cancel = False
+        self._percent = -1
+
+    def cancel(self):
+        self._cancel = True
+
+    def run(self):
+        from app.logic.analysis import (
+            AnalysisCancelled,
+            EnsembleStatistics,
+            analyse_realisation,
+        )
+
+        seeds = self.ensemble["seeds"] if self.ensemble else []
+        total = 1 + len(seeds)
+        statistics = EnsembleStatistics()
+        try:
+            report = self._reporter(0, total, "current realisation")
+            statistics.add(
+                analyse_realisation(self.realisation, self.num_phases, progress=report)
+            )
+            if seeds:
+                engine = ensemble_engine(self.ensemble)
+                try:
+                    for i, member_seeds in enumerate(seeds):
+                        report = self._reporter(1 + i, total, f"realisation {i + 1}")
+                        report(0.0)
+                        realisation = engine.regenerate_fields(member_seeds)
+                        engine.cache.clear()  # Members are never revisited
+                        statistics.add(
+                            analyse_realisation(realisation, self.num_phases, progress=report)
+                        )
+                finally:
+                    engine.close()
+        except AnalysisCancelled:
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.analysed.emit(statistics.summary())
+
+    def _reporter(self, index, total, label):
+        from app.logic.analysis import AnalysisCancelled
+
+        def report(fraction):
+            if self._cancel:
+                raise AnalysisCancelled()
+            percent = int(100 * (index + fraction) / total)
+            if percent != self._percent:
+                self._percent = percent
+                self.progress.emit(percent, label)
+
+        return report
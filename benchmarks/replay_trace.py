@@ -0,0 +1,97 @@
+"""Replay a recorded interaction trace headlessly and report per-event latency.
+
+Record a trace in the application with Ctrl+Shift+R, then run from the
+repository root:
+
+    python benchmarks/replay_trace.py interactions.jsonl
+
+Fields are regenerated from the seeds stored in the trace, so every replay
+sees the same realisations. End-to-end latency per event (dispatch, Qt
+event processing and repainting both canvases) is printed per event type
+and written as JSON.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# Replays never need a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# Add project root, and this directory for the shared benchmark helpers, to
+# Python path, so the script also runs from elsewhere and with python -m
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+from run_benchmarks import wait_for_engine
+
+# Constants
+WINDOW_SIZE = (1600, 600)
+
+
+def summarise(latencies):
+    by_event = {}
+    for entry in latencies:
+        by_event.setdefault(entry["event"], []).append(entry["latency"])
+    summary = {}
+    for event, values in sorted(by_event.items()):
+        p50, p90 = np.percentile(values, [50, 90])
+        summary[event] = {
+            "count": len(values),
+            "p50": float(p50),
+            "p90": float(p90),
+            "max": max(values),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace")
+    parser.add_argument("--output", default="replay_results.json")
+    parser.add_argument(
+        "--no-render", action="store_true", help="Exclude repainting from latencies"
+    )
+    parser.add_argument(
+        "--engine-process", action="store_true", help="Run the engine in a service process"
+    )
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    from app.ui.main_window import MainWindow
+    from app.ui.recorder import read_trace, replay_trace
+
+    header, events = read_trace(args.trace)
+    window = MainWindow(autosave=False, engine_process=args.engine_process)
+    window.resize(*WINDOW_SIZE)
+    wait_for_engine(app, window)
+
+    latencies = replay_trace(window, header, events, render=not args.no_render)
+    summary = summarise(latencies)
+
+    for event, stats in summary.items():
+        print(
+            f"{event:<20}{stats['count']:>6}{stats['p50'] * 1000:>10.2f}"
+            f"{stats['p90'] * 1000:>10.2f}{stats['max'] * 1000:>10.2f}  ms"
+        )
+    total = sum(entry["latency"] for entry in latencies)
+    print(f"{len(latencies)} events replayed in {total:.2f} s")
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {"trace": args.trace, "seeds": header["seeds"], "summary": summary,
+             "events": latencies},
+            f,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
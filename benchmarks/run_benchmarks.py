@@ -0,0 +1,293 @@
+"""Headless benchmarks for the engine, canvas tools, rendering and persistence.
+
+Run from the repository root:
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/run_benchmarks.py
+
+Results are written as JSON and compared against a stored baseline; any
+benchmark slower than the baseline by more than the tolerance is reported
+and the exit status is 1. Use --save-baseline to record a new baseline;
+baselines are machine-specific and not committed (see README.md).
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Benchmarks never need a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QPoint
+
+# Constants
+SIZES_DEFAULT = [50, 100, 250, 500]
+BRUSH_SHAPES = ["circle", "triangle", "square"]
+BRUSH_SIZES = [5, 25, 75]
+REPEAT_DEFAULT = 3
+TOLERANCE_DEFAULT = 0.25  # Allowed slowdown relative to the baseline median
+NOISE_FLOOR = 0.0005  # Seconds; differences below this are never regressions
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def measure(func, repeat, setup=None):
+    """Run func repeat times, returning durations in seconds"""
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def wait_for_engine(app, window):
+    while window.simulation_engine is None:
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def serpentine_grid(size):
+    """Single-cell corridor winding through the grid: worst case for flood fill"""
+    grid = np.ones((size, size), dtype=int)
+    grid[::2, :] = 0
+    for row in range(1, size, 2):
+        # Alternate the gap between the right and left ends
+        grid[row, -1 if (row // 2) % 2 == 0 else 0] = 0
+    return grid
+
+
+def bench_engine(size, repeat, results, process=False):
+    from app.logic.service import create_engine
+
+    engine = None
+
+    def create():
+        nonlocal engine
+        if engine is not None:
+            engine.close()
+        engine = create_engine(process, width=size, height=size)
+
+    results[f"engine.init[{size}]"] = measure(create, repeat)
+    results[f"engine.regenerate_fields[{size}]"] = measure(
+        engine.regenerate_fields, repeat
+    )
+
+    rng = np.random.default_rng(0)
+
+    def new_lithotype():
+        # A fresh lithotype each run, so the realisation cache never hits
+        engine.update_lithotypes(rng.integers(0, 6, engine.lithotypes.shape))
+
+    results[f"engine.simulate[{size}]"] = measure(
+        engine.simulate, repeat, new_lithotype
+    )
+    results[f"engine.set_length_scales[{size}]"] = measure(
+        lambda: engine.set_length_scales(12.0, 8.0), repeat
+    )
+
+    def resize():
+        # Alternate between two sizes so every run really resizes
+        if engine.width == size:
+            engine.set_domain_size(size + 10, size + 10)
+        else:
+            engine.set_domain_size(size, size)
+
+    results[f"engine.set_domain_size[{size}]"] = measure(resize, repeat)
+    engine.close()
+
+
+def bench_canvas(size, repeat, results):
+    from app.ui.canvas import CanvasWidget
+    from app.ui.result_widget import ResultWidget
+
+    canvas = CanvasWidget(width=size, height=size)
+    canvas.resize(600, 600)
+    canvas.grab()  # Paint once so widget-to-image mapping is set up
+    centre = canvas.target_rect.center()
+
+    for shape in BRUSH_SHAPES:
+        for brush in BRUSH_SIZES:
+            canvas.set_brush_shape(shape)
+            canvas.set_brush_size(brush)
+            results[f"canvas.draw_at_pos[{shape},{brush},{size}]"] = measure(
+                lambda: canvas.draw_at_pos(QPoint(centre)), repeat
+            )
+
+    def uniform():
+        canvas.set_data(np.zeros((size, size), dtype=int))
+
+    results[f"canvas.flood_fill[uniform,{size}]"] = measure(
+        lambda: canvas._flood_fill(0, 0, 0, 1), repeat, uniform
+    )
+
+    def serpentine():
+        canvas.set_data(serpentine_grid(size))
+
+    results[f"canvas.flood_fill[serpentine,{size}]"] = measure(
+        lambda: canvas._flood_fill(0, 0, 0, 2), repeat, serpentine
+    )
+
+    grid = np.random.default_rng(1).integers(0, 6, (size, size))
+    results[f"canvas.set_data[{size}]"] = measure(
+        lambda: canvas.set_data(grid), repeat
+    )
+
+    result_widget = ResultWidget(width=size, height=size)
+    result_widget.resize(600, 600)
+
+    def render_result():
+        result_widget.set_data(grid)
+        result_widget.grab()  # Rendering happens on paint
+
+    results[f"result.set_data[{size}]"] = measure(render_result, repeat)
+
+    # Undo/redo across a full history
+    canvas.reset_history()
+    for i in range(canvas.max_history):
+        canvas.grid[i % size, :] = i % 6
+        canvas.save_state()
+
+    def undo_redo():
+        while canvas.undo():
+            pass
+        while canvas.redo():
+            pass
+
+    results[f"canvas.undo_redo_full_history[{size}]"] = measure(undo_redo, repeat)
+
+
+def bench_persistence(app, window, size, repeat, results):
+    controls = window.controls_widget
+    controls.width_spinbox.setValue(size)
+    controls.height_spinbox.setValue(size)
+    window.update_parameters()
+    window.l_canvas_widget.set_data(
+        np.random.default_rng(2).integers(0, 6, window.simulation_engine.lithotypes.shape)
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "state.json")
+        results[f"window.save_state[{size}]"] = measure(
+            lambda: window.write_state(filename), repeat
+        )
+        results[f"window.load_state[{size}]"] = measure(
+            lambda: window.read_state(filename), repeat
+        )
+
+
+def summarise(durations):
+    return {
+        "median": statistics.median(durations),
+        "min": min(durations),
+        "max": max(durations),
+        "repeat": len(durations),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return (name, baseline median, current median) for each regression"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        limit = previous["median"] * (1.0 + tolerance)
+        if current["median"] > limit and current["median"] - previous["median"] > NOISE_FLOOR:
+            regressions.append((name, previous["median"], current["median"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES_DEFAULT)
+    parser.add_argument("--repeat", type=int, default=REPEAT_DEFAULT)
+    parser.add_argument("--only", default="", help="Run benchmarks whose group matches")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE_DEFAULT)
+    parser.add_argument(
+        "--engine-process",
+        action="store_true",
+        help="Run the engine in a service process, so timings include the transfer",
+    )
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    raw = {}
+    groups = [group for group in ("engine", "canvas", "persistence") if args.only in group]
+
+    window = None
+    if "persistence" in groups:
+        from app.ui.main_window import MainWindow
+
+        window = MainWindow(autosave=False, engine_process=args.engine_process)
+        wait_for_engine(app, window)
+
+    for size in args.sizes:
+        print(f"Benchmarking {size}x{size}...", flush=True)
+        if "engine" in groups:
+            bench_engine(size, args.repeat, raw, args.engine_process)
+        if "canvas" in groups:
+            bench_canvas(size, args.repeat, raw)
+        if "persistence" in groups:
+            bench_persistence(app, window, size, args.repeat, raw)
+
+    results = {name: summarise(durations) for name, durations in raw.items()}
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+            "engine_process": args.engine_process,
+        },
+        "results": results,
+    }
+
+    for name, stats in results.items():
+        print(f"{name:<45} {stats['median'] * 1000:10.2f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save-baseline to record one.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    for name, previous, current in regressions:
+        print(
+            f"REGRESSION {name}: {previous * 1000:.2f} ms -> {current * 1000:.2f} ms "
+            f"({current / previous:.2f}x)"
+        )
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import json
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PyQt5.QtTest import QTest
+from PyQt5.QtWidgets import QApplication
+
+from app.logic.project import ProjectError, read_project
+from app.ui.main_window import MainWindow
+
+
+@pytest.fixture(scope="module")
+def window():
+    app = QApplication.instance() or QApplication([])
+    window = MainWindow(autosave=False)
+    window.show()
+    while window.simulation_engine is None:
+        QTest.qWait(20)
+    yield window
+    window.close()
+    app.processEvents()
+
+
+def test_loaded_project_shows_its_own_realisation(window, tmp_path):
+    """A project with the session's lithotype must not reuse the session's render"""
+    grid = window.l_canvas_widget.grid
+    grid[: grid.shape[0] // 4, :] = 2
+    grid[:, : grid.shape[1] // 5] = 3
+    window.l_canvas_widget.set_data(grid)
+    window.run_simulation(grid)
+    old_engine = window.simulation_engine
+
+    path = str(tmp_path / "project.json")
+    window.write_state(path)
+    window.read_state(path)
+
+    assert window.simulation_engine is not old_engine
+    assert (window.p_canvas_widget.grid == window.simulation_engine.simulate()).all()
+
+
+def saved_state(window, tmp_path, change):
+    """Save the window's project, edit its JSON with change and return the path"""
+    path = str(tmp_path / "project.json")
+    window.write_state(path)
+    with open(path) as f:
+        state = json.load(f)
+    change(state)
+    with open(path, "w") as f:
+        json.dump(state, f)
+    return path
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [("brush_shape", 3), ("brush_size", "5"), ("current_tool", "pen"), ("current_phase", 1.5)],
+)
+def test_mistyped_parameters_are_project_errors(window, tmp_path, name, value):
+    path = saved_state(window, tmp_path, lambda state: state["parameters"].update({name: value}))
+    with pytest.raises(ProjectError):
+        read_project(path)
+
+
+@pytest.mark.parametrize("key, value", [("vector_layer", {"ops": 5}), ("field_specs", [{}])])
+def test_malformed_sections_are_project_errors(window, tmp_path, key, value):
+    path = saved_state(window, tmp_path, lambda state: state.update({key: value}))
+    with pytest.raises(ProjectError):
+        read_project(path)
+
+
+def test_domains_over_the_cell_limit_are_rejected(window, tmp_path):
+    domain = {"width": 8000, "height": 8000, "depth": 2}
+    path = saved_state(window, tmp_path, lambda state: state["parameters"].update(domain))
+    with pytest.raises(ProjectError, match="cells"):
+        read_project(path)
+
+    controls = window.controls_widget
+    controls.width_spinbox.setValue(8000)
+    controls.height_spinbox.setValue(8000)
+    controls.depth_spinbox.setValue(2)
+    assert not controls.update_parameters_button.isEnabled()
+    controls.depth_spinbox.setValue(1)
+    assert controls.update_parameters_button.isEnabled()
+    controls.reset_to_default_values()
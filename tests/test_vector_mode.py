@@ -0,0 +1,61 @@
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+import pytest
+from PyQt5.QtWidgets import QApplication
+
+from app.ui.canvas import CanvasWidget
+
+
+@pytest.fixture
+def canvas():
+    app = QApplication.instance() or QApplication([])
+    canvas = CanvasWidget(40, 30)
+    canvas.reset_history()
+    yield canvas
+    canvas.close()
+    app.processEvents()
+
+
+def fill(canvas, phase, ix, iy):
+    canvas.set_phase(phase)
+    canvas.perform_fill(ix, iy)
+    return canvas.grid.copy()
+
+
+@pytest.mark.parametrize("modes", [[True], [True, False]])
+def test_switching_vector_mode_keeps_undo_history(canvas, modes):
+    """Toggling vector mode must not discard the raster undo history"""
+    empty = canvas.grid.copy()
+    first = fill(canvas, 1, 0, 0)
+    canvas.set_phase(2)
+    canvas.perform_stroke([(5, 5), (20, 15)])
+    second = canvas.grid.copy()
+
+    for enabled in modes:
+        canvas.set_vector_mode(enabled)
+    assert (canvas.grid == second).all()
+
+    for expected in (first, empty):
+        assert canvas.undo()
+        assert (canvas.grid == expected).all()
+    assert not canvas.can_undo()
+    assert canvas.redo()
+    assert canvas.redo()
+    assert (canvas.grid == second).all()
+
+
+def test_vector_history_is_rasterized_when_vector_mode_stops(canvas):
+    canvas.set_vector_mode(True)
+    first = fill(canvas, 1, 0, 0)
+    second = fill(canvas, 3, 0, 0)
+    canvas.set_vector_mode(False)
+
+    assert canvas.vector_layer is None
+    assert canvas.undo()
+    assert isinstance(canvas.history[canvas.history_index], np.ndarray)
+    assert (canvas.grid == first).all()
+    assert canvas.redo()
+    assert (canvas.grid == second).all()